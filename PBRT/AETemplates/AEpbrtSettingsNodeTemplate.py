@@ -46,6 +46,26 @@ class AEpbrtSettingsNodeTemplate(pymelUI.AETemplate):
         self.addControl("scene_export_lights")
         self.addControl("scene_export_materials")
         self.addControl("scene_export_defaultLighting")
+        self.addControl("scene_mesh_format")
+        self.addControl("scene_geometry_cache")
+        self.addControl("scene_geometry_cache_path")
+        self.addControl("scene_geometry_cache_size")
+        self.addControl("scene_export_workers")
+        self.addControl("scene_compression_level")
+        self.addControl("scene_geometry_shards")
+        self.addControl("scene_geometry_dedup")
+        self.addControl("scene_profile")
+        self.addControl("scene_lod")
+        self.addControl("scene_lod_pixels")
+        self.addControl("scene_cull")
+        self.addControl("scene_cull_margin")
+        self.addControl("scene_cull_keep_distance")
+        self.addControl("scene_strip_attributes")
+        self.addControl("scene_number_format")
+        self.addControl("scene_number_digits")
+        self.addControl("scene_topology_cache")
+        self.addControl("scene_incremental")
+        self.addControl("scene_report")
         
         
         self.endLayout()
@@ -150,6 +170,7 @@ class AEpbrtSettingsNodeTemplate(pymelUI.AETemplate):
         self.beginLayout("Process",collapse=1)
         self.addControl("render_launch")
         self.addControl("render_animation")
+        self.addControl("render_animation_static")
         self.endLayout()
     
         # --------------- extra stuff --------
@@ -0,0 +1,103 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Micro-benchmark of trianglemesh array output: the per-line writes MeshOpt used
+# to do against the chunked ArrayWriter. Prints MB/s for every array type.
+#
+#   python -m PBRT.Benchmarks.ArrayWriterBench [vertexCount]
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+from PBRT.ExportModules.ArrayWriter import ArrayWriter
+
+
+def makeArrays(vertexCount):
+    random.seed(0)
+    points = [(random.uniform(-100, 100), random.uniform(-100, 100), random.uniform(-100, 100)) for i in xrange(vertexCount)]
+    normals = [(random.random(), random.random(), random.random()) for i in xrange(vertexCount)]
+    uvs = [(random.random(), random.random()) for i in xrange(vertexCount)]
+    indices = [random.randrange(vertexCount) for i in xrange(vertexCount * 6)]
+    return indices, points, normals, uvs
+
+
+def writePerLine(fileHandle, name, values):
+    """
+    What MeshOpt.getGeometry did before: one write per row, one big join for indices.
+    """
+    if name == 'indices':
+        fileHandle.write( '\t\t' + ' '.join(map(str, values)) + os.linesep )
+    elif name == 'uv':
+        for uv in values:
+            fileHandle.write( '\t\t%f %f' % uv + os.linesep )
+    else:
+        for v in values:
+            fileHandle.write( '\t\t%f %f %f' % v + os.linesep )
+
+
+def writeChunked(fileHandle, name, values, writer):
+    if name == 'indices':
+        writer.write(fileHandle, values, 3, '%i')
+    elif name == 'uv':
+        writer.write(fileHandle, values, 2)
+    else:
+        writer.write(fileHandle, values, 3)
+
+
+def timeWrite(function, *args):
+    fd, fileName = tempfile.mkstemp(suffix='.pbrt')
+    os.close(fd)
+    fileHandle = open(fileName, 'wb')
+    start = time.time()
+    function(fileHandle, *args)
+    fileHandle.close()
+    duration = max(time.time() - start, 1e-9)
+    size = os.path.getsize(fileName)
+    os.remove(fileName)
+    return size, duration
+
+
+def run(vertexCount = 500000):
+    indices, points, normals, uvs = makeArrays(vertexCount)
+    arrays = (('indices', indices), ('P', points), ('N', normals), ('uv', uvs))
+
+    print '%i vertices, %i triangles' % (vertexCount, len(indices) / 3)
+    print '%-8s %12s %12s %12s %8s' % ('array', 'MB', 'before MB/s', 'after MB/s', 'speedup')
+
+    results = []
+    for name, values in arrays:
+        size, before = timeWrite(writePerLine, name, values)
+        size2, after = timeWrite(writeChunked, name, values, ArrayWriter())
+        mb = size / 1e6
+        mb2 = size2 / 1e6
+        print '%-8s %12.2f %12.2f %12.2f %7.2fx' % (name, mb2, mb/before, mb2/after, (mb2/after)/(mb/before))
+        results.append( (name, mb/before, mb2/after) )
+
+    try:
+        import numpy
+    except ImportError:
+        return results
+
+    writer = ArrayWriter()
+    size, duration = timeWrite(writeChunked, 'P', numpy.array(points, dtype=numpy.float32), writer)
+    print '%-8s %12.2f %12s %12.2f' % ('P numpy', size/1e6, '', size/1e6/duration)
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
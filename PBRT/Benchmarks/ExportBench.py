@@ -0,0 +1,261 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Export benchmark suite: runs MeshOpt, Light, Material and a whole
+# Exporter.doIt on synthetic scenes against FakeOpenMaya, outside of Maya.
+# Every benchmark runs in its own process so that its peak memory can be
+# measured. Records items/sec (vertices for meshes), bytes/sec and peak memory
+# and writes them to a JSON or CSV file for tracking regressions.
+#
+#   python -m PBRT.Benchmarks.ExportBench [--scale 1.0] [--output exportbench.json] [--only MeshOpt,...]
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import csv
+import time
+import json
+import shutil
+import tempfile
+import platform
+import optparse
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from PBRT.Benchmarks import FakeOpenMaya
+from PBRT.Benchmarks import SyntheticScenes
+
+
+RESULT_FIELDS = ( 'date', 'benchmark', 'scene', 'unit', 'items', 'seconds',
+                  'itemsPerSec', 'bytes', 'bytesPerSec', 'peakMemoryKB', 'exportMemoryKB' )
+
+
+def peakMemoryKB():
+    """
+    Peak resident memory of this process in KB, None where the resource module
+    is missing (Windows).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+# benchmark name -> (scene parameters, unit)
+BENCHMARKS = [
+    ( 'MeshOpt',  dict(meshes = 16, size = 120, shaders = 4, lights = 0, uvSets = 1), 'vertices' ),
+    ( 'MeshOptUVSets',  dict(meshes = 8, size = 120, shaders = 2, lights = 0, uvSets = 8), 'vertices' ),
+    ( 'Light',    dict(meshes = 0, size = 1, shaders = 1, lights = 3000), 'lights' ),
+    ( 'Material', dict(meshes = 0, size = 1, shaders = 3000, lights = 0), 'materials' ),
+    ( 'Exporter', dict(meshes = 16, size = 80, shaders = 16, lights = 30, uvSets = 2), 'vertices' ),
+]
+
+
+def scaleParameters(parameters, scale):
+    """
+    scale the number of objects, mesh sizes stay the same
+    """
+    scaled = dict(parameters)
+    for key in ('meshes', 'shaders', 'lights'):
+        if scaled.get(key):
+            scaled[key] = max(1, int(scaled[key] * scale))
+    return scaled
+
+
+def sceneVertexCount(scene):
+    return sum([len(node.points) for node in scene.nodes.values() if node.nodeType == 'mesh'])
+
+
+def outputBytes(outputDir):
+    total = 0
+    for fileName in os.listdir(outputDir):
+        fileName = os.path.join(outputDir, fileName)
+        if os.path.isfile(fileName):
+            total += os.path.getsize(fileName)
+    return total
+
+
+class QuietProgress:
+    def isCancelled(self):
+        return False
+    def setProgressStatus(self, string):
+        pass
+
+
+def boundShaders():
+    """
+    BoundMaterials with the surface shader of every shading engine, as if all
+    of them were bound to exported meshes.
+    """
+
+    from maya import OpenMaya
+    from PBRT.ExportModules.ExportModule import BoundMaterials
+
+    boundMaterials = BoundMaterials()
+    materials = OpenMaya.MPlugArray()
+    itDn = OpenMaya.MItDependencyNodes( OpenMaya.MFn.kShadingEngine )
+    while not itDn.isDone():
+        shadingGroup = OpenMaya.MFnDependencyNode( itDn.thisNode() )
+        shadingGroup.findPlug("surfaceShader").connectedTo(materials, True, True)
+        if materials.length() > 0:
+            boundMaterials.add( OpenMaya.MFnDependencyNode(materials[0].node()) )
+        itDn.next()
+    return boundMaterials
+
+
+def runBenchmark(name, parameters, unit):
+    """
+    Build the scene, run one benchmark and return its result dict. Expects a
+    fresh process: installs the fake maya modules before importing the exporter.
+    """
+
+    outputDir = tempfile.mkdtemp(prefix = 'exportbench')
+    settings = { 'scene_path': outputDir + os.sep }
+    scene = SyntheticScenes.buildScene(settings = settings, **parameters)
+    FakeOpenMaya.install(scene)
+
+    from maya import OpenMaya
+    from PBRT.Commands import Exporter
+    import PBRT.ExportModules.MeshOpt as PBRTMesh
+    import PBRT.ExportModules.Light as PBRTLight
+
+    sceneFileName = os.path.join(outputDir, 'bench.pbrt')
+    exporter = Exporter.Exporter(sceneFileName, 'bench.exr', 320, 240, 'camera1', 1)
+    exporter.mProgress = QuietProgress()
+
+    items = sceneVertexCount(scene)
+    if unit == 'lights':
+        items = parameters['lights']
+    elif unit == 'materials':
+        items = parameters['shaders']
+
+    memoryBefore = peakMemoryKB()
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.time()
+    try:
+        if name == 'Exporter':
+            exporter.doIt()
+        else:
+            fileHandle = open(sceneFileName, 'wb')
+            if name.startswith('MeshOpt'):
+                exporter.exportType( OpenMaya.MFn.kMesh, PBRTMesh.MeshOpt.GeoFactory, "Mesh", (fileHandle, 0) )
+            elif name == 'Light':
+                exporter.exportType( OpenMaya.MFn.kLight, PBRTLight.Light.LightFactory, "Light", fileHandle )
+            elif name == 'Material':
+                exporter.sceneFileHandle = fileHandle
+                exporter.exportMaterials( boundShaders() )
+            fileHandle.close()
+    finally:
+        seconds = max(time.time() - start, 1e-9)
+        sys.stdout.close()
+        sys.stdout = stdout
+    memoryAfter = peakMemoryKB()
+
+    size = outputBytes(outputDir)
+    shutil.rmtree(outputDir, True)
+
+    exportMemory = None
+    if memoryBefore is not None:
+        exportMemory = memoryAfter - memoryBefore
+    return { 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+             'benchmark': name,
+             'scene': ' '.join(['%s=%s' % item for item in sorted(parameters.items())]),
+             'unit': unit,
+             'items': items,
+             'seconds': seconds,
+             'itemsPerSec': items / seconds,
+             'bytes': size,
+             'bytesPerSec': size / seconds,
+             'peakMemoryKB': memoryAfter,
+             'exportMemoryKB': exportMemory }
+
+
+def benchmarkProcess(queue, name, parameters, unit):
+    try:
+        queue.put( runBenchmark(name, parameters, unit) )
+    except Exception, e:
+        queue.put( '%s: %s' % (e.__class__.__name__, e) )
+
+
+def run(scale = 1.0, only = None):
+    """
+    Run the benchmarks (all, or the names in only), each in its own process.
+    Returns the list of result dicts.
+    """
+
+    results = []
+    print '%-14s %12s %12s %12s %10s %10s' % ('benchmark', 'items', 'items/s', 'MB/s', 'seconds', 'peak MB')
+    for name, parameters, unit in BENCHMARKS:
+        if only and name not in only:
+            continue
+        parameters = scaleParameters(parameters, scale)
+
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target = benchmarkProcess, args = (queue, name, parameters, unit))
+        process.start()
+        result = queue.get()
+        process.join()
+        if isinstance(result, str):
+            print '%-14s failed: %s' % (name, result)
+            continue
+
+        peak = '-'
+        if result['peakMemoryKB'] is not None:
+            peak = '%.1f' % (result['peakMemoryKB'] / 1024.0)
+        print '%-14s %12i %12.0f %12.2f %10.2f %10s' % (name, result['items'], result['itemsPerSec'], result['bytesPerSec'] / 1e6, result['seconds'], peak)
+        results.append(result)
+    return results
+
+
+def writeResults(results, fileName):
+    """
+    .csv files get one row per result appended, anything else is written as a
+    JSON document with the platform information.
+    """
+
+    if fileName.lower().endswith('.csv'):
+        isNew = not os.path.exists(fileName)
+        csvFile = open(fileName, 'ab')
+        writer = csv.DictWriter(csvFile, RESULT_FIELDS)
+        if isNew:
+            writer.writerow( dict(zip(RESULT_FIELDS, RESULT_FIELDS)) )
+        for result in results:
+            writer.writerow(result)
+        csvFile.close()
+        return
+
+    document = { 'platform': platform.platform(),
+                 'python': platform.python_version(),
+                 'cpus': multiprocessing.cpu_count(),
+                 'results': results }
+    jsonFile = open(fileName, 'w')
+    json.dump(document, jsonFile, indent = 2, sort_keys = True)
+    jsonFile.close()
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage = 'python -m PBRT.Benchmarks.ExportBench [options]')
+    parser.add_option('--scale', type = 'float', default = 1.0, help = 'scale the number of meshes, shaders and lights')
+    parser.add_option('--output', default = 'exportbench.json', help = 'result file, .json or .csv (appended)')
+    parser.add_option('--only', default = '', help = 'comma separated benchmark names')
+    options, args = parser.parse_args()
+
+    only = [name for name in options.only.split(',') if name]
+    results = run(options.scale, only)
+    writeResults(results, options.output)
+    print 'Results written to %s' % options.output
@@ -0,0 +1,1461 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# A lightweight stand-in for the parts of maya.OpenMaya, maya.cmds,
+# maya.OpenMayaUI and maya.OpenMayaMPx that the exporter uses, so that the
+# export code can be benchmarked outside of Maya on synthetic scenes.
+# install() registers the fake modules as "maya.*" in sys.modules.
+# Only what the exporter calls is implemented, and only as far as it needs.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import math
+import types
+import tempfile
+
+
+# ------------------------------------------------------------------------------
+# scene description
+# ------------------------------------------------------------------------------
+
+class Node:
+    """
+    A node of the fake scene. DAG nodes have a parent list and children,
+    DG nodes (shaders, shading engines, settings) do not.
+    """
+
+    def __init__(self, name, nodeType, apiType, attributes = None):
+        self.name = name
+        self.nodeType = nodeType
+        self.apiType = apiType
+        self.attributes = {}
+        if attributes:
+            self.attributes.update(attributes)
+        self.enums = {}
+        self.connections = {}   # attribute -> Node connected into it
+        self.parents = []
+        self.children = []
+        self.isDag = False
+        self.intermediate = False
+
+
+class Scene:
+    """
+    The fake scene: nodes by name, DAG roots, and the pbrt_settings values.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.roots = []
+        self.yUp = True
+        self.currentTime = 1.0
+        self.messages = []
+
+    def addNode(self, node):
+        self.nodes[node.name] = node
+        return node
+
+    def addDagNode(self, name, nodeType, apiType, parent = None, attributes = None):
+        node = Node(name, nodeType, apiType, attributes)
+        node.isDag = True
+        node.attributes.setdefault('visibility', True)
+        node.attributes.setdefault('drawOverride', [0, 0, 0, 0, 0, 0, 1])
+        if parent is None:
+            self.roots.append(node)
+        else:
+            node.parents.append(parent)
+            parent.children.append(node)
+        return self.addNode(node)
+
+    def addTransform(self, name, parent = None, matrix = None):
+        node = self.addDagNode(name, 'transform', MFn.kTransform, parent)
+        node.matrix = matrix or identityMatrix()
+        return node
+
+    def addInstance(self, node, parent):
+        """
+        Parent an existing DAG node under a second transform (Maya instancing).
+        """
+        node.parents.append(parent)
+        parent.children.append(node)
+
+    def addShader(self, name, nodeType, attributes = None):
+        attributes = attributes or {}
+        if nodeType in ('lambert', 'blinn', 'phong', 'phongE'):
+            attributes.setdefault('color', [(0.5, 0.5, 0.5)])
+        if nodeType in ('blinn', 'phong', 'phongE'):
+            attributes.setdefault('specularColor', [(0.5, 0.5, 0.5)])
+        if nodeType == 'pbrtAreaLightMaterial':
+            attributes.setdefault('intensity', 1.0)
+            attributes.setdefault('samples', 4)
+            attributes.setdefault('colorR', 1.0)
+            attributes.setdefault('colorG', 1.0)
+            attributes.setdefault('colorB', 1.0)
+        shader = self.addNode(Node(name, nodeType, MFn.kLambert, attributes))
+        shader.classification = 'shader/surface'
+        engine = self.addNode(Node(name + 'SG', 'shadingEngine', MFn.kShadingEngine))
+        engine.connections['surfaceShader'] = shader
+        return engine
+
+    def addMesh(self, name, parent, points, faces, normals = None, normalIds = None,
+                uvSets = None, faceShaders = None, shadingEngines = None):
+        """
+        points: list of (x,y,z). faces: list of vertex index lists.
+        normals/normalIds: normal array and one id per face-vertex (smooth per
+        vertex normals if None). uvSets: list of (name, us, vs, faceUVIds) where
+        faceUVIds holds a uv id list per face, or None for an unmapped face.
+        faceShaders: shading engine index per face, shadingEngines: engine nodes.
+        """
+        mesh = self.addDagNode(name, 'mesh', MFn.kMesh, parent)
+        mesh.points = [tuple(p) for p in points]
+        mesh.faces = [list(f) for f in faces]
+        if normals is None:
+            normals = vertexNormals(mesh.points, mesh.faces)
+            normalIds = [v for f in mesh.faces for v in f]
+        mesh.normals = normals
+        mesh.normalIds = normalIds
+        mesh.faceOffsets = []
+        offset = 0
+        for f in mesh.faces:
+            mesh.faceOffsets.append(offset)
+            offset += len(f)
+        mesh.uvSets = uvSets or []
+        mesh.faceShaders = faceShaders or [0] * len(faces)
+        mesh.shadingEngines = shadingEngines or []
+        mesh.attributes['useMaxSubdivisions'] = False
+        mesh.attributes['maxSubd'] = 1
+        return mesh
+
+    def addLight(self, name, parent, lightType, color = (1.0, 1.0, 1.0), intensity = 1.0):
+        apiType = {'pointLight': MFn.kPointLight,
+                   'spotLight': MFn.kSpotLight,
+                   'directionalLight': MFn.kDirectionalLight}[lightType]
+        light = self.addDagNode(name, lightType, apiType, parent)
+        light.color = color
+        light.intensity = intensity
+        light.attributes['coneAngle'] = math.radians(40)
+        light.attributes['dropoff'] = 0.0
+        return light
+
+    def addCamera(self, name, parent, fov = 54.43, ortho = False):
+        camera = self.addDagNode(name, 'camera', MFn.kCamera, parent)
+        camera.attributes['renderable'] = True
+        camera.fov = math.radians(fov)
+        camera.ortho = ortho
+        return camera
+
+    def addLocator(self, name, parent, nodeType, attributes = None):
+        return self.addDagNode(name, nodeType, MFn.kLocator, parent, attributes)
+
+    def addSettings(self, values, enums):
+        """
+        pbrt_settings node: values by attribute, enum option lists by attribute.
+        """
+        settings = self.addNode(Node('pbrt_settings', 'pbrtSettingsNode', MFn.kPluginDependNode, values))
+        settings.enums.update(enums)
+        return settings
+
+
+def identityMatrix():
+    return [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+
+
+def translateMatrix(x, y, z):
+    m = identityMatrix()
+    m[3][0], m[3][1], m[3][2] = x, y, z
+    return m
+
+
+def vertexNormals(points, faces):
+    normals = [[0.0, 0.0, 0.0] for p in points]
+    for f in faces:
+        a, b, c = points[f[0]], points[f[1]], points[f[2]]
+        u = (b[0]-a[0], b[1]-a[1], b[2]-a[2])
+        v = (c[0]-a[0], c[1]-a[1], c[2]-a[2])
+        n = (u[1]*v[2]-u[2]*v[1], u[2]*v[0]-u[0]*v[2], u[0]*v[1]-u[1]*v[0])
+        for i in f:
+            for k in range(3):
+                normals[i][k] += n[k]
+    out = []
+    for n in normals:
+        length = math.sqrt(n[0]*n[0] + n[1]*n[1] + n[2]*n[2]) or 1.0
+        out.append((n[0]/length, n[1]/length, n[2]/length))
+    return out
+
+
+# the scene the fake API works on, set by install()/setScene()
+scene = Scene()
+
+def setScene(newScene):
+    global scene
+    scene = newScene
+
+
+# ------------------------------------------------------------------------------
+# maya.OpenMaya
+# ------------------------------------------------------------------------------
+
+class MFn:
+    kInvalid = 0
+    kDependencyNode = 4
+    kDagNode = 107
+    kTransform = 110
+    kMesh = 296
+    kNurbsSurface = 294
+    kLight = 302
+    kPointLight = 309
+    kSpotLight = 310
+    kDirectionalLight = 308
+    kAmbientLight = 303
+    kCamera = 250
+    kLocator = 281
+    kShadingEngine = 320
+    kLambert = 363
+    kPluginDependNode = 456
+    kInstancer = 749
+    kMeshPolygonComponent = 548
+    kAnimCurve = 7
+    kTime = 520
+    kExpression = 327
+
+    # apiType -> the function sets it is compatible with
+    hierarchy = {
+        kMesh: (kDagNode, kMesh),
+        kTransform: (kDagNode, kTransform),
+        kPointLight: (kDagNode, kLight, kPointLight),
+        kSpotLight: (kDagNode, kLight, kSpotLight),
+        kDirectionalLight: (kDagNode, kLight, kDirectionalLight),
+        kAmbientLight: (kDagNode, kLight, kAmbientLight),
+        kCamera: (kDagNode, kCamera),
+        kLocator: (kDagNode, kLocator),
+        kInstancer: (kDagNode, kInstancer),
+    }
+
+
+class MSpace:
+    kInvalid = 0
+    kTransform = 1
+    kPreTransform = 2
+    kPostTransform = 3
+    kWorld = 4
+    kObject = kPreTransform
+
+
+class MGlobal:
+    kBatch = 0
+    kInteractive = 1
+    kLibraryApp = 2
+
+    @staticmethod
+    def mayaState():
+        return MGlobal.kBatch
+
+    @staticmethod
+    def isYAxisUp():
+        return scene.yUp
+
+    @staticmethod
+    def displayInfo(msg):
+        scene.messages.append(('info', msg))
+
+    @staticmethod
+    def displayWarning(msg):
+        scene.messages.append(('warning', msg))
+
+    @staticmethod
+    def displayError(msg):
+        scene.messages.append(('error', msg))
+
+
+class MObject:
+
+    def __init__(self, node = None, component = None):
+        self.fakeNode = node
+        self.fakeComponent = component
+
+    def isNull(self):
+        return self.fakeNode is None and self.fakeComponent is None
+
+    def apiType(self):
+        if self.fakeComponent is not None:
+            return MFn.kMeshPolygonComponent
+        if self.fakeNode is None:
+            return MFn.kInvalid
+        return self.fakeNode.apiType
+
+    def hasFn(self, fn):
+        if self.fakeNode is None:
+            return False
+        if fn == self.fakeNode.apiType:
+            return True
+        if fn == MFn.kDependencyNode:
+            return True
+        return fn in MFn.hierarchy.get(self.fakeNode.apiType, ())
+
+    def __eq__(self, other):
+        return isinstance(other, MObject) and self.fakeNode is other.fakeNode and self.fakeComponent is other.fakeComponent
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+
+class FaceComponent:
+    """
+    Face list of a mesh component. None faces = complete component.
+    """
+    def __init__(self, faces):
+        self.faces = faces
+
+
+class _Array(object):
+    """
+    Base of the M*Array types.
+    """
+
+    def __init__(self, values = None):
+        self.values = list(values or [])
+
+    def length(self):
+        return len(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __setitem__(self, i, value):
+        self.values[i] = value
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def append(self, value):
+        self.values.append(value)
+
+    def clear(self):
+        self.values = []
+
+    def setLength(self, n):
+        self.values = (self.values + [self.default()] * n)[:n]
+
+    def set(self, value, i):
+        self.values[i] = value
+
+    def default(self):
+        return 0
+
+    def fakeAssign(self, values):
+        self.values = list(values)
+
+
+class MIntArray(_Array):
+    pass
+
+class MFloatArray(_Array):
+    def default(self):
+        return 0.0
+
+class MDoubleArray(MFloatArray):
+    pass
+
+class MStringArray(_Array):
+    def default(self):
+        return ''
+
+class MObjectArray(_Array):
+    def default(self):
+        return MObject()
+
+class MPlugArray(_Array):
+    pass
+
+class MMatrixArray(_Array):
+    def default(self):
+        return MMatrix()
+
+class MDagPathArray(_Array):
+    def default(self):
+        return MDagPath()
+
+
+class MPoint(object):
+
+    def __init__(self, x = 0.0, y = 0.0, z = 0.0, w = 1.0):
+        if isinstance(x, (MPoint, MVector, MFloatVector)):
+            x, y, z = x.x, x.y, x.z
+        self.x, self.y, self.z, self.w = float(x), float(y), float(z), float(w)
+
+    def __getitem__(self, i):
+        return (self.x, self.y, self.z, self.w)[i]
+
+    def __mul__(self, m):
+        x, y, z = self.x, self.y, self.z
+        r = m.values
+        return MPoint(x*r[0][0] + y*r[1][0] + z*r[2][0] + r[3][0],
+                      x*r[0][1] + y*r[1][1] + z*r[2][1] + r[3][1],
+                      x*r[0][2] + y*r[1][2] + z*r[2][2] + r[3][2])
+
+    def __sub__(self, other):
+        return MVector(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def distanceTo(self, other):
+        return (self - other).length()
+
+
+class MFloatPoint(MPoint):
+    pass
+
+
+class MVector(object):
+
+    def __init__(self, x = 0.0, y = 0.0, z = 0.0):
+        if isinstance(x, (MPoint, MVector, MFloatVector)):
+            x, y, z = x.x, x.y, x.z
+        self.x, self.y, self.z = float(x), float(y), float(z)
+
+    def __getitem__(self, i):
+        return (self.x, self.y, self.z)[i]
+
+    def __add__(self, o):
+        return self.__class__(self.x + o.x, self.y + o.y, self.z + o.z)
+
+    def __sub__(self, o):
+        return self.__class__(self.x - o.x, self.y - o.y, self.z - o.z)
+
+    def __mul__(self, o):
+        if isinstance(o, MMatrix):
+            r = o.values
+            return self.__class__(self.x*r[0][0] + self.y*r[1][0] + self.z*r[2][0],
+                                  self.x*r[0][1] + self.y*r[1][1] + self.z*r[2][1],
+                                  self.x*r[0][2] + self.y*r[1][2] + self.z*r[2][2])
+        if isinstance(o, (MVector, MFloatVector)):
+            return self.x*o.x + self.y*o.y + self.z*o.z
+        return self.__class__(self.x*o, self.y*o, self.z*o)
+
+    def __xor__(self, o):
+        return self.__class__(self.y*o.z - self.z*o.y, self.z*o.x - self.x*o.z, self.x*o.y - self.y*o.x)
+
+    def length(self):
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+
+    def normal(self):
+        l = self.length() or 1.0
+        return self.__class__(self.x/l, self.y/l, self.z/l)
+
+
+class MFloatVector(MVector):
+    pass
+
+
+class MColor(object):
+    def __init__(self, r = 0.0, g = 0.0, b = 0.0, a = 1.0):
+        self.r, self.g, self.b, self.a = r, g, b, a
+
+
+class MPointArray(_Array):
+    def default(self):
+        return MPoint()
+
+class MFloatPointArray(MPointArray):
+    pass
+
+class MFloatVectorArray(_Array):
+    def default(self):
+        return MFloatVector()
+
+class MVectorArray(MFloatVectorArray):
+    pass
+
+
+class MMatrix(object):
+
+    def __init__(self, values = None):
+        self.values = [list(r) for r in (values or identityMatrix())]
+
+    def __call__(self, i, j):
+        return self.values[i][j]
+
+    def __mul__(self, other):
+        a, b = self.values, other.values
+        return MMatrix([[sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4)] for i in range(4)])
+
+    def inverse(self):
+        return MMatrix(invert4(self.values))
+
+    def transpose(self):
+        return MMatrix([[self.values[j][i] for j in range(4)] for i in range(4)])
+
+
+def invert4(m):
+    a = [list(r) + [1.0 if i == j else 0.0 for j in range(4)] for i, r in enumerate(m)]
+    for c in range(4):
+        p = max(range(c, 4), key=lambda r: abs(a[r][c]))
+        a[c], a[p] = a[p], a[c]
+        pivot = a[c][c] or 1e-12
+        a[c] = [x / pivot for x in a[c]]
+        for r in range(4):
+            if r != c:
+                f = a[r][c]
+                a[r] = [x - f * y for x, y in zip(a[r], a[c])]
+    return [r[4:] for r in a]
+
+
+def rotationXMatrix(angle):
+    c, s = math.cos(angle), math.sin(angle)
+    return [[1.0, 0.0, 0.0, 0.0], [0.0, c, s, 0.0], [0.0, -s, c, 0.0], [0.0, 0.0, 0.0, 1.0]]
+
+
+class MEulerRotation(object):
+    def __init__(self, x = 0.0, y = 0.0, z = 0.0):
+        self.x, self.y, self.z = x, y, z
+
+
+class MTransformationMatrix(object):
+
+    def __init__(self, matrix = None):
+        self.matrix = MMatrix(matrix.values if matrix is not None else None)
+
+    def rotateBy(self, rotation, space):
+        # only X rotations are used by the exporter (Y-up to Z-up)
+        rotated = MMatrix(self.matrix.values)
+        rotated.values[3] = [0.0, 0.0, 0.0, 1.0]
+        rotated = rotated * MMatrix(rotationXMatrix(rotation.x))
+        rotated.values[3] = list(self.matrix.values[3])
+        self.matrix = rotated
+
+    def getTranslation(self, space):
+        r = self.matrix.values[3]
+        return MVector(r[0], r[1], r[2])
+
+    def setTranslation(self, vector, space):
+        self.matrix.values[3][0:3] = [vector[0], vector[1], vector[2]]
+
+    def asMatrix(self):
+        return MMatrix(self.matrix.values)
+
+
+class MBoundingBox(object):
+
+    def __init__(self, pmin = None, pmax = None):
+        self.pmin = pmin
+        self.pmax = pmax
+
+    def expand(self, point):
+        if self.pmin is None:
+            self.pmin = MPoint(point)
+            self.pmax = MPoint(point)
+        else:
+            self.pmin = MPoint(min(self.pmin.x, point.x), min(self.pmin.y, point.y), min(self.pmin.z, point.z))
+            self.pmax = MPoint(max(self.pmax.x, point.x), max(self.pmax.y, point.y), max(self.pmax.z, point.z))
+
+    def min(self):
+        return self.pmin or MPoint()
+
+    def max(self):
+        return self.pmax or MPoint()
+
+    def center(self):
+        a, b = self.min(), self.max()
+        return MPoint((a.x+b.x)/2, (a.y+b.y)/2, (a.z+b.z)/2)
+
+    def transformUsing(self, matrix):
+        a, b = self.min(), self.max()
+        box = MBoundingBox()
+        for x in (a.x, b.x):
+            for y in (a.y, b.y):
+                for z in (a.z, b.z):
+                    box.expand(MPoint(x, y, z) * matrix)
+        self.pmin, self.pmax = box.pmin, box.pmax
+
+
+class MScriptUtil(object):
+    """
+    Only the int pointer and matrix helpers are used by the exporter.
+    """
+
+    def __init__(self, ptr = None):
+        if isinstance(ptr, _IntPtr):
+            self.ptr = ptr
+        else:
+            self.ptr = _IntPtr()
+
+    def createFromInt(self, value):
+        self.ptr.value = value
+
+    def asIntPtr(self):
+        return self.ptr
+
+    def asInt(self):
+        return self.ptr.value
+
+    @staticmethod
+    def createMatrixFromList(values, matrix):
+        matrix.values = [list(values[i*4:(i+1)*4]) for i in range(4)]
+
+
+class _IntPtr(object):
+    value = 0
+
+
+# -- plugs ---------------------------------------------------------------------
+
+class MPlug(object):
+
+    def __init__(self, node = None, attribute = None, index = None, value = None):
+        self.fakeNode = node
+        self.attribute = attribute
+        self.index = index
+        self.fakeValue = value
+
+    def value(self):
+        if self.fakeValue is not None:
+            return self.fakeValue
+        value = self.fakeNode.attributes.get(self.attribute)
+        if self.index is not None:
+            value = value[self.index]
+        return value
+
+    def asBool(self):
+        return bool(self.value())
+
+    def asInt(self):
+        return int(self.value())
+
+    def asShort(self):
+        return int(self.value())
+
+    def asFloat(self):
+        return float(self.value())
+
+    def asDouble(self):
+        return float(self.value())
+
+    def asString(self):
+        return str(self.value())
+
+    def child(self, i):
+        return MPlug(self.fakeNode, self.attribute, i)
+
+    def node(self):
+        return MObject(self.fakeNode)
+
+    def name(self):
+        return '%s.%s' % (self.fakeNode.name, self.attribute)
+
+    def isConnected(self):
+        return self.attribute in self.fakeNode.connections
+
+    def connectedTo(self, plugArray, asDst, asSrc):
+        plugArray.clear()
+        source = self.fakeNode.connections.get(self.attribute)
+        if asDst and source is not None:
+            plugArray.append(MPlug(source, 'outColor'))
+        return plugArray.length() > 0
+
+
+# -- function sets ---------------------------------------------------------------
+
+class MFnBase(object):
+
+    def __init__(self, obj = None):
+        self.fakeNode = None
+        if isinstance(obj, MDagPath):
+            self.fakeNode = obj.fakeNodes[-1] if obj.fakeNodes else None
+            self.dagPath = MDagPath(obj)
+        elif isinstance(obj, MObject):
+            self.fakeNode = obj.fakeNode
+            self.dagPath = None
+        else:
+            self.dagPath = None
+
+    def object(self):
+        return MObject(self.fakeNode)
+
+    def type(self):
+        return self.fakeNode.apiType
+
+
+class MFnDependencyNode(MFnBase):
+
+    def name(self):
+        return self.fakeNode.name
+
+    def typeName(self):
+        return self.fakeNode.nodeType
+
+    def findPlug(self, attribute, wantNetworked = False):
+        if attribute not in self.fakeNode.attributes and attribute not in self.fakeNode.connections:
+            raise RuntimeError('(kInvalidParameter): No element at given index')
+        return MPlug(self.fakeNode, attribute)
+
+    def hasAttribute(self, attribute):
+        return attribute in self.fakeNode.attributes
+
+    def classification(self, nodeType):
+        for node in scene.nodes.values():
+            if node.nodeType == nodeType:
+                return getattr(node, 'classification', '')
+        return ''
+
+    def isFromReferencedFile(self):
+        return False
+
+
+class MFnDagNode(MFnDependencyNode):
+
+    def isIntermediateObject(self):
+        return self.fakeNode.intermediate
+
+    def parentCount(self):
+        return len(self.fakeNode.parents)
+
+    def parent(self, i):
+        return MObject(self.fakeNode.parents[i])
+
+    def childCount(self):
+        return len(self.fakeNode.children)
+
+    def child(self, i):
+        return MObject(self.fakeNode.children[i])
+
+    def partialPathName(self):
+        if self.dagPath is not None:
+            return self.dagPath.partialPathName()
+        return self.fakeNode.name
+
+    def fullPathName(self):
+        if self.dagPath is not None:
+            return self.dagPath.fullPathName()
+        return '|' + self.fakeNode.name
+
+    def boundingBox(self):
+        box = MBoundingBox()
+        for p in getattr(self.fakeNode, 'points', [(0.0, 0.0, 0.0)]):
+            box.expand(MPoint(*p))
+        return box
+
+    def isInstanced(self, indirect = True):
+        return len(self.fakeNode.parents) > 1
+
+    def transformationMatrix(self):
+        return MMatrix(getattr(self.fakeNode, 'matrix', None))
+
+
+class MDagPath(object):
+
+    def __init__(self, other = None):
+        self.fakeNodes = list(other.fakeNodes) if other is not None else []
+
+    def node(self):
+        return MObject(self.fakeNodes[-1])
+
+    def transform(self):
+        for node in reversed(self.fakeNodes):
+            if node.apiType == MFn.kTransform:
+                return MObject(node)
+        return MObject(self.fakeNodes[-1])
+
+    def fullPathName(self):
+        return ''.join(['|' + n.name for n in self.fakeNodes])
+
+    def partialPathName(self):
+        return self.fakeNodes[-1].name
+
+    def length(self):
+        return len(self.fakeNodes)
+
+    def pop(self, count = 1):
+        self.fakeNodes = self.fakeNodes[:-count]
+
+    def apiType(self):
+        return self.fakeNodes[-1].apiType
+
+    def hasFn(self, fn):
+        return self.node().hasFn(fn)
+
+    def extendToShape(self):
+        node = self.fakeNodes[-1]
+        if node.apiType == MFn.kTransform:
+            shapes = [c for c in node.children if c.apiType != MFn.kTransform]
+            if shapes:
+                self.fakeNodes.append(shapes[0])
+
+    def isInstanced(self):
+        return any([len(n.parents) > 1 for n in self.fakeNodes])
+
+    def instanceNumber(self):
+        node = self.fakeNodes[-1]
+        if len(node.parents) > 1 and len(self.fakeNodes) > 1:
+            return node.parents.index(self.fakeNodes[-2])
+        return 0
+
+    def inclusiveMatrix(self):
+        m = MMatrix()
+        for node in reversed(self.fakeNodes):
+            if hasattr(node, 'matrix'):
+                m = m * MMatrix(node.matrix)
+        return m
+
+    def inclusiveMatrixInverse(self):
+        return self.inclusiveMatrix().inverse()
+
+    def exclusiveMatrix(self):
+        return MDagPath.fromNodes(self.fakeNodes[:-1]).inclusiveMatrix()
+
+    def isValid(self):
+        return len(self.fakeNodes) > 0
+
+    def __eq__(self, other):
+        return isinstance(other, MDagPath) and [id(n) for n in self.fakeNodes] == [id(n) for n in other.fakeNodes]
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    @staticmethod
+    def fromNodes(nodes):
+        path = MDagPath()
+        path.fakeNodes = list(nodes)
+        return path
+
+    @staticmethod
+    def getAPathTo(obj, path):
+        path.fakeNodes = allPaths(obj.fakeNode)[0]
+
+    @staticmethod
+    def getAllPathsTo(obj, paths):
+        paths.clear()
+        for nodes in allPaths(obj.fakeNode):
+            paths.append(MDagPath.fromNodes(nodes))
+
+
+def allPaths(node):
+    if not node.parents:
+        return [[node]]
+    paths = []
+    for parent in node.parents:
+        for p in allPaths(parent):
+            paths.append(p + [node])
+    return paths
+
+
+class MItDag(object):
+    kDepthFirst = 0
+    kBreadthFirst = 1
+
+    def __init__(self, traversal = 0, filterType = MFn.kInvalid):
+        self.paths = []
+        def walk(nodes):
+            node = nodes[-1]
+            if filterType == MFn.kInvalid or MObject(node).hasFn(filterType):
+                self.paths.append(list(nodes))
+            for child in node.children:
+                walk(nodes + [child])
+        for root in scene.roots:
+            walk([root])
+        self.index = 0
+
+    def isDone(self):
+        return self.index >= len(self.paths)
+
+    def next(self):
+        self.index += 1
+
+    def getPath(self, dagPath):
+        dagPath.fakeNodes = list(self.paths[self.index])
+
+    def currentItem(self):
+        return MObject(self.paths[self.index][-1])
+
+    def item(self):
+        return self.currentItem()
+
+    def reset(self):
+        self.index = 0
+
+
+class MItDependencyNodes(object):
+
+    def __init__(self, filterType = MFn.kInvalid):
+        self.nodes = [n for n in scene.nodes.values() if filterType in (MFn.kInvalid, MFn.kDependencyNode) or MObject(n).hasFn(filterType)]
+        self.index = 0
+
+    def isDone(self):
+        return self.index >= len(self.nodes)
+
+    def next(self):
+        self.index += 1
+
+    def thisNode(self):
+        return MObject(self.nodes[self.index])
+
+    def item(self):
+        return self.thisNode()
+
+
+class MFnComponent(object):
+
+    def __init__(self, obj = None):
+        if obj is None or obj.fakeComponent is None:
+            raise RuntimeError('(kInvalidParameter): Object is incompatible with this method')
+        self.component = obj.fakeComponent
+
+    def isEmpty(self):
+        return self.component.faces is not None and len(self.component.faces) == 0
+
+    def isComplete(self):
+        return self.component.faces is None
+
+    def elementCount(self):
+        return len(self.component.faces or [])
+
+
+class MFnSingleIndexedComponent(MFnComponent):
+
+    def getElements(self, elements):
+        elements.fakeAssign(self.component.faces or [])
+
+
+# -- mesh ----------------------------------------------------------------------
+
+class MFnMesh(MFnDagNode):
+
+    def fakeMesh(self):
+        return self.fakeNode
+
+    def numVertices(self):
+        return len(self.fakeNode.points)
+
+    def numPolygons(self):
+        return len(self.fakeNode.faces)
+
+    def numFaceVertices(self):
+        return sum([len(f) for f in self.fakeNode.faces])
+
+    def getPoints(self, points, space = MSpace.kObject):
+        points.fakeAssign([MPoint(*p) for p in self.fakeNode.points])
+
+    def getNormals(self, normals, space = MSpace.kObject):
+        normals.fakeAssign([MFloatVector(*n) for n in self.fakeNode.normals])
+
+    def numUVSets(self):
+        return len(self.fakeNode.uvSets)
+
+    def getUVSetNames(self, names):
+        for uvSet in self.fakeNode.uvSets:
+            names.append(uvSet[0])
+
+    def fakeUVSet(self, name):
+        for uvSet in self.fakeNode.uvSets:
+            if name in (None, uvSet[0]):
+                return uvSet
+        raise RuntimeError('(kInvalidParameter): uv set %s not found' % name)
+
+    def getUVs(self, us, vs, uvSet = None):
+        uvSet = self.fakeUVSet(uvSet)
+        us.fakeAssign(uvSet[1])
+        vs.fakeAssign(uvSet[2])
+
+    def getVertices(self, counts, vertices):
+        counts.fakeAssign([len(f) for f in self.fakeNode.faces])
+        vertices.fakeAssign([v for f in self.fakeNode.faces for v in f])
+
+    def getTriangles(self, counts, vertices):
+        counts.fakeAssign([len(f) - 2 for f in self.fakeNode.faces])
+        out = []
+        for f in self.fakeNode.faces:
+            for t in range(len(f) - 2):
+                out.extend((f[0], f[t+1], f[t+2]))
+        vertices.fakeAssign(out)
+
+    def getNormalIds(self, counts, normalIds):
+        counts.fakeAssign([len(f) for f in self.fakeNode.faces])
+        normalIds.fakeAssign(self.fakeNode.normalIds)
+
+    def getAssignedUVs(self, counts, uvIds, uvSet = None):
+        uvSet = self.fakeUVSet(uvSet)
+        faceIds = uvSet[3]
+        counts.fakeAssign([len(ids or []) for ids in faceIds])
+        uvIds.fakeAssign([i for ids in faceIds for i in (ids or [])])
+
+    def getConnectedShaders(self, instanceNumber, shaders, faceIndices):
+        shaders.fakeAssign([MObject(e) for e in self.fakeNode.shadingEngines])
+        faceIndices.fakeAssign(self.fakeNode.faceShaders)
+
+    def getConnectedSetsAndMembers(self, instanceNumber, sets, components, renderableSetsOnly):
+        mesh = self.fakeNode
+        engines = mesh.shadingEngines
+        if len(engines) <= 1:
+            sets.fakeAssign([MObject(e) for e in engines])
+            components.fakeAssign([MObject() for e in engines])
+            return
+        # per-face assignments come with an extra, empty object-level set
+        setList = []
+        componentList = []
+        for i, engine in enumerate(engines):
+            setList.append(MObject(engine))
+            faces = [f for f, s in enumerate(mesh.faceShaders) if s == i]
+            componentList.append(MObject(None, FaceComponent(faces)))
+        setList.append(MObject(engines[0]))
+        componentList.append(MObject(None, FaceComponent([])))
+        sets.fakeAssign(setList)
+        components.fakeAssign(componentList)
+
+    def isEdgeSmooth(self, edgeId):
+        return True
+
+
+class MItMeshPolygon(object):
+
+    def __init__(self, dagPath, component = None):
+        self.mesh = dagPath.fakeNodes[-1]
+        faces = None
+        if component is not None and component.fakeComponent is not None:
+            faces = component.fakeComponent.faces
+        if faces is None:
+            faces = range(len(self.mesh.faces))
+        self.faces = list(faces)
+        self.index = 0
+
+    def isDone(self):
+        return self.index >= len(self.faces)
+
+    def next(self):
+        self.index += 1
+
+    def reset(self):
+        self.index = 0
+
+    def count(self):
+        return len(self.faces)
+
+    def index(self):
+        return self.faces[self.index]
+
+    def face(self):
+        return self.mesh.faces[self.faces[self.index]]
+
+    def hasValidTriangulation(self):
+        return True
+
+    def hasUVs(self, uvSet = None):
+        if not self.mesh.uvSets:
+            return False
+        i = min(self.index, len(self.faces) - 1)
+        if i < 0:
+            return False
+        return self.mesh.uvSets[0][3][self.faces[i]] is not None
+
+    def numTriangles(self, ptr):
+        ptr.value = len(self.face()) - 2
+
+    def getVertices(self, vertices):
+        vertices.fakeAssign(self.face())
+
+    def getTriangle(self, i, points, vertices, space = MSpace.kObject):
+        f = self.face()
+        tri = (f[0], f[i+1], f[i+2])
+        vertices.fakeAssign(tri)
+        points.fakeAssign([MPoint(*self.mesh.points[v]) for v in tri])
+
+    def normalIndex(self, localIndex):
+        if localIndex < 0:
+            raise RuntimeError('(kInvalidParameter): Index not in valid range')
+        return self.mesh.normalIds[self.mesh.faceOffsets[self.faces[self.index]] + localIndex]
+
+    def getUVIndex(self, localIndex, ptr, uvSet = None):
+        uvSetData = MFnMesh(MDagPath.fromNodes([self.mesh])).fakeUVSet(uvSet)
+        ids = uvSetData[3][self.faces[self.index]]
+        if ids is None or localIndex < 0:
+            raise RuntimeError('(kInvalidParameter): face has no uvs')
+        ptr.value = ids[localIndex]
+
+
+# -- lights and camera ------------------------------------------------------------
+
+class MFnLight(MFnDagNode):
+
+    def color(self):
+        return MColor(*self.fakeNode.color)
+
+    def intensity(self):
+        return self.fakeNode.intensity
+
+
+class MFnPointLight(MFnLight):
+    pass
+
+
+class MFnDirectionalLight(MFnLight):
+    pass
+
+
+class MFnSpotLight(MFnLight):
+
+    def coneAngle(self):
+        return self.fakeNode.attributes['coneAngle']
+
+    def dropOff(self):
+        return self.fakeNode.attributes['dropoff']
+
+
+class MFnCamera(MFnDagNode):
+
+    def eyePoint(self, space = MSpace.kObject):
+        return MPoint() * self.dagPath.inclusiveMatrix()
+
+    def viewDirection(self, space = MSpace.kObject):
+        return (MVector(0.0, 0.0, -1.0) * self.dagPath.inclusiveMatrix()).normal()
+
+    def upDirection(self, space = MSpace.kObject):
+        return (MVector(0.0, 1.0, 0.0) * self.dagPath.inclusiveMatrix()).normal()
+
+    def rightDirection(self, space = MSpace.kObject):
+        return (MVector(1.0, 0.0, 0.0) * self.dagPath.inclusiveMatrix()).normal()
+
+    def centerOfInterestPoint(self, space = MSpace.kObject):
+        return MPoint(0.0, 0.0, -10.0) * self.dagPath.inclusiveMatrix()
+
+    def centerOfInterest(self):
+        return 10.0
+
+    def isOrtho(self):
+        return self.fakeNode.ortho
+
+    def orthoWidth(self):
+        return 30.0
+
+    def horizontalFieldOfView(self):
+        return self.fakeNode.fov
+
+    def verticalFieldOfView(self):
+        return self.fakeNode.fov * 0.75
+
+    def focalLength(self):
+        return 35.0
+
+    def fStop(self):
+        return 5.6
+
+    def filmTranslateH(self):
+        return 0.0
+
+    def filmTranslateV(self):
+        return 0.0
+
+    def nearClippingPlane(self):
+        return 0.1
+
+    def farClippingPlane(self):
+        return 10000.0
+
+
+# -- messages (callbacks) ----------------------------------------------------------
+
+class _Callbacks(object):
+    nextId = 1
+    registered = {}
+
+    @staticmethod
+    def add(kind, function, *args):
+        callbackId = _Callbacks.nextId
+        _Callbacks.nextId += 1
+        _Callbacks.registered[callbackId] = (kind, function, args)
+        return callbackId
+
+
+class MMessage(object):
+
+    @staticmethod
+    def removeCallback(callbackId):
+        _Callbacks.registered.pop(callbackId, None)
+
+    @staticmethod
+    def removeCallbacks(callbackIds):
+        for callbackId in callbackIds:
+            _Callbacks.registered.pop(callbackId, None)
+
+
+class MNodeMessage(MMessage):
+    kAttributeSet = 8
+
+    @staticmethod
+    def addAttributeChangedCallback(node, function, clientData = None):
+        return _Callbacks.add('attributeChanged', function, node, clientData)
+
+    @staticmethod
+    def addNodeDirtyCallback(node, function, clientData = None):
+        return _Callbacks.add('nodeDirty', function, node, clientData)
+
+    @staticmethod
+    def addNameChangedCallback(node, function, clientData = None):
+        return _Callbacks.add('nameChanged', function, node, clientData)
+
+
+class MDagMessage(MMessage):
+
+    @staticmethod
+    def addAllDagChangesCallback(function, clientData = None):
+        return _Callbacks.add('dagChange', function, clientData)
+
+
+class MDGMessage(MMessage):
+
+    @staticmethod
+    def addNodeAddedCallback(function, nodeType = 'dependNode', clientData = None):
+        return _Callbacks.add('nodeAdded', function, nodeType, clientData)
+
+    @staticmethod
+    def addNodeRemovedCallback(function, nodeType = 'dependNode', clientData = None):
+        return _Callbacks.add('nodeRemoved', function, nodeType, clientData)
+
+    @staticmethod
+    def addConnectionCallback(function, clientData = None):
+        return _Callbacks.add('connection', function, clientData)
+
+    @staticmethod
+    def addTimeChangeCallback(function, clientData = None):
+        return _Callbacks.add('timeChange', function, clientData)
+
+
+class MObjectHandle(object):
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def hashCode(self):
+        return id(self.obj.fakeNode)
+
+    def isValid(self):
+        return True
+
+    def isAlive(self):
+        return True
+
+    def object(self):
+        return self.obj
+
+
+class MAnimUtil(object):
+
+    @staticmethod
+    def isAnimated(obj, checkParent = False):
+        node = obj.fakeNodes[-1] if isinstance(obj, MDagPath) else obj.fakeNode
+        return bool(getattr(node, 'animated', False))
+
+
+class MItDependencyGraph(object):
+    kUpstream = 1
+    kDownstream = 0
+    kDepthFirst = 0
+    kBreadthFirst = 1
+    kNodeLevel = 0
+    kPlugLevel = 1
+
+    def __init__(self, root, filterType = MFn.kInvalid, direction = 1, traversal = 0, level = 0):
+        # upstream only: follow the connections into each node
+        self.nodes = []
+        seen = set()
+        stack = [root.fakeNode]
+        while stack:
+            node = stack.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            self.nodes.append(node)
+            stack.extend(node.connections.values())
+        self.index = 0
+
+    def isDone(self):
+        return self.index >= len(self.nodes)
+
+    def next(self):
+        self.index += 1
+
+    def currentItem(self):
+        return MObject(self.nodes[self.index])
+
+
+class MSelectionList(object):
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, name):
+        node = scene.nodes.get(name.split('|')[-1])
+        if node is None:
+            raise RuntimeError('(kInvalidParameter): Object does not exist')
+        self.items.append(node)
+
+    def length(self):
+        return len(self.items)
+
+    def getDagPath(self, i, dagPath):
+        dagPath.fakeNodes = allPaths(self.items[i])[0]
+
+    def getDependNode(self, i, obj):
+        obj.fakeNode = self.items[i]
+
+
+class MFnInstancer(MFnDagNode):
+
+    def particleCount(self):
+        return len(self.fakeNode.instances)
+
+    def allInstances(self, paths, matrices, particlePathStartIndices, pathIndices):
+        sources = self.fakeNode.sources
+        paths.fakeAssign([MDagPath.fromNodes(allPaths(s)[0]) for s in sources])
+        matrices.fakeAssign([MMatrix(m) for m, sourceIndex in self.fakeNode.instances])
+        starts = []
+        indices = []
+        for m, sourceIndex in self.fakeNode.instances:
+            starts.append(len(indices))
+            indices.append(sourceIndex)
+        starts.append(len(indices))
+        particlePathStartIndices.fakeAssign(starts)
+        pathIndices.fakeAssign(indices)
+
+
+# ------------------------------------------------------------------------------
+# maya.cmds
+# ------------------------------------------------------------------------------
+
+class cmds:
+
+    @staticmethod
+    def getAttr(name, asString = False, **kwargs):
+        nodeName, attribute = name.split('.', 1)
+        node = scene.nodes[nodeName]
+        if attribute not in node.attributes:
+            raise ValueError('No object matches name: %s' % name)
+        value = node.attributes[attribute]
+        if asString and attribute in node.enums:
+            return node.enums[attribute][value]
+        return value
+
+    @staticmethod
+    def setAttr(name, value, **kwargs):
+        nodeName, attribute = name.split('.', 1)
+        scene.nodes[nodeName].attributes[attribute] = value
+
+    @staticmethod
+    def objExists(name):
+        if '.' in name:
+            nodeName, attribute = name.split('.', 1)
+            return nodeName in scene.nodes and attribute in scene.nodes[nodeName].attributes
+        return name in scene.nodes
+
+    @staticmethod
+    def listCameras(**kwargs):
+        return [n.name for n in scene.nodes.values() if n.apiType == MFn.kCamera]
+
+    @staticmethod
+    def currentTime(*args, **kwargs):
+        if args:
+            scene.currentTime = args[0]
+        return scene.currentTime
+
+    @staticmethod
+    def nodeType(name):
+        return scene.nodes[name.split('|')[-1]].nodeType
+
+    @staticmethod
+    def listConnections(name, **kwargs):
+        nodeName = name.split('.')[0]
+        node = scene.nodes.get(nodeName)
+        if node is None:
+            return None
+        if '.' in name:
+            source = node.connections.get(name.split('.', 1)[1])
+            return [source.name] if source is not None else None
+        return [n.name for n in node.connections.values()] or None
+
+    @staticmethod
+    def workspace(**kwargs):
+        return tempfile.gettempdir() + os.sep
+
+
+# ------------------------------------------------------------------------------
+# maya.OpenMayaUI / maya.OpenMayaMPx
+# ------------------------------------------------------------------------------
+
+class MProgressWindow(object):
+    def reserve(self): return True
+    def setInterruptable(self, value): pass
+    def setProgressRange(self, a, b): pass
+    def setProgress(self, value): pass
+    def startProgress(self): pass
+    def advanceProgress(self, value): pass
+    def isCancelled(self): return False
+    def setTitle(self, value): pass
+    def setProgressStatus(self, value): pass
+    def endProgress(self): pass
+
+
+class MPxCommand(object):
+    pass
+
+
+class MPxNode(object):
+    kDependNode = 0
+    kLocatorNode = 1
+
+
+def asMPxPtr(obj):
+    return obj
+
+
+# ------------------------------------------------------------------------------
+# module registration
+# ------------------------------------------------------------------------------
+
+def install(newScene = None):
+    """
+    Register the fake modules as maya, maya.OpenMaya, maya.cmds, maya.OpenMayaUI
+    and maya.OpenMayaMPx. Call before importing any PBRT module.
+    """
+
+    if newScene is not None:
+        setScene(newScene)
+
+    maya = types.ModuleType('maya')
+    maya.__path__ = []
+
+    openMaya = types.ModuleType('maya.OpenMaya')
+    this = sys.modules[__name__]
+    for name in dir(this):
+        if name.startswith('M') or name in ('MFn',):
+            setattr(openMaya, name, getattr(this, name))
+
+    mayaCmds = types.ModuleType('maya.cmds')
+    for name in dir(cmds):
+        if not name.startswith('_'):
+            setattr(mayaCmds, name, getattr(cmds, name))
+
+    openMayaUI = types.ModuleType('maya.OpenMayaUI')
+    openMayaUI.MProgressWindow = MProgressWindow
+
+    openMayaMPx = types.ModuleType('maya.OpenMayaMPx')
+    openMayaMPx.MPxCommand = MPxCommand
+    openMayaMPx.MPxNode = MPxNode
+    openMayaMPx.asMPxPtr = asMPxPtr
+
+    maya.OpenMaya = openMaya
+    maya.cmds = mayaCmds
+    maya.OpenMayaUI = openMayaUI
+    maya.OpenMayaMPx = openMayaMPx
+
+    sys.modules['maya'] = maya
+    sys.modules['maya.OpenMaya'] = openMaya
+    sys.modules['maya.cmds'] = mayaCmds
+    sys.modules['maya.OpenMayaUI'] = openMayaUI
+    sys.modules['maya.OpenMayaMPx'] = openMayaMPx
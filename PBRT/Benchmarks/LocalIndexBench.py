@@ -0,0 +1,115 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Benchmark of the object-relative to face-relative vertex index lookup on
+# synthetic n-gon heavy meshes: the per-triangle scan MeshOpt.GetLocalIndex used
+# to do, the per-face MeshCompiler.localIndexMap and, if numpy is available, the
+# whole-mesh MeshCompiler.triangleFaceVertices.
+#
+#   python -m PBRT.Benchmarks.LocalIndexBench [faceCount]
+#
+# ------------------------------------------------------------------------------
+
+import sys
+import time
+
+from PBRT.ExportModules import MeshCompiler
+
+
+class IntArray(list):
+    """
+    Stands in for MIntArray.
+    """
+    def length(self):
+        return len(self)
+
+
+def makeNgonMesh(faceCount, sides):
+    """
+    faceCount fans of 'sides' vertices each, triangulated around their first vertex.
+    """
+    faces = []
+    triangles = []
+    for f in xrange(faceCount):
+        face = IntArray(range(f * sides, (f + 1) * sides))
+        faces.append(face)
+        triangles.append([IntArray([face[0], face[t+1], face[t+2]]) for t in xrange(sides - 2)])
+    return faces, triangles
+
+
+def scanLocalIndex(getVertices, getTriangle):
+    """
+    The lookup MeshOpt used before: a scan of the face for every triangle vertex.
+    """
+    localIndex = []
+    for gt in range(0, getTriangle.length()):
+        for gv in range(0, getVertices.length()):
+            if getTriangle[gt] == getVertices[gv]:
+                localIndex.append( gv )
+                break
+        if len(localIndex) == gt:
+            localIndex.append( -1 )
+    return localIndex
+
+
+def runScan(faces, triangles):
+    for face, faceTriangles in zip(faces, triangles):
+        for triangle in faceTriangles:
+            localIndex = scanLocalIndex(face, triangle)
+            for i in xrange(3):
+                localIndex[i]
+
+
+def runMap(faces, triangles):
+    for face, faceTriangles in zip(faces, triangles):
+        indexMap = MeshCompiler.localIndexMap(face, face.length())
+        for triangle in faceTriangles:
+            for vertex in triangle:
+                indexMap.get(vertex, -1)
+
+
+def runBulk(faces, triangles):
+    counts = [len(f) for f in faces]
+    vertices = [v for f in faces for v in f]
+    triangleCounts = [len(t) for t in triangles]
+    triangleVertices = [v for t in triangles for tri in t for v in tri]
+    start = time.time()
+    MeshCompiler.triangleFaceVertices(counts, vertices, triangleCounts, triangleVertices)
+    return time.time() - start
+
+
+def timeIt(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def run(faceCount = 2000):
+    print '%6s %8s %12s %12s %12s %8s' % ('sides', 'corners', 'scan s', 'map s', 'bulk s', 'speedup')
+    results = []
+    for sides in (4, 8, 16, 32, 64, 128):
+        count = max(1, faceCount * 4 / sides)
+        faces, triangles = makeNgonMesh(count, sides)
+        corners = count * (sides - 2) * 3
+        scan = timeIt(runScan, faces, triangles)
+        mapped = timeIt(runMap, faces, triangles)
+        bulk = ''
+        if MeshCompiler.isAvailable():
+            bulk = '%12.4f' % runBulk(faces, triangles)
+        print '%6i %8i %12.4f %12.4f %12s %7.1fx' % (sides, corners, scan, mapped, bulk, scan / max(mapped, 1e-9))
+        results.append( (sides, corners, scan, mapped) )
+    return results
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        run(int(sys.argv[1]))
+    else:
+        run()
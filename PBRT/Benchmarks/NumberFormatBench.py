@@ -0,0 +1,133 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Benchmark of the NumberFormat modes: writes synthetic mesh buffers (points
+# with large world coordinates, unit normals, uvs) through ArrayWriter in every
+# mode and records the output size, the write throughput and how many values
+# do not read back to the same single precision float. Does not need maya.
+#
+#   python -m PBRT.Benchmarks.NumberFormatBench [--vertices 200000] [--output numberformat.json]
+#
+# ------------------------------------------------------------------------------
+
+import time
+import json
+import random
+import struct
+import optparse
+import platform
+import cStringIO
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from PBRT.ExportModules import NumberFormat
+from PBRT.ExportModules.ArrayWriter import ArrayWriter
+
+
+# (mode, digits)
+FORMATS = [ ('fixed', 6), ('fixed', 9), ('general', 6), ('general', 9), ('shortest', 6) ]
+
+
+def meshBuffers(vertexCount, worldSize = 5000.0, seed = 1):
+    """
+    Flat point, normal and uv buffers like the ones MeshOpt writes: points are
+    doubles spread over worldSize units, normals and uvs single floats.
+    """
+
+    generator = random.Random(seed)
+    points = []
+    normals = []
+    uvs = []
+    for v in xrange(vertexCount):
+        points.extend( [generator.uniform(-worldSize, worldSize) for i in range(3)] )
+        x, y, z = [generator.gauss(0.0, 1.0) for i in range(3)]
+        length = (x*x + y*y + z*z) ** 0.5 or 1.0
+        normals.extend( [x/length, y/length, z/length] )
+        uvs.extend( [generator.random(), generator.random()] )
+
+    if numpy is not None:
+        return ( ('point P', numpy.array(points, dtype = numpy.float64), 3),
+                 ('normal N', numpy.array(normals, dtype = numpy.float32), 3),
+                 ('float uv', numpy.array(uvs, dtype = numpy.float32), 2) )
+    single = lambda values: [struct.unpack('f', struct.pack('f', value))[0] for value in values]
+    return ( ('point P', points, 3), ('normal N', single(normals), 3), ('float uv', single(uvs), 2) )
+
+
+def singleMismatches(text, values):
+    """
+    Number of written values that do not read back to the single precision
+    float of the value.
+    """
+
+    written = [float(word) for word in text.split()]
+    mismatches = 0
+    for value, readBack in zip(values, written):
+        if struct.pack('f', value) != struct.pack('f', readBack):
+            mismatches += 1
+    return mismatches
+
+
+def run(vertexCount = 200000, repeat = 3):
+    """
+    Write every buffer in every format, keep the fastest of repeat runs.
+    Returns the list of result dicts.
+    """
+
+    buffers = meshBuffers(vertexCount)
+    results = []
+    print '%-10s %6s %-10s %12s %10s %12s %10s' % ('mode', 'digits', 'buffer', 'bytes', 'MB/s', 'values/s', 'mismatch')
+    for mode, digits in FORMATS:
+        NumberFormat.setFormat(mode, digits)
+        for name, values, columns in buffers:
+            best = None
+            for r in range(repeat):
+                out = cStringIO.StringIO()
+                start = time.time()
+                ArrayWriter().write(out, values, columns, NumberFormat.arrayFormat())
+                seconds = max(time.time() - start, 1e-9)
+                if best is None or seconds < best:
+                    best = seconds
+            text = out.getvalue()
+            flatValues = list(values)
+            result = { 'mode': mode,
+                       'digits': digits,
+                       'buffer': name,
+                       'values': len(flatValues),
+                       'bytes': len(text),
+                       'seconds': best,
+                       'bytesPerSec': len(text) / best,
+                       'valuesPerSec': len(flatValues) / best,
+                       'mismatches': singleMismatches(text, flatValues) }
+            print '%-10s %6i %-10s %12i %10.2f %12.0f %10i' % (mode, digits, name, result['bytes'], result['bytesPerSec'] / 1e6, result['valuesPerSec'], result['mismatches'])
+            results.append(result)
+    NumberFormat.setFormat()
+    return results
+
+
+if __name__ == '__main__':
+    parser = optparse.OptionParser(usage = 'python -m PBRT.Benchmarks.NumberFormatBench [options]')
+    parser.add_option('--vertices', type = 'int', default = 200000, help = 'vertices per buffer')
+    parser.add_option('--repeat', type = 'int', default = 3, help = 'runs per format, the fastest is kept')
+    parser.add_option('--output', default = '', help = 'JSON result file')
+    options, args = parser.parse_args()
+
+    results = run(options.vertices, options.repeat)
+    if options.output:
+        document = { 'platform': platform.platform(),
+                     'python': platform.python_version(),
+                     'numpy': numpy is not None,
+                     'results': results }
+        jsonFile = open(options.output, 'w')
+        json.dump(document, jsonFile, indent = 2, sort_keys = True)
+        jsonFile.close()
+        print 'Results written to %s' % options.output
@@ -0,0 +1,106 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Scaling of the SerializerPool: formats a set of synthetic trianglemesh blocks
+# serially, then through OrderedOutput with an increasing number of workers,
+# and checks that every run writes the same file. Prints MB/s and speedup.
+#
+#   python -m PBRT.Benchmarks.SerializerBench [meshCount] [vertexCount] [maxWorkers]
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import time
+import random
+import hashlib
+import tempfile
+import multiprocessing
+
+from PBRT.ExportModules.SerializerPool import SerializerPool, OrderedOutput, formatParts
+
+
+def makeBlocks(meshCount, vertexCount):
+    """
+    The parts lists MeshOpt.writeArrays would hand over, one per mesh.
+    """
+    random.seed(0)
+    blocks = []
+    for m in xrange(meshCount):
+        points = [(random.uniform(-100, 100), random.uniform(-100, 100), random.uniform(-100, 100)) for i in xrange(vertexCount)]
+        normals = [(random.random(), random.random(), random.random()) for i in xrange(vertexCount)]
+        uvs = [(random.random(), random.random()) for i in xrange(vertexCount)]
+        indices = [random.randrange(vertexCount) for i in xrange(vertexCount * 6)]
+        blocks.append( [ '\t"integer indices" [', (indices, 3, '%i'), '\t]',
+                         '\t"point P" [', (points, 3, '%f'), '\t]',
+                         '\t"float uv" [', (uvs, 2, '%f'), '\t]',
+                         '\t"normal N" [', (normals, 3, '%f'), '\t]' ] )
+    return blocks
+
+
+def timeRun(blocks, workers):
+    """
+    Write all blocks, each preceded by a header line like MeshOpt does.
+    Returns (bytes, seconds, md5 of the file).
+    """
+
+    fd, fileName = tempfile.mkstemp(suffix='.pbrt')
+    os.close(fd)
+    fileHandle = open(fileName, 'wb')
+
+    start = time.time()
+    if workers <= 1:
+        for i, parts in enumerate(blocks):
+            fileHandle.write( '# mesh %i%s' % (i, os.linesep) )
+            fileHandle.write( formatParts(parts) )
+    else:
+        pool = SerializerPool(workers)
+        output = OrderedOutput(fileHandle, pool)
+        for i, parts in enumerate(blocks):
+            output.write( '# mesh %i%s' % (i, os.linesep) )
+            output.writeParts( parts )
+        output.finish()
+        pool.close()
+    fileHandle.close()
+    duration = max(time.time() - start, 1e-9)
+
+    size = os.path.getsize(fileName)
+    digest = hashlib.md5(open(fileName, 'rb').read()).hexdigest()
+    os.remove(fileName)
+    return size, duration, digest
+
+
+def run(meshCount = 32, vertexCount = 50000, maxWorkers = None):
+    if maxWorkers is None:
+        maxWorkers = max(32, multiprocessing.cpu_count())
+
+    blocks = makeBlocks(meshCount, vertexCount)
+    print '%i meshes of %i vertices, %i cpus' % (meshCount, vertexCount, multiprocessing.cpu_count())
+    print '%-8s %10s %10s %8s %s' % ('workers', 'MB', 'MB/s', 'speedup', 'output')
+
+    size, serial, serialDigest = timeRun(blocks, 1)
+    print '%-8s %10.2f %10.2f %7.2fx %s' % ('serial', size/1e6, size/1e6/serial, 1.0, 'reference')
+
+    results = [ (1, size/1e6/serial) ]
+    workers = 2
+    while workers <= maxWorkers:
+        size, duration, digest = timeRun(blocks, workers)
+        same = 'same'
+        if digest != serialDigest:
+            same = 'DIFFERENT'
+        print '%-8i %10.2f %10.2f %7.2fx %s' % (workers, size/1e6, size/1e6/duration, serial/duration, same)
+        results.append( (workers, size/1e6/duration) )
+        workers *= 2
+    return results
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    run(*args)
@@ -0,0 +1,138 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Synthetic scenes for FakeOpenMaya: grids of quads with optional n-gon caps,
+# several uv sets, many shaders and lights, and a pbrt_settings node with the
+# defaults of pbrt_settings.py.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import re
+import math
+
+from PBRT.Benchmarks import FakeOpenMaya
+
+
+SETTINGS_SOURCE = os.path.join( os.path.dirname(os.path.abspath(__file__)), '..', 'Commands', 'pbrt_settings.py' )
+
+
+def settingsDefaults(sourceFileName = SETTINGS_SOURCE):
+    """
+    Default values and enum options of the pbrt_settings attributes, read from
+    the addBool/addEnum/... calls in pbrt_settings.py (which needs maya to be
+    imported).
+    """
+
+    values = {}
+    enums = {}
+    source = open(sourceFileName).read()
+    for kind, args in re.findall(r'self\.add(String|Enum|Short|Long|Float|Bool)\s*\((.*)\)', source):
+        longName = re.search(r"ln\s*=\s*['\"]([^'\"]+)['\"]", args)
+        if not longName:
+            continue
+        longName = longName.group(1)
+        default = re.search(r"dv\s*=\s*([^,]+)", args)
+        if default:
+            default = default.group(1).strip()
+
+        if kind == 'String':
+            try:
+                value = eval(default or "''")
+            except Exception:
+                value = ''
+        elif default is None:
+            value = 0
+        else:
+            value = eval(default)
+        if kind == 'Bool':
+            value = bool(value)
+        if kind == 'Enum':
+            options = re.search(r"options\s*=\s*['\"]([^'\"]*)['\"]", args).group(1)
+            enums[longName] = options.split(':')
+        values[longName] = value
+    return values, enums
+
+
+def gridMesh(scene, name, parent, size, engines, uvSetCount = 1, ngonCaps = False, hardNormals = False):
+    """
+    size x size quads with a wavy surface. ngonCaps adds a 12-sided face, every
+    uv set maps all faces. Faces are spread over the given shading engines.
+    """
+
+    points = []
+    for j in range(size+1):
+        for i in range(size+1):
+            points.append( (float(i), math.sin(i*0.3) * math.cos(j*0.2), float(j)) )
+    faces = []
+    for j in range(size):
+        for i in range(size):
+            a = j*(size+1) + i
+            faces.append( [a, a+1, a+size+2, a+size+1] )
+    if ngonCaps:
+        base = len(points)
+        sides = 12
+        for c in range(sides):
+            points.append( (math.cos(2*math.pi*c/sides), -1.0, math.sin(2*math.pi*c/sides)) )
+        faces.append( range(base, base+sides) )
+
+    uvSets = []
+    for s in range(uvSetCount):
+        us = [p[0]/size + s for p in points]
+        vs = [p[2]/size for p in points]
+        uvSets.append( ('map%i' % (s+1), us, vs, [list(f) for f in faces]) )
+
+    normals = normalIds = None
+    if hardNormals:
+        normals = []
+        normalIds = []
+        for f in faces:
+            normals.append( (0.0, 1.0, 0.0) )
+            normalIds.extend( [len(normals)-1] * len(f) )
+
+    faceShaders = [f % len(engines) for f in range(len(faces))]
+    return scene.addMesh(name, parent, points, faces, normals, normalIds, uvSets, faceShaders, engines)
+
+
+def buildScene(meshes = 4, size = 20, shaders = 2, lights = 3, uvSets = 1, ngonCaps = True, settings = None):
+    """
+    A scene with a camera, a row of grid meshes (every other one with an n-gon
+    cap, every third one without uvs, one to four shading sets), shaders of alternating types and point,
+    spot and directional lights. settings overrides pbrt_settings values.
+    """
+
+    scene = FakeOpenMaya.Scene()
+    values, enums = settingsDefaults()
+    if settings:
+        values.update(settings)
+    scene.addSettings(values, enums)
+
+    cameraTransform = scene.addTransform('camera1', matrix = FakeOpenMaya.translateMatrix(0, 5, 30))
+    scene.addCamera('cameraShape1', cameraTransform)
+
+    engines = []
+    for s in range(shaders):
+        engines.append( scene.addShader('lambert%i' % (s+2), ['lambert', 'blinn'][s % 2]) )
+
+    for m in range(meshes):
+        transform = scene.addTransform('pGrid%i' % m, matrix = FakeOpenMaya.translateMatrix(m*3, 0, 0))
+        meshUVSets = uvSets
+        if m % 3 == 2:
+            meshUVSets = 0
+        # 1 to 4 shading sets per mesh, rotating through the shaders
+        first = m % len(engines)
+        meshEngines = (engines[first:] + engines[:first])[:1 + m % min(4, len(engines))]
+        gridMesh(scene, 'pGridShape%i' % m, transform, size, meshEngines, meshUVSets, ngonCaps and m % 2 == 1)
+
+    for l in range(lights):
+        transform = scene.addTransform('light%i' % l, matrix = FakeOpenMaya.translateMatrix(l, 10, 0))
+        scene.addLight('lightShape%i' % l, transform, ['pointLight', 'spotLight', 'directionalLight'][l % 3])
+
+    return scene
@@ -0,0 +1,5 @@
+"""
+This package contains stand-alone benchmarks of the export code. They run outside of Maya, e.g.: python -m PBRT.Benchmarks.ArrayWriterBench
+ExportBench runs the export modules on synthetic scenes (SyntheticScenes) against FakeOpenMaya, a stand-in for the maya modules.
+NumberFormatBench compares the output size and write speed of the NumberFormat float formats.
+"""
@@ -0,0 +1,359 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter for Maya 2013
+#
+# This file is licensed under the GPL
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Incremental export session. Every mesh, light, locator and material the
+# Exporter writes is kept as a fragment file in <scene_path>/session, along
+# with the nodes it was made from. Maya callbacks on those nodes keep a dirty
+# set; the next export of the session runs the export modules of the dirty
+# fragments only and copies the others from the session directory. Changes
+# the fragments can not follow (settings, render camera with culling or level
+# of detail, added, removed, renamed or reparented nodes, time) make the next
+# export a full one.
+#
+# The session lives as long as Maya, see current(). Do not reload() this
+# module, that would drop the session but not its callbacks.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import shutil
+import hashlib
+
+from maya import OpenMaya
+
+from PBRT.ExportModules.GeometryCache import GeometryCache
+
+# nodes whose changes affect every fragment
+GLOBAL_NODES = ( 'pbrt_settings', 'defaultResolution', 'defaultRenderGlobals' )
+
+# the session of this Maya process, see current() and stop()
+session = None
+
+
+def fragmentName(typeName, nodeName):
+    """
+    Name of the fragment of a node: the type the Exporter logs it as
+    ("Mesh", "Light", "Locator", "Material") and its full path or name.
+    """
+    return '%s %s' % (typeName, nodeName)
+
+# names of the fragments of meshes start with this
+MESH_FRAGMENTS = fragmentName('Mesh', '')
+
+
+def current(sessionDir):
+    """
+    The export session, started on first use. A session for another directory
+    is replaced.
+    """
+
+    global session
+    if session is not None and session.sessionDir != sessionDir:
+        stop()
+    if session is None:
+        session = ExportSession(sessionDir)
+    return session
+
+
+def stop():
+    """
+    End the session and remove its callbacks. The next export is a full one.
+    """
+
+    global session
+    if session is not None:
+        session.removeCallbacks()
+        session = None
+
+
+class Fragment:
+    """
+    Output of one export module as written by the last export: the cache key
+    of its text (None if the node was skipped: hidden, culled or declined by
+    its factory), the index of the file handle it went to (MeshOpt picks the
+    geometry or the area light file), the node keys it depends on and the
+    names of the surface shaders it bound (ExportModule.BoundMaterials).
+    """
+
+    def __init__(self, key, role, dependencies, shaders):
+        self.key = key
+        self.role = role
+        self.dependencies = dependencies
+        self.shaders = shaders
+
+
+class ExportSession:
+    """
+    Node keys are full DAG paths for DAG nodes (every path prefix of an
+    exported path) and names for DG nodes, the same as SceneAnimation.
+    """
+
+    def __init__(self, sessionDir):
+        self.sessionDir = sessionDir
+        # fragment keys restart with the session, blocks of an earlier one must go
+        if os.path.isdir(sessionDir):
+            shutil.rmtree(sessionDir)
+        # fragments are never evicted by size, replaced ones are removed
+        self.store = GeometryCache(sessionDir, 0)
+
+        # fragment name -> Fragment
+        self.fragments = {}
+        self.generation = 0
+
+        # node key -> callback ids, node name -> keys with that name
+        self.tracked = {}
+        self.keysByName = {}
+        self.globalCallbacks = []
+
+        self.dirty = set()
+        self.fullExport = True
+        # dirty set and full flag the current export works with
+        self.exportDirty = set()
+        self.exportFull = True
+        self.meshesDirty = False
+
+        self.reused = 0
+        self.rewritten = 0
+
+        self.addGlobalCallbacks()
+
+    # -- callbacks -------------------------------------------------------------
+
+    def addGlobalCallbacks(self):
+        self.globalCallbacks = [
+            OpenMaya.MDGMessage.addNodeAddedCallback( self.structureChanged, 'dependNode' ),
+            OpenMaya.MDGMessage.addNodeRemovedCallback( self.structureChanged, 'dependNode' ),
+            OpenMaya.MDGMessage.addConnectionCallback( self.connectionChanged ),
+            OpenMaya.MDGMessage.addTimeChangeCallback( self.structureChanged ),
+            OpenMaya.MDagMessage.addAllDagChangesCallback( self.structureChanged ),
+            OpenMaya.MNodeMessage.addNameChangedCallback( OpenMaya.MObject(), self.structureChanged ) ]
+
+    def removeCallbacks(self):
+        for callbackIds in self.tracked.values():
+            for callbackId in callbackIds:
+                self.removeCallback( callbackId )
+        for callbackId in self.globalCallbacks:
+            self.removeCallback( callbackId )
+        self.tracked = {}
+        self.keysByName = {}
+        self.globalCallbacks = []
+
+    def removeCallback(self, callbackId):
+        try:
+            OpenMaya.MMessage.removeCallback( callbackId )
+        except RuntimeError:
+            # the node is gone, and its callbacks with it
+            pass
+
+    def structureChanged(self, *args):
+        self.fullExport = True
+
+    def nodeChanged(self, *args):
+        # clientData, the node key, comes last with every callback signature
+        self.dirty.add( args[-1] )
+
+    def connectionChanged(self, sourcePlug, destinationPlug, made, *args):
+        for plug in (sourcePlug, destinationPlug):
+            name = OpenMaya.MFnDependencyNode( plug.node() ).name()
+            self.dirty.update( self.keysByName.get(name, ()) )
+
+    def track(self, key, mObject):
+        """
+        Watch a node under the given key: its own attribute changes and
+        everything upstream that makes it dirty (deformers, constraints).
+        """
+
+        if key in self.tracked:
+            return
+        self.tracked[key] = [ OpenMaya.MNodeMessage.addAttributeChangedCallback( mObject, self.nodeChanged, key ),
+                              OpenMaya.MNodeMessage.addNodeDirtyCallback( mObject, self.nodeChanged, key ) ]
+        name = OpenMaya.MFnDependencyNode( mObject ).name()
+        self.keysByName.setdefault( name, set() ).add( key )
+
+    def trackPath(self, dagPath):
+        """
+        Watch every node of a DAG path, returns their keys.
+        """
+
+        keys = []
+        dagPath = OpenMaya.MDagPath( dagPath )
+        while dagPath.length() > 0:
+            key = dagPath.fullPathName()
+            self.track( key, dagPath.node() )
+            keys.append( key )
+            dagPath.pop()
+        return keys
+
+    def trackNode(self, mObject):
+        key = OpenMaya.MFnDependencyNode( mObject ).name()
+        self.track( key, mObject )
+        return key
+
+    # -- exports ---------------------------------------------------------------
+
+    def begin(self, cameraPath, cameraDependent, dedup):
+        """
+        Start an export of the session. cameraDependent: culling or level of
+        detail is on, so that meshes depend on the render camera.
+        dedup: meshes share geometry objects (MeshDuplicates), so that one
+        changed mesh makes all of them change.
+        """
+
+        self.exportDirty = self.dirty
+        self.exportFull = self.fullExport
+        self.dirty = set()
+        self.fullExport = False
+        self.generation += 1
+        self.reused = 0
+        self.rewritten = 0
+
+        selection = OpenMaya.MSelectionList()
+        for nodeName in GLOBAL_NODES:
+            try:
+                selection.add( nodeName )
+            except RuntimeError:
+                pass
+        mObject = OpenMaya.MObject()
+        for i in range( selection.length() ):
+            selection.getDependNode( i, mObject )
+            if self.trackNode( mObject ) in self.exportDirty:
+                self.exportFull = True
+
+        # the camera is written every time, it is only a dependency here
+        self.cameraKeys = []
+        if cameraPath and cameraDependent:
+            self.cameraKeys = self.trackPath( cameraPath )
+
+        self.meshesDirty = False
+        if dedup and not self.exportFull:
+            for name, fragment in self.fragments.items():
+                if name.startswith(MESH_FRAGMENTS) and self.isDirty(fragment):
+                    self.meshesDirty = True
+                    break
+
+    def end(self, completed):
+        """
+        Finish the export. An export that did not complete leaves the
+        session dirty, the next one is a full one.
+        """
+
+        if completed:
+            # fragments formatted by the serializer workers
+            self.store.finish()
+        else:
+            self.store.abortPending()
+            self.dirty.update( self.exportDirty )
+            self.fullExport = True
+
+    def isDirty(self, fragment):
+        for key in fragment.dependencies:
+            if key in self.exportDirty:
+                return True
+        return False
+
+    def reusable(self, name):
+        """
+        The fragment of the given name if it can be copied, None if its module
+        has to run.
+        """
+
+        fragment = self.fragments.get(name)
+        if fragment is None or self.exportFull or self.isDirty(fragment):
+            return None
+        if self.meshesDirty and name.startswith(MESH_FRAGMENTS):
+            return None
+        return fragment
+
+    def copyFragment(self, fragment, fileHandle):
+        """
+        Copy a fragment into fileHandle. Returns False if its file is gone.
+        """
+
+        if not self.store.copyTo(fragment.key, fileHandle):
+            return False
+        self.reused += 1
+        return True
+
+    def writer(self, name, fileHandle):
+        """
+        File-like object the module of a fragment writes through, into
+        fileHandle and into the session directory.
+        """
+
+        key = hashlib.sha1('%s %i' % (name, self.generation)).hexdigest()
+        return self.store.writer(key, fileHandle)
+
+    def record(self, name, writer, role, dependencies, shaders = ()):
+        """
+        Publish the fragment written through writer, and replace the one of the
+        last export.
+        """
+
+        writer.commit()
+        self.replace( name, Fragment(writer.key, role, dependencies, list(shaders)) )
+        self.rewritten += 1
+
+    def skip(self, name, dependencies):
+        """
+        Remember that the node of the fragment wrote nothing, until one of
+        dependencies changes.
+        """
+
+        self.replace( name, Fragment(None, 0, dependencies, []) )
+
+    def replace(self, name, fragment):
+        old = self.fragments.get(name)
+        if old is not None and old.key is not None and old.key != fragment.key:
+            oldPath = self.store.blockPath(old.key)
+            if os.path.exists(oldPath):
+                os.remove(oldPath)
+        self.fragments[name] = fragment
+
+    def dagDependencies(self, dagPath):
+        """
+        Keys of the nodes the fragment of a DAG path is made from: the path,
+        and for meshes the render camera if that matters, the shading groups
+        and their surface shaders (area light parameters are written with
+        the mesh). The instances of an instanced mesh depend on all of its
+        paths: the first exported one writes the ObjectBegin of the others
+        (MeshOpt.instancedObjects), so they are rewritten together.
+        """
+
+        if not dagPath.hasFn( OpenMaya.MFn.kMesh ):
+            return self.trackPath( dagPath )
+
+        shapePath = OpenMaya.MDagPath( dagPath )
+        shapePath.extendToShape()
+        paths = OpenMaya.MDagPathArray()
+        if shapePath.isInstanced():
+            OpenMaya.MDagPath.getAllPathsTo( shapePath.node(), paths )
+        else:
+            paths.append( shapePath )
+
+        keys = list( self.cameraKeys )
+        materials = OpenMaya.MPlugArray()
+        for i in range( paths.length() ):
+            keys += self.trackPath( paths[i] )
+            shadingGroups = OpenMaya.MObjectArray()
+            faceIndices = OpenMaya.MIntArray()
+            OpenMaya.MFnMesh( paths[i] ).getConnectedShaders( paths[i].instanceNumber(), shadingGroups, faceIndices )
+            for j in range( shadingGroups.length() ):
+                keys.append( self.trackNode( shadingGroups[j] ) )
+                surfaceShader = OpenMaya.MFnDependencyNode( shadingGroups[j] ).findPlug( "surfaceShader" )
+                surfaceShader.connectedTo( materials, True, False )
+                if materials.length() > 0:
+                    keys.append( self.trackNode( materials[0].node() ) )
+        return keys
+
+    def summary(self):
+        kind = 'incremental'
+        if self.exportFull:
+            kind = 'full'
+        return 'Export session: %s export, %i fragments rewritten, %i reused' % (kind, self.rewritten, self.reused)
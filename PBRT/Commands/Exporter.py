@@ -18,6 +18,7 @@
 
 import os
 os.altsep = '/'
+import time
 from maya import OpenMaya
 from maya import OpenMayaUI
 from maya import cmds
@@ -29,6 +30,20 @@ import PBRT.ExportModules.MeshOpt as PBRTMesh
 import PBRT.ExportModules.Light as PBRTLight
 import PBRT.ExportModules.Material as PBRTMaterial
 import PBRT.ExportModules.Locator as PBRTLocator
+import PBRT.ExportModules.Instancer as PBRTInstancer
+import PBRT.ExportModules.ExportModule as PBRTExportModule
+import PBRT.ExportModules.ExportProfiler as ExportProfiler
+import PBRT.ExportModules.NumberFormat as NumberFormat
+from PBRT.ExportModules.GeometryCache import GeometryCache
+from PBRT.ExportModules.SerializerPool import SerializerPool, OrderedOutput
+from PBRT.ExportModules.GzipWriter import GzipWriter
+from PBRT.ExportModules.ShardedOutput import ShardedOutput
+from PBRT.ExportModules.MeshDuplicates import MeshDuplicates
+from PBRT.ExportModules.MeshCompiler import BufferStats
+from PBRT.ExportModules.ExportModule import BoundMaterials
+from PBRT.ExportModules.ExportReport import ExportReport
+from PBRT.Commands.ExportSession import fragmentName
+from PBRT.ExportModules import MeshDecimator
 
 # Those reloads can be uncommented, to reload those modules without restating Maya
 # reload(PBRTCamera)
@@ -37,6 +52,20 @@ import PBRT.ExportModules.Locator as PBRTLocator
 # reload(PBRTLight)
 # reload(PBRTMaterial)
 # reload(PBRTLocator)
+# reload(PBRTInstancer)
+
+
+# DAG node types of the single scene traversal, see collectDagPaths
+DAG_TYPES = ( OpenMaya.MFn.kMesh,
+              OpenMaya.MFn.kInstancer,
+              OpenMaya.MFn.kLight,
+              OpenMaya.MFn.kLocator,
+              OpenMaya.MFn.kCamera )
+
+# DAG node types kept as ExportSession fragments, instancers are always exported
+SESSION_TYPES = ( OpenMaya.MFn.kMesh,
+                  OpenMaya.MFn.kLight,
+                  OpenMaya.MFn.kLocator )
 
 
 class consoleProgress:
@@ -68,8 +97,22 @@ class Exporter:
                  renderWidth,
                  renderHeight,
                  renderCameraName,
-                 verbosity):
-        "basic initialization of member variables"
+                 verbosity,
+                 exportPart = 'all',
+                 animation = None,
+                 staticFileName = None,
+                 topologyCache = None,
+                 session = None):
+        """
+        basic initialization of member variables.
+        exportPart: 'all', or for frame range exports split by SceneAnimation
+        'static' (world contents only, written once) or 'animated' (frame file
+        that includes staticFileName).
+        topologyCache: TopologyCache shared by the frames of a frame range.
+        session: ExportSession of an incremental single frame export, the
+        meshes, lights, locators and materials that did not change since its
+        last export are copied from it.
+        """
         #OpenMaya.MGlobal.displayInfo("initializing exporter " + str(type(sceneFileNameIn)) )
         
         self.sceneFileName = sceneFileName
@@ -78,14 +121,43 @@ class Exporter:
         self.renderHeight = renderHeight
         self.renderCameraName = renderCameraName
         self.verbosity = verbosity
+        self.exportPart = exportPart
+        self.animation = animation
+        self.staticFileName = staticFileName
+        self.topologyCache = topologyCache
+        self.session = session
         
         self.geoFileName = sceneFileName.replace(".pbrt", ".geo.pbrt")
         self.areaLightsFileName = sceneFileName.replace(".pbrt", ".areaLgt.pbrt")
+        
+        # gzip level of the output files, 0 writes plain text
+        self.compressionLevel = cmds.getAttr( 'pbrt_settings.scene_compression_level' )
+        self.compressedFiles = []
+        if self.compressionLevel > 0:
+            self.sceneFileName += '.gz'
+            self.geoFileName += '.gz'
+            self.areaLightsFileName += '.gz'
         sceneFilePathParts = sceneFileName.split( os.altsep ).pop()
         self.sceneFilePath = os.altsep.join(sceneFilePathParts) + os.altsep
         
         self.tempDagPath = OpenMaya.MDagPath()  # temp storage for dagPaths in iterators
         
+        # DAG type -> paths of that type in depth first order, see collectDagPaths
+        self.dagPaths = None
+        # full path name -> visibility of the path, see isVisible
+        self.visiblePaths = {}
+        
+        # Camera.CameraFrustum for culling, set up by exportScene, and the full
+        # paths of the culled nodes
+        self.frustum = None
+        self.cullDistance = 0.0
+        self.culledPaths = set()
+        
+        # ExportReport of this export, set up by doIt, and the shard files
+        # of the geometry
+        self.report = None
+        self.shardFiles = []
+        
         if verbosity>2:
             self.debug = True # displays output on stdout, no file write
             self.dprint("Debug mode. No file would be written", verbosity)
@@ -94,7 +166,37 @@ class Exporter:
     
     def doIt(self):
         """
-        Class entry point. Starts the frame export process.
+        Class entry point. Starts the frame export process, through the
+        ExportProfiler if profiling is on, and writes the ExportReport if
+        reporting is on.
+        """
+        
+        profiler = None
+        if cmds.getAttr( 'pbrt_settings.scene_profile' ) == 1 or ExportProfiler.isEnabledByEnvironment():
+            profiler = ExportProfiler.ExportProfiler()
+        if cmds.getAttr( 'pbrt_settings.scene_report' ) == 1:
+            self.report = ExportReport()
+        
+        PBRTExportModule.setProfiler(profiler)
+        NumberFormat.setFormat( cmds.getAttr( 'pbrt_settings.scene_number_format', asString = True ),
+                                cmds.getAttr( 'pbrt_settings.scene_number_digits' ) )
+        completed = False
+        try:
+            completed = self.exportScene()
+        finally:
+            PBRTExportModule.setProfiler(None)
+            NumberFormat.setFormat()
+            if self.session is not None:
+                self.session.end(completed)
+        
+        if profiler is not None:
+            self.writeProfile(profiler)
+        if self.report is not None and completed:
+            self.writeReport()
+    
+    def exportScene(self):
+        """
+        The frame export process. Returns True once every file is written.
         """
             
         
@@ -106,9 +208,16 @@ class Exporter:
         
         self.log("Starting pbrt export:")
         
+        self.startPhase('traversal')
+        self.collectDagPaths()
+        if self.session is not None:
+            self.session.begin( self.findRenderCamera(),
+                                cmds.getAttr( 'pbrt_settings.scene_cull' ) == 1 or cmds.getAttr( 'pbrt_settings.scene_lod' ) == 1,
+                                cmds.getAttr( 'pbrt_settings.scene_geometry_dedup' ) == 1 )
+        
         if not self.debug:
             try:
-                self.sceneFileHandle    = open(self.sceneFileName, "wb")
+                self.sceneFileHandle    = self.openOutputFile(self.sceneFileName)
             except:
                 OpenMaya.MGlobal.displayError( "Failed to open files for writing\n" )
                 raise
@@ -120,33 +229,49 @@ class Exporter:
         includeFileList = []
         
         
-        self.sceneFileHandle.write( PBRTGlobals.RenderGlobals(self.renderWidth, self.renderHeight, self.imageSaveName).exportStr() )
-        
-        
-        # Output the specified camera.
-        cameraPath = self.findRenderCamera()
-        if not cameraPath:
-            OpenMaya.MGlobal.displayError("Could not find the camera")
-            return
+        # the static part only holds world contents
+        if self.exportPart != 'static':
+            self.startPhase('globals')
+            self.sceneFileHandle.write( PBRTGlobals.RenderGlobals(self.renderWidth, self.renderHeight, self.imageSaveName).exportStr() )
             
-        
-        self.sceneFileHandle.write(PBRTCamera.Camera(cameraPath,self.renderWidth, self.renderHeight).exportStr() )
-        
-        # obtain camera settings and write to file
-        self.dprint( "Camera code: " )
-        self.dprint( self.renderCameraName )
-        self.dprint( "-------------" )
-        
-        if not self.debug:
-            self.sceneFileHandle.write( os.linesep + 'WorldBegin' + os.linesep + os.linesep )
-        
-        self.log("Camera written")
+            
+            # Output the specified camera.
+            self.startPhase('camera')
+            cameraPath = self.findRenderCamera()
+            if not cameraPath:
+                OpenMaya.MGlobal.displayError("Could not find the camera")
+                return False
+                
+            
+            self.sceneFileHandle.write(PBRTCamera.Camera(cameraPath,self.renderWidth, self.renderHeight).exportStr() )
+            
+            # obtain camera settings and write to file
+            self.dprint( "Camera code: " )
+            self.dprint( self.renderCameraName )
+            self.dprint( "-------------" )
+            
+            if not self.debug:
+                self.sceneFileHandle.write( os.linesep + 'WorldBegin' + os.linesep + os.linesep )
+            
+            self.log("Camera written")
 
         # POLYGON MESHES
+        self.startPhase('meshes')
+        self.frustum = self.openFrustum()
         
+        # text formatting of the mesh arrays in worker processes
+        serializerPool = None
+        workers = cmds.getAttr( 'pbrt_settings.scene_export_workers' )
+        if workers > 1:
+            serializerPool = SerializerPool(workers)
+        
+        shapesPerShard = cmds.getAttr( 'pbrt_settings.scene_geometry_shards' )
         if cmds.getAttr( 'pbrt_settings.scene_export_meshes' ) == 1:
             try:        
-                self.meshFileHandle = open(self.geoFileName, "wb")
+                if shapesPerShard > 0:
+                    self.meshFileHandle = self.openShardedOutput(self.geoFileName, shapesPerShard, serializerPool)
+                else:
+                    self.meshFileHandle = self.openOutputFile(self.geoFileName)
             except:
                 OpenMaya.MGlobal.displayError( "Failed to open file %s for writing\n"%self.geoFileName )
                 raise  
@@ -155,42 +280,119 @@ class Exporter:
 
         if cmds.getAttr( 'pbrt_settings.scene_export_arealights' ) == 1:
             try:        
-                self.areaLightsFileHandle = open(self.areaLightsFileName, "wb")
+                self.areaLightsFileHandle = self.openOutputFile(self.areaLightsFileName)
             except:
                 OpenMaya.MGlobal.displayError( "Failed to open file %s for writing\n"%self.areaLightsFileName )
                 raise  
         else:
             self.areaLightsFileHandle = 0      
 
+        if serializerPool is not None:
+            if self.meshFileHandle and shapesPerShard <= 0:
+                self.meshFileHandle = OrderedOutput(self.meshFileHandle, serializerPool)
+            if self.areaLightsFileHandle:
+                self.areaLightsFileHandle = OrderedOutput(self.areaLightsFileHandle, serializerPool)
+        
         # loop through meshes
         areaLightsWereWritten = 0
-        self.exportType( OpenMaya.MFn.kMesh, PBRTMesh.MeshOpt.GeoFactory, "Mesh", (self.meshFileHandle, self.areaLightsFileHandle) )
+        geometryCache = self.openGeometryCache()
+        PBRTMesh.MeshOpt.geometryCache = geometryCache
+        PBRTMesh.MeshOpt.instancedObjects = set()
+        bufferStats = BufferStats()
+        PBRTMesh.MeshOpt.bufferStats = bufferStats
+        levelOfDetail = self.openLevelOfDetail()
+        PBRTMesh.MeshOpt.levelOfDetail = levelOfDetail
+        meshDuplicates = None
+        if cmds.getAttr( 'pbrt_settings.scene_geometry_dedup' ) == 1:
+            meshDuplicates = MeshDuplicates()
+        PBRTMesh.MeshOpt.meshDuplicates = meshDuplicates
+        if self.topologyCache is not None:
+            self.topologyCache.beginFrame()
+        PBRTMesh.MeshOpt.topologyCache = self.topologyCache
+        boundMaterials = BoundMaterials()
+        PBRTMesh.MeshOpt.boundMaterials = boundMaterials
+        if self.report is not None:
+            PBRTMesh.MeshOpt.geometryStats = self.report.geometry
+        try:
+            if meshDuplicates is not None:
+                # the content keys include the level of detail, set up above
+                meshDuplicates.collect( self.dagPaths[OpenMaya.MFn.kMesh], self.isExportedPath, PBRTMesh.MeshOpt.duplicateKeys )
+            self.exportType( OpenMaya.MFn.kMesh, PBRTMesh.MeshOpt.GeoFactory, "Mesh", (self.meshFileHandle, self.areaLightsFileHandle) )
+            self.exportType( OpenMaya.MFn.kInstancer, PBRTInstancer.Instancer.Factory, "Instancer", (self.meshFileHandle, self.areaLightsFileHandle) )
+            if self.exportPart != 'all':
+                self.collectOtherPartMaterials()
+        except:
+            if serializerPool is not None:
+                serializerPool.terminate()
+            if geometryCache is not None:
+                geometryCache.abortPending()
+            raise
+        finally:
+            PBRTMesh.MeshOpt.geometryCache = None
+            PBRTMesh.MeshOpt.meshDuplicates = None
+            PBRTMesh.MeshOpt.instancedObjects = None
+            PBRTMesh.MeshOpt.bufferStats = None
+            PBRTMesh.MeshOpt.levelOfDetail = None
+            PBRTMesh.MeshOpt.topologyCache = None
+            PBRTMesh.MeshOpt.boundMaterials = None
+            PBRTMesh.MeshOpt.geometryStats = None
+        if geometryCache is not None:
+            # blocks formatted by the serializer workers are published now
+            geometryCache.finish()
+            geometryCache.evict()
+            self.log(geometryCache.summary())
+        if meshDuplicates is not None:
+            self.log(meshDuplicates.summary())
+        if bufferStats.totalVertices:
+            self.log(bufferStats.summary())
+        if levelOfDetail is not None:
+            self.log(levelOfDetail.summary())
+        if self.topologyCache is not None:
+            self.log(self.topologyCache.summary())
         if self.meshFileHandle:
             self.meshFileHandle.close()
+            if shapesPerShard > 0:
+                self.log(self.meshFileHandle.summary())
+                self.shardFiles = [self.meshFileHandle.shardPath(shardName) for shardName in self.meshFileHandle.shardNames]
         if self.areaLightsFileHandle:
             areaLightsWereWritten = self.areaLightsFileHandle.tell() 
             self.areaLightsFileHandle.close()
+        if serializerPool is not None:
+            serializerPool.close()
         
         includeFileList.append(self.geoFileName)
         includeFileList.append(self.areaLightsFileName)
         
         
         # MATERIALS        
+        self.startPhase('materials')
         if cmds.getAttr( 'pbrt_settings.scene_export_materials' ) == 1:
-            self.exportType( OpenMaya.MFn.kDependencyNode, PBRTMaterial.Material.MaterialFactory, "Material" )
+            self.exportMaterials( boundMaterials )
                             
+        # frame file of a split export: the static part follows the animated materials
+        if self.exportPart == 'animated':
+            self.sceneFileHandle.write( 'Include "' + self.staticFileName + '"' + os.linesep + os.linesep )
+        
         
         # loop though lights
+        self.startPhase('lights')
         if cmds.getAttr( 'pbrt_settings.scene_export_lights' ) == 1:
             exportedLights = self.exportType( OpenMaya.MFn.kLight, PBRTLight.Light.LightFactory, "Light" ) 
             if 0==exportedLights \
+            and self.exportPart != 'animated' \
+            and (self.animation is None or not self.animation.hasAnimatedLights) \
             and cmds.getAttr( 'pbrt_settings.scene_export_defaultLighting' ) == 1 \
             and areaLightsWereWritten==0:
                 self.sceneFileHandle.write( PBRTLight.Light.defaultLighting())
         
+        self.startPhase('locators')
         self.exportType( OpenMaya.MFn.kLocator, PBRTLocator.Locator.Factory, "Locator" )
+        
+        if self.frustum is not None:
+            self.log("Frustum culling: %i shapes culled" % len(self.culledPaths))
 
         # WRITE INCLUDES IF EXTERNAL FILES EXIST
+        self.startPhase('includes')
         
         for includeFile in includeFileList:
             if os.path.exists(includeFile):
@@ -202,76 +404,438 @@ class Exporter:
         self.log("Closing files")
         
         if not self.debug:
-            self.sceneFileHandle.write( os.linesep + 'WorldEnd' )
+            if self.exportPart != 'static':
+                self.sceneFileHandle.write( os.linesep + 'WorldEnd' )
             self.sceneFileHandle.close()
+        
+        for compressedFile in self.compressedFiles:
+            self.log(compressedFile.summary())
+        if self.session is not None:
+            self.log(self.session.summary())
             
         self.log("Export complete")
         self.dprint("File written: %s"%self.sceneFileName)
+        if self.report is not None:
+            self.report.finish()
+        return True
          
     
+    def writeProfile(self, profiler):
+        """
+        Log the time per module type, write the per node report and the
+        cProfile stats next to the scene file.
+        """
+        
+        for line in profiler.summary():
+            self.log(line)
+        
+        baseName = self.reportBaseName()
+        profiler.writeReport(baseName + '.profile.txt')
+        profiler.dumpStats(baseName + '.prof')
+        self.log("Profile written to %s.prof" % baseName)
+    
+    def writeReport(self):
+        """
+        Write the ExportReport next to the scene file, with the sizes of the
+        files of this export.
+        """
+        
+        for fileName in [self.sceneFileName, self.geoFileName, self.areaLightsFileName] + self.shardFiles:
+            self.report.addFile(fileName)
+        for compressedFile in self.compressedFiles:
+            fileName = compressedFile.name
+            if fileName.endswith('.tmp'):
+                # shards are written under a temporary name, see ShardedOutput.closeShard
+                fileName = fileName[:-len('.tmp')]
+            self.report.addCompressedFile(fileName, compressedFile.bytesIn, compressedFile.bytesOut)
+        self.report.info['scene'] = self.sceneFileName
+        self.report.info['exportPart'] = self.exportPart
+        if self.session is not None:
+            self.report.info['session'] = { 'full': self.session.exportFull,
+                                            'rewritten': self.session.rewritten,
+                                            'reused': self.session.reused }
+        
+        reportFileName = self.reportBaseName() + '.report.json'
+        self.report.write(reportFileName)
+        self.log("Report written to %s" % reportFileName)
+    
+    def reportBaseName(self):
+        """
+        The scene file name without extensions, for the files that go next to it.
+        """
+        
+        baseName = self.sceneFileName
+        if baseName.endswith('.gz'):
+            baseName = baseName[:-3]
+        return os.path.splitext(baseName)[0]
+    
+    def startPhase(self, name):
+        if self.report is not None:
+            self.report.startPhase(name)
+    
+    def openOutputFile(self, fileName):
+        """
+        Open one of the output files for writing, through a GzipWriter if
+        compression is on.
+        """
+        
+        if self.compressionLevel > 0:
+            outputFile = GzipWriter(fileName, self.compressionLevel)
+            self.compressedFiles.append(outputFile)
+            return outputFile
+        return open(fileName, "wb")
+    
+    def openShardedOutput(self, fileName, shapesPerShard, serializerPool):
+        """
+        The geometry output split into shard files of shapesPerShard shapes,
+        fileName becomes the index that includes them.
+        """
+        
+        def openFile(shardFileName):
+            if self.compressionLevel > 0:
+                shardFile = GzipWriter(shardFileName, self.compressionLevel)
+                self.compressedFiles.append(shardFile)
+                return shardFile
+            return open(shardFileName, "wb")
+        
+        wrapFile = None
+        if serializerPool is not None:
+            wrapFile = lambda shardFile: OrderedOutput(shardFile, serializerPool)
+        
+        extension = '.pbrt'
+        if self.compressionLevel > 0:
+            extension += '.gz'
+        return ShardedOutput(fileName, shapesPerShard, openFile, wrapFile, extension)
+    
+    def openGeometryCache(self):
+        """
+        The persistent geometry cache, if it is enabled in pbrt_settings.
+        """
+        
+        if cmds.getAttr( 'pbrt_settings.scene_geometry_cache' ) != 1:
+            return None
+        
+        cacheDir = cmds.getAttr( 'pbrt_settings.scene_geometry_cache_path' )
+        if not cacheDir:
+            cacheDir = os.path.join( cmds.getAttr( 'pbrt_settings.scene_path' ), 'geocache' )
+        maxBytes = cmds.getAttr( 'pbrt_settings.scene_geometry_cache_size' ) * 1048576
+        
+        try:
+            return GeometryCache(cacheDir, maxBytes)
+        except OSError:
+            OpenMaya.MGlobal.displayWarning( "Can not use geometry cache %s, exporting without it" % cacheDir )
+            return None
+    
+    def openLevelOfDetail(self):
+        """
+        MeshDecimator.LevelOfDetail for the render camera, if pbrt_settings.scene_lod
+        is on, None otherwise. Like culling, not used for the static part of a
+        split export, nor with an environment camera: its image is not a
+        perspective projection, see Camera.CameraProjection.
+        """
+        
+        if cmds.getAttr( 'pbrt_settings.scene_lod' ) != 1 or self.exportPart == 'static':
+            return None
+        if not MeshDecimator.isAvailable():
+            OpenMaya.MGlobal.displayWarning( "Level of detail needs numpy, exporting full meshes" )
+            return None
+        cameraPath = self.findRenderCamera()
+        if not cameraPath:
+            OpenMaya.MGlobal.displayWarning( "Level of detail needs the render camera, exporting full meshes" )
+            return None
+        if PBRTCamera.isEnvironmentCamera(cameraPath):
+            OpenMaya.MGlobal.displayWarning( "Level of detail does not support the environment camera, exporting full meshes" )
+            return None
+        
+        projection = PBRTCamera.CameraProjection(cameraPath, self.renderWidth, self.renderHeight)
+        return MeshDecimator.LevelOfDetail( projection, cmds.getAttr( 'pbrt_settings.scene_lod_pixels' ) )
+    
+    def openFrustum(self):
+        """
+        Camera.CameraFrustum of the render camera, if pbrt_settings.scene_cull is
+        on, None otherwise. The static part of a split export is used by every
+        frame and is never culled, nor is anything an environment camera sees.
+        """
+        
+        self.culledPaths = set()
+        if cmds.getAttr( 'pbrt_settings.scene_cull' ) != 1 or self.exportPart == 'static':
+            return None
+        cameraPath = self.findRenderCamera()
+        if not cameraPath:
+            OpenMaya.MGlobal.displayWarning( "Frustum culling needs the render camera, exporting everything" )
+            return None
+        if PBRTCamera.isEnvironmentCamera(cameraPath):
+            OpenMaya.MGlobal.displayWarning( "The environment camera sees every direction, exporting everything" )
+            return None
+        
+        self.cullDistance = cmds.getAttr( 'pbrt_settings.scene_cull_keep_distance' )
+        return PBRTCamera.CameraFrustum(cameraPath, self.renderWidth, self.renderHeight, cmds.getAttr( 'pbrt_settings.scene_cull_margin' ))
+    
     def findRenderCamera(self):
-        cameraItDag = OpenMaya.MItDag(OpenMaya.MItDag.kDepthFirst, OpenMaya.MFn.kCamera)
         
-        while not cameraItDag.isDone():
-            cameraItDag.getPath(self.tempDagPath)
-            currCamName = OpenMaya.MFnDagNode(self.tempDagPath.transform()).partialPathName()
-            if ((currCamName == self.renderCameraName) or (self.renderCameraName == self.tempDagPath.partialPathName())):
-                return self.tempDagPath
-            cameraItDag.next()
+        if self.dagPaths is None:
+            self.collectDagPaths()
+        for cameraPath in self.dagPaths[OpenMaya.MFn.kCamera]:
+            currCamName = OpenMaya.MFnDagNode(cameraPath.transform()).partialPathName()
+            if ((currCamName == self.renderCameraName) or (self.renderCameraName == cameraPath.partialPathName())):
+                return cameraPath
         
         return 0
+    
+    def collectDagPaths(self):
+        """
+        Walk the DAG once and sort every path into the DAG_TYPES it has,
+        instead of one MItDag pass per type. The paths of each type keep the
+        depth first order of a MItDag filtered on that type, so the output
+        order does not change.
+        """
+        
+        self.dagPaths = {}
+        for objType in DAG_TYPES:
+            self.dagPaths[objType] = []
+        
+        itDag = OpenMaya.MItDag(OpenMaya.MItDag.kDepthFirst, OpenMaya.MFn.kInvalid)
+        while not itDag.isDone():
+            node = itDag.currentItem()
+            dagPath = None
+            for objType in DAG_TYPES:
+                if node.hasFn(objType):
+                    if dagPath is None:
+                        dagPath = OpenMaya.MDagPath()
+                        itDag.getPath(dagPath)
+                    self.dagPaths[objType].append(dagPath)
+            itDag.next()
         
 
     def exportType(self, objType, objModule, logType, theFileHandle = "_undefined"):
         """
-        Here we iterate over the specified object type, calling the specified
-        export module to handle it, and do the output :)
-        Shame we need a different iterator for materials, and some other objects.
+        Here we iterate over the specified object type (one of DAG_TYPES, from
+        collectDagPaths), calling the specified export module to handle it,
+        and do the output :)
         """
         
         if theFileHandle == "_undefined":
             theFileHandle = self.sceneFileHandle
         self.log("Exporting " + logType + " objects...")
-        itDn = 0
-        isDag = False
-        if objType==OpenMaya.MFn.kDependencyNode:
-            #create Dg iterator
-            itDn = OpenMaya.MItDependencyNodes( OpenMaya.MFn.kDependencyNode )
-        else:
-            #create Dag iterator
-            itDn = OpenMaya.MItDag(OpenMaya.MItDag.kDepthFirst, objType )
-            isDag = True
+        if self.dagPaths is None:
+            self.collectDagPaths()
         #self.mComputation.beginComputation()
         exported = 0
-            
-        while not itDn.isDone():
+        
+        for dagPath in self.dagPaths[objType]:
             #if self.mComputation.isInterruptRequested(): break
             if self.mProgress.isCancelled(): break
-            nodeName = ''
-            
-            expModule = False
-            if isDag:
-                itDn.getPath(self.tempDagPath)
-                theNode = OpenMaya.MFnDagNode(self.tempDagPath)
-                nodeName = theNode.name()
-                if self.isVisible(theNode):
-                    expModule = objModule(theFileHandle, self.tempDagPath)
-            else:
-                theNode = OpenMaya.MFnDependencyNode( itDn.thisNode() )
-                nodeName = theNode.name()
-                expModule = objModule(theFileHandle, theNode)
-            if expModule !=False:
-                expOut = expModule.loadModule()
-                self.dprint( "Found "+logType+": "+nodeName )
-                self.dprint( expOut ,2)
-                self.dprint( "------------",2 )
-                exported += 1
-                #if not self.debug:
-                #    expModule.writeTo( theFileHandle )
-            itDn.next()
+            if self.session is not None and objType in SESSION_TYPES:
+                if self.exportSessionPath(dagPath, objModule, logType, theFileHandle):
+                    exported += 1
+            elif self.isExportedPath(dagPath):
+                # modules may extend the path to the shape, keep the collected one
+                self.tempDagPath = OpenMaya.MDagPath(dagPath)
+                expModule = objModule(theFileHandle, self.tempDagPath)
+                if self.runModule(expModule, OpenMaya.MFnDagNode(dagPath).name(), logType):
+                    exported += 1
+        self.log("...done")
+        return exported
+    
+    def exportMaterials(self, boundMaterials):
+        """
+        Write a material for every surface shader bound to the exported
+        geometry (ExportModule.BoundMaterials), instead of looking at every
+        DG node of the scene. Shaders nothing uses are not written.
+        """
+        
+        self.log("Exporting Material objects...")
+        exported = 0
+        for shaderNode in boundMaterials.shaders:
+            if self.mProgress.isCancelled(): break
+            nodeName = shaderNode.name()
+            if self.session is not None:
+                if self.exportSessionMaterial(shaderNode):
+                    exported += 1
+            elif self.isInExportPart(nodeName):
+                if self.runModule(PBRTMaterial.Material.MaterialFactory(self.sceneFileHandle, shaderNode), nodeName, "Material"):
+                    exported += 1
         self.log("...done")
         return exported
     
+    def exportSessionPath(self, dagPath, objModule, logType, theFileHandle):
+        """
+        exportType for one path of an incremental export: copy the fragment of
+        the last export if none of its nodes changed, otherwise run the module
+        and keep its output as the new fragment.
+        """
+        
+        fileHandles = theFileHandle
+        if not isinstance(fileHandles, tuple):
+            fileHandles = (theFileHandle,)
+        shapePath = dagPath.fullPathName()
+        name = fragmentName(logType, shapePath)
+        
+        # ShardedOutput starts its shards at shapes, see MeshOpt.getOutput_real
+        shapeBegun = False
+        fragment = self.session.reusable(name)
+        if fragment is not None:
+            if fragment.key is None:
+                return False
+            fileHandle = fileHandles[fragment.role]
+            if hasattr(fileHandle, 'beginShape'):
+                fileHandle.beginShape(shapePath)
+                shapeBegun = True
+            if self.session.copyFragment(fragment, fileHandle):
+                self.rebindMaterials(fragment.shaders)
+                return True
+        
+        dependencies = self.session.dagDependencies(dagPath)
+        expModule = False
+        if self.isExportedPath(dagPath):
+            self.tempDagPath = OpenMaya.MDagPath(dagPath)
+            expModule = objModule(theFileHandle, self.tempDagPath)
+        if expModule == False:
+            self.session.skip(name, dependencies)
+            return False
+        
+        if not shapeBegun and hasattr(expModule.fileHandle, 'beginShape'):
+            expModule.fileHandle.beginShape(shapePath)
+        self.runFragment(name, expModule, fileHandles, dependencies, OpenMaya.MFnDagNode(dagPath).name(), logType)
+        return True
+    
+    def exportSessionMaterial(self, shaderNode):
+        """
+        exportMaterials for one shader of an incremental export, see
+        exportSessionPath.
+        """
+        
+        name = fragmentName("Material", shaderNode.name())
+        fragment = self.session.reusable(name)
+        if fragment is not None:
+            if fragment.key is None:
+                return False
+            if self.session.copyFragment(fragment, self.sceneFileHandle):
+                return True
+        
+        dependencies = [ self.session.trackNode(shaderNode.object()) ]
+        expModule = PBRTMaterial.Material.MaterialFactory(self.sceneFileHandle, shaderNode)
+        if expModule == False:
+            self.session.skip(name, dependencies)
+            return False
+        
+        self.runFragment(name, expModule, (self.sceneFileHandle,), dependencies, shaderNode.name(), "Material")
+        return True
+    
+    def runFragment(self, name, expModule, fileHandles, dependencies, nodeName, logType):
+        """
+        Run expModule through a session writer, which keeps what it writes as
+        the fragment name. The shaders it binds are recorded with it.
+        """
+        
+        fileHandle = expModule.fileHandle
+        role = 0
+        for i in range(len(fileHandles)):
+            if fileHandles[i] is fileHandle:
+                role = i
+        writer = self.session.writer(name, fileHandle)
+        expModule.fileHandle = writer
+        
+        boundMaterials = PBRTMesh.MeshOpt.boundMaterials
+        shaders = []
+        if boundMaterials is not None:
+            boundMaterials.recorded = shaders
+        try:
+            self.runModule(expModule, nodeName, logType)
+        except:
+            writer.abort()
+            raise
+        finally:
+            if boundMaterials is not None:
+                boundMaterials.recorded = None
+        self.session.record(name, writer, role, dependencies, shaders)
+    
+    def rebindMaterials(self, shaderNames):
+        """
+        Add the shaders of a copied fragment to the BoundMaterials of the
+        export, as if its module had run.
+        """
+        
+        boundMaterials = PBRTMesh.MeshOpt.boundMaterials
+        if boundMaterials is None:
+            return
+        for shaderName in shaderNames:
+            selection = OpenMaya.MSelectionList()
+            selection.add(shaderName)
+            shaderObject = OpenMaya.MObject()
+            selection.getDependNode(0, shaderObject)
+            boundMaterials.add( OpenMaya.MFnDependencyNode(shaderObject) )
+    
+    def collectOtherPartMaterials(self):
+        """
+        In a split export, a material belongs to the part it is animated in,
+        not to the part of the meshes it is bound to. Find the shaders of the
+        visible meshes of the other part too.
+        """
+        
+        for dagPath in self.dagPaths[OpenMaya.MFn.kMesh]:
+            if self.isInExportPart(dagPath.fullPathName()) or not self.isVisible(dagPath):
+                continue
+            meshExporter = PBRTMesh.MeshOpt( (0, 0), OpenMaya.MDagPath(dagPath) )
+            for iSet in range(meshExporter.setCount):
+                meshExporter.findSurfaceShader(meshExporter.instanceNum, iSet)
+    
+    def runModule(self, expModule, nodeName, logType):
+        """
+        Run the export module a factory returned, False if it declined the node.
+        """
+        
+        if expModule == False:
+            return False
+        start = time.time()
+        expOut = expModule.loadModule()
+        if self.report is not None:
+            self.report.addNode(logType, nodeName, time.time() - start)
+        self.dprint( "Found "+logType+": "+nodeName )
+        self.dprint( expOut ,2)
+        self.dprint( "------------",2 )
+        return True
+    
+    
+    def isExportedPath(self, dagPath):
+        """
+        Is the DAG node at dagPath visible and part of this export.
+        """
+        
+        return self.isVisible(dagPath) and self.isInExportPart(dagPath.fullPathName()) and not self.isCulled(dagPath)
+    
+    def isCulled(self, dagPath):
+        """
+        Is the mesh at dagPath outside of the camera frustum and further than
+        scene_cull_keep_distance from the camera (closer ones may still cast
+        shadows or show in reflections). Lights are never culled: wherever
+        they are, they light the visible geometry.
+        """
+        
+        if self.frustum is None:
+            return False
+        if not dagPath.hasFn(OpenMaya.MFn.kMesh):
+            return False
+        
+        bounds = OpenMaya.MFnDagNode(dagPath).boundingBox()
+        bounds.transformUsing( dagPath.inclusiveMatrix() )
+        if self.frustum.intersects(bounds):
+            return False
+        if self.cullDistance > 0 and self.frustum.distance(bounds) <= self.cullDistance:
+            return False
+        
+        self.culledPaths.add( dagPath.fullPathName() )
+        return True
+    
+    def isInExportPart(self, key):
+        """
+        Is the node with the given key (DAG full path or DG node name) part of
+        what this export writes, see exportPart.
+        """
+        
+        if self.exportPart == 'all':
+            return True
+        return self.animation.isAnimated(key) == (self.exportPart == 'animated')
     
     def log(self, string):
         """
@@ -281,21 +845,43 @@ class Exporter:
         self.mProgress.setProgressStatus(string)
     
         
-    def isVisible(self, fnDag):
+    def isVisible(self, dagPath):
         """
-        Detect if the given fnDag is visible. (Also checks fnDag's parents.)
+        Detect if the node at dagPath is visible: the node and every ancestor
+        along this path. Results are kept per path, so ancestors shared by many
+        nodes are evaluated once per export, and every instance path of a
+        node is resolved through its own parents.
+        """
+        
+        key = dagPath.fullPathName()
+        visible = self.visiblePaths.get(key)
+        if visible is not None:
+            return visible
+        
+        visible = self.isNodeVisible( OpenMaya.MFnDagNode(dagPath) )
+        if visible and dagPath.length() > 1:
+            parentPath = OpenMaya.MDagPath(dagPath)
+            parentPath.pop()
+            visible = self.isVisible(parentPath)
+        
+        self.visiblePaths[key] = visible
+        return visible
+    
+    def isNodeVisible(self, fnDag):
+        """
+        Detect if the given fnDag itself is visible, without its parents.
         """
-        visible = True
         
         if fnDag.isIntermediateObject():
-            visible = False
+            return False
         
         try:
             visPlug = fnDag.findPlug("visibility")
-            visible = visPlug.asBool()
+            if not visPlug.asBool():
+                return False
         except:
             OpenMaya.MGlobal.displayError("MPlug.asBool")
-            visible = False
+            return False
         
         try:
             dOPlug = fnDag.findPlug("drawOverride")
@@ -303,20 +889,16 @@ class Exporter:
             # ignore object is in template or reference layer
             normalDisplayPlug = dOPlug.child(0)
             if normalDisplayPlug.asInt() != 0:
-                visible = False
+                return False
             
             # ignore object if later is not visible
             layerVisiblePlug = dOPlug.child(6)
             if layerVisiblePlug.asInt() == 0:
-                visible = False
+                return False
         except:
             pass # this is an optional override, so forget about it if it doesn't exist
         
-        parentCount = fnDag.parentCount()
-        if parentCount > 0 and visible:
-            visible = self.isVisible( OpenMaya.MFnDagNode(fnDag.parent(0)) )
-        
-        return visible
+        return True
     
     def dprint(self, string, verbosity=1):
         if verbosity <= self.verbosity:
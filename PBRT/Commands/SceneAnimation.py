@@ -0,0 +1,186 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter for Maya 2013
+#
+# This file is licensed under the GPL
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Finds the nodes whose exported output can change over a frame range, so that
+# pbrtbatch can write everything else once into a static include file.
+#
+# ------------------------------------------------------------------------------
+
+from maya import OpenMaya
+
+
+class SceneAnimation:
+    """
+    A node is animated if it, one of its DAG parents, or anything upstream of
+    them in the dependency graph is time dependent: anim curves, the time node,
+    expressions. Upstream DAG nodes (joints, deformer handles, constraint
+    targets) are checked with their own parents. The test is conservative, a
+    node that is not animated can end up in the animated part, not the other
+    way round.
+    """
+
+    timeDependentTypes = ( OpenMaya.MFn.kAnimCurve,
+                           OpenMaya.MFn.kTime,
+                           OpenMaya.MFn.kExpression )
+
+    def __init__(self):
+        self.animatedKeys = set()
+        self.nodeAnimated = {}
+        self.nodeCount = 0
+        self.hasAnimatedLights = False
+
+    def nodeKey(self, mObject):
+        """
+        DAG nodes by full path (names need not be unique), DG nodes by name.
+        """
+        if mObject.hasFn( OpenMaya.MFn.kDagNode ):
+            return OpenMaya.MFnDagNode( mObject ).fullPathName()
+        return OpenMaya.MFnDependencyNode( mObject ).name()
+
+    def isNodeAnimated(self, mObject):
+        """
+        Is this node time dependent, through its own anim curves or through its
+        upstream graph. Memoized per node.
+        """
+
+        key = self.nodeKey( mObject )
+        if key in self.nodeAnimated:
+            return self.nodeAnimated[key]
+        # not animated while it is being evaluated, this breaks cycles
+        self.nodeAnimated[key] = False
+
+        animated = OpenMaya.MAnimUtil.isAnimated( mObject )
+
+        if not animated:
+            itDg = OpenMaya.MItDependencyGraph( mObject,
+                                                OpenMaya.MFn.kInvalid,
+                                                OpenMaya.MItDependencyGraph.kUpstream,
+                                                OpenMaya.MItDependencyGraph.kDepthFirst,
+                                                OpenMaya.MItDependencyGraph.kNodeLevel )
+            while not itDg.isDone():
+                upstream = itDg.currentItem()
+                for timeDependentType in self.timeDependentTypes:
+                    if upstream.hasFn( timeDependentType ):
+                        animated = True
+                if not animated and upstream.hasFn( OpenMaya.MFn.kDagNode ) and upstream != mObject:
+                    upstreamPath = OpenMaya.MDagPath()
+                    OpenMaya.MDagPath.getAPathTo( upstream, upstreamPath )
+                    animated = self.isPathAnimated( upstreamPath )
+                if animated:
+                    break
+                itDg.next()
+
+        self.nodeAnimated[key] = animated
+        return animated
+
+    def isPathAnimated(self, dagPath):
+        """
+        Is any node of the given DAG path animated.
+        """
+
+        dagPath = OpenMaya.MDagPath( dagPath )
+        while dagPath.length() > 0:
+            if self.isNodeAnimated( dagPath.node() ):
+                return True
+            dagPath.pop()
+        return False
+
+    def isAreaLightAnimated(self, dagPath):
+        """
+        Area lights are written with the mesh, with the parameters of its
+        pbrtAreaLightMaterial. Returns (hasAreaLight, isAnimated).
+        """
+
+        fShape = OpenMaya.MFnMesh( dagPath )
+        shadingGroups = OpenMaya.MObjectArray()
+        faceIndices = OpenMaya.MIntArray()
+        fShape.getConnectedShaders( dagPath.instanceNumber(), shadingGroups, faceIndices )
+
+        hasAreaLight = False
+        animated = False
+        for i in range( shadingGroups.length() ):
+            surfaceShader = OpenMaya.MFnDependencyNode( shadingGroups[i] ).findPlug( "surfaceShader" )
+            materials = OpenMaya.MPlugArray()
+            surfaceShader.connectedTo( materials, True, False )
+            if materials.length() == 0:
+                continue
+            material = materials[0].node()
+            if OpenMaya.MFnDependencyNode( material ).typeName() == "pbrtAreaLightMaterial":
+                hasAreaLight = True
+                animated = animated or self.isNodeAnimated( material )
+        return hasAreaLight, animated
+
+    def collectType(self, objType):
+        """
+        Full paths of the animated DAG paths of the given type. All the paths of
+        an instanced shape go to the same part, they share one ObjectBegin.
+        """
+
+        dagPath = OpenMaya.MDagPath()
+        itDag = OpenMaya.MItDag( OpenMaya.MItDag.kDepthFirst, objType )
+
+        pathsByShape = {}
+        animatedShapes = set()
+        while not itDag.isDone():
+            itDag.getPath( dagPath )
+            self.nodeCount += 1
+
+            animated = self.isPathAnimated( dagPath )
+            if objType == OpenMaya.MFn.kMesh:
+                hasAreaLight, areaLightAnimated = self.isAreaLightAnimated( dagPath )
+                animated = animated or areaLightAnimated
+                if animated and hasAreaLight:
+                    self.hasAnimatedLights = True
+            elif objType == OpenMaya.MFn.kLight and animated:
+                self.hasAnimatedLights = True
+
+            shapeKey = self.nodeKey( dagPath.node() )
+            pathsByShape.setdefault( shapeKey, [] ).append( dagPath.fullPathName() )
+            if animated:
+                animatedShapes.add( shapeKey )
+            itDag.next()
+
+        for shapeKey in animatedShapes:
+            self.animatedKeys.update( pathsByShape[shapeKey] )
+
+    def collectMaterials(self):
+        """
+        Names of the animated surface shaders.
+        """
+
+        itDn = OpenMaya.MItDependencyNodes( OpenMaya.MFn.kDependencyNode )
+        while not itDn.isDone():
+            mObject = itDn.thisNode()
+            dpNode = OpenMaya.MFnDependencyNode( mObject )
+            if dpNode.classification( dpNode.typeName() ).find( "shader/surface" ) != -1:
+                self.nodeCount += 1
+                if self.isNodeAnimated( mObject ):
+                    self.animatedKeys.add( dpNode.name() )
+            itDn.next()
+
+    def collect(self):
+        """
+        Evaluate every node the Exporter writes out.
+        """
+
+        self.collectType( OpenMaya.MFn.kMesh )
+        self.collectType( OpenMaya.MFn.kInstancer )
+        self.collectType( OpenMaya.MFn.kLight )
+        self.collectType( OpenMaya.MFn.kLocator )
+        self.collectMaterials()
+
+    def isAnimated(self, key):
+        """
+        key: full path name of a DAG path, or name of a material node.
+        """
+        return key in self.animatedKeys
+
+    def summary(self):
+        return '%i of %i exported nodes are animated' % ( len(self.animatedKeys), self.nodeCount )
@@ -69,6 +69,10 @@ class mainMenu:
         cmds.select('pbrt_settings')       
         
 
+    def resetExportSession(self,*args):
+        import ExportSession
+        ExportSession.stop()
+
     def createNewTextObject(self,*args):
         textObject = cmds.createNode('pbrtTextObject')
         parentTransform = cmds.listRelatives(textObject, allParents=True)[0]
@@ -85,6 +89,7 @@ class mainMenu:
         pbrtMenu = mMenu(label = 'PBRT', parent = gMainWindow, tearOff = True )
         pbrtMenu.addItem( label = "Export and Render" , command =self.exportAndRender  )
         pbrtMenu.addItem( label = "Render Globals" , command = self.makeRenderSettings )
+        pbrtMenu.addItem( label = "Reset Export Session" , command = self.resetExportSession )
         pbrtMenu.addItem( label = "Create Text Object" , command = self.createNewTextObject )
 
         pbrtMenu.end()
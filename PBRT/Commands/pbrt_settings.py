@@ -156,6 +156,41 @@ class pbrt_settings:
         self.addBool(ln = 'scene_export_lights' , dv = 1)
         self.addBool(ln = 'scene_export_materials' , dv = 1)
         self.addBool(ln = 'scene_export_defaultLighting' , dv = 1)
+        # trianglemesh: text arrays in the .geo.pbrt file, plymesh: binary .ply file per mesh set
+        self.addEnum(ln = 'scene_mesh_format', options = 'trianglemesh:plymesh', dv = 0)
+        # reuse unchanged geometry blocks from earlier exports, cache size in MB (empty path: <scene_path>/geocache)
+        self.addBool(ln = 'scene_geometry_cache' , dv = 0)
+        self.addString(ln = 'scene_geometry_cache_path', dv = '')
+        self.addLong(ln = 'scene_geometry_cache_size', dv = 4096)
+        # worker processes formatting the mesh arrays as text, 0 or 1: format in Maya
+        self.addShort(ln = 'scene_export_workers', dv = 0)
+        # gzip the scene, geometry and area light files (1-9), 0: plain text. The renderer has to read .pbrt.gz
+        self.addShort(ln = 'scene_compression_level', dv = 0)
+        # split the geometry file into include files of this many shapes, 0: one file. Unchanged shards are not rewritten
+        self.addShort(ln = 'scene_geometry_shards', dv = 0)
+        # write identical meshes (copies, not Maya instances) once and place them with ObjectInstance
+        self.addBool(ln = 'scene_geometry_dedup', dv = 0)
+        # time every export module and write a cProfile file next to the scene (also env PBRT_EXPORT_PROFILE=1)
+        self.addBool(ln = 'scene_profile', dv = 0)
+        # decimate meshes that are smaller than scene_lod_pixels in the image, per mesh override: pbrtLodRatio attribute
+        self.addBool(ln = 'scene_lod', dv = 0)
+        self.addFloat(ln = 'scene_lod_pixels', dv = 64)
+        # skip meshes outside of the camera frustum (widened by the margin, a fraction of the image),
+        # unless they are closer to the camera than the keep distance (0: no distance rule); lights are always exported
+        self.addBool(ln = 'scene_cull', dv = 0)
+        self.addFloat(ln = 'scene_cull_margin', dv = 0.1)
+        self.addFloat(ln = 'scene_cull_keep_distance', dv = 0)
+        # leave out uvs of meshes whose material uses no textures, and normals of flat shaded meshes
+        self.addBool(ln = 'scene_strip_attributes', dv = 0)
+        # float format of the scene files: fixed (%f with n digits), general (%g with n digits), shortest (reads back to the same single float)
+        self.addEnum(ln = 'scene_number_format', options = 'fixed:general:shortest', dv = 0)
+        self.addShort(ln = 'scene_number_digits', dv = 6)
+        # frame ranges: keep the triangulation of every mesh set and only gather new points and normals while its topology does not change
+        self.addBool(ln = 'scene_topology_cache', dv = 0)
+        # single frames: keep the output of every node and only export the nodes that changed since the last export of this Maya session
+        self.addBool(ln = 'scene_incremental', dv = 0)
+        # write a JSON report of every export next to its scene file (time per phase and node, triangles, file sizes), and one for the batch
+        self.addBool(ln = 'scene_report', dv = 0)
         
         
         # Camera settings
@@ -256,6 +291,8 @@ class pbrt_settings:
         # Process settings
         self.addBool  ( ln = 'render_launch', dv=True )
         self.addBool  ( ln = 'render_animation' )
+        # frame ranges: write the nodes that are not animated once, into <scene_filename>.static.pbrt
+        self.addBool  ( ln = 'render_animation_static' )
         #self.addBool  ( ln = 'render_animation_sequence' )
         
         self.addString( ln = "extra_commands",dv="")
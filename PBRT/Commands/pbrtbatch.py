@@ -26,6 +26,12 @@ import pbrt_settings
 reload(pbrt_settings)
 import Exporter
 reload(Exporter)
+import SceneAnimation
+reload(SceneAnimation)
+# not reloaded, the session and its callbacks live as long as Maya
+import ExportSession
+from PBRT.ExportModules.TopologyCache import TopologyCache
+from PBRT.ExportModules import ExportReport
 
 def getPbrtExe(pbrtSearchPathVar):
     'Utility proc that builds up a path to pbrt executable'
@@ -123,27 +129,51 @@ class pbrtbatch(OpenMayaMPx.MPxCommand):
 
 
         fileList = []
+        # (frame, ExportReport document) of every export, see writeBatchReport
+        self.frameReports = []
 
         self.showProgressWindow()
 
         if self.startFrame == self.endFrame:
-            # single frame export
-            fileList.append( self.exportFile(self.startFrame) )
+            # single frame export, incremental if a session is kept
+            session = None
+            if cmds.getAttr( 'pbrt_settings.scene_incremental' ) == 1:
+                session = ExportSession.current( os.path.join( cmds.getAttr( 'pbrt_settings.scene_path' ), 'session' ) )
+            else:
+                ExportSession.stop()
+            fileList.append( self.exportFile(self.startFrame, session = session) )
             self.mProgress.advanceProgress(1)
         else:
             # frame range export
             ct = cmds.currentTime( query = True )
             import time
+            
+            # nodes that do not change over the range are written once
+            animation = None
+            staticFileName = None
+            if cmds.getAttr( 'pbrt_settings.render_animation_static' ) == 1:
+                cmds.currentTime( int(self.startFrame) )
+                animation = SceneAnimation.SceneAnimation()
+                animation.collect()
+                OpenMaya.MGlobal.displayInfo( 'PBRT: %s' % animation.summary() )
+                staticFileName = self.exportStatic( animation )
+            
+            # triangulations reused from frame to frame
+            topologyCache = None
+            if cmds.getAttr( 'pbrt_settings.scene_topology_cache' ) == 1:
+                topologyCache = TopologyCache()
+            
             for f in range(int(self.startFrame), int(self.endFrame)+1, int(self.stepFrame)):
                 self.mProgress.setTitle( 'Frames %i - %i: %i' % (int(self.startFrame), int(self.endFrame), f) )
                 cmds.currentTime( f )
                 time.sleep(.1)
-                fileList.append( self.exportFile(f) )
+                fileList.append( self.exportFile(f, animation = animation, staticFileName = staticFileName, topologyCache = topologyCache) )
                 self.mProgress.advanceProgress(1)
                 if self.mProgress.isCancelled(): break
 
             cmds.currentTime( ct )
 
+        self.writeBatchReport()
         self.makeBatchFile(fileList)
         doRender  = cmds.getAttr( 'pbrt_settings.render_launch' )
         if  doRender:
@@ -151,9 +181,39 @@ class pbrtbatch(OpenMayaMPx.MPxCommand):
         OpenMaya.MGlobal.displayInfo( 'PBRT Export Successful' )
         self.mProgress.endProgress()
 
-    def exportFile(self, frameNumber = 1, tempExportPath = False):
+    def exportStatic(self, animation):
         """
-        Export a single frame, and return the name of the created scene file
+        Export the nodes that do not change over the frame range once, and
+        return the name of the file that every frame file includes
+        """
+        reload(Exporter)
+        
+        saveFolder = cmds.getAttr( 'pbrt_settings.scene_path' )
+        if not os.path.exists(saveFolder):
+            os.mkdir( saveFolder )
+        
+        staticFileName = str(saveFolder + cmds.getAttr( 'pbrt_settings.scene_filename' ) + '.static.pbrt')
+        verbosity = cmds.getAttr( 'pbrt_settings.verbosity' )
+        
+        pe = Exporter.Exporter(staticFileName, '', 0, 0, '', verbosity, exportPart = 'static', animation = animation )
+        try:
+            pe.doIt( )
+        except:
+            self.mProgress.endProgress()
+            raise
+        if pe.report is not None:
+            self.frameReports.append( ('static', pe.report.document()) )
+        
+        # .gz added if compressed
+        return pe.sceneFileName
+    
+    def exportFile(self, frameNumber = 1, tempExportPath = False, animation = None, staticFileName = None, topologyCache = None, session = None):
+        """
+        Export a single frame, and return the name of the created scene file.
+        With animation (SceneAnimation) only the animated nodes are exported,
+        the rest is included from staticFileName. topologyCache (TopologyCache)
+        is shared by the frames of a range, session (ExportSession) by the
+        incremental exports of single frames
         """
         reload(Exporter)
 
@@ -202,14 +262,34 @@ class pbrtbatch(OpenMayaMPx.MPxCommand):
         verbosity = cmds.getAttr( 'pbrt_settings.verbosity' )
 
         # launch export proc here !
-        pe = Exporter.Exporter(sceneFileName, imageSaveName, renderWidth, renderHeight, renderCameraName, verbosity )
+        exportPart = 'all'
+        if animation is not None:
+            exportPart = 'animated'
+        pe = Exporter.Exporter(sceneFileName, imageSaveName, renderWidth, renderHeight, renderCameraName, verbosity,
+                               exportPart = exportPart, animation = animation, staticFileName = staticFileName,
+                               topologyCache = topologyCache, session = session )
         try:
             pe.doIt( )
         except:
             self.mProgress.endProgress()
             raise
+        if pe.report is not None:
+            self.frameReports.append( (int(frameNumber), pe.report.document()) )
+
+        # .gz added if compressed
+        return pe.sceneFileName
+
+    def writeBatchReport(self):
+        """
+        Merge the reports of the exports of this batch into one, next to the
+        frame folders.
+        """
 
-        return sceneFileName
+        if not self.frameReports:
+            return
+        reportFileName = str(cmds.getAttr( 'pbrt_settings.scene_path' ) + cmds.getAttr( 'pbrt_settings.scene_filename' ) + '.report.json')
+        ExportReport.writeJson( reportFileName, ExportReport.aggregate(self.frameReports) )
+        OpenMaya.MGlobal.displayInfo( 'PBRT: export report written to %s' % reportFileName )
 
     def makeBatchFile(self, fileList):
         renderFolder = cmds.getAttr( 'pbrt_settings.scene_path' )
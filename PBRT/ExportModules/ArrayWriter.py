@@ -0,0 +1,122 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Chunked serializer for large number arrays ("integer indices", "point P",
+# "normal N", "float uv"...). Values are formatted a fixed number at a time with
+# a single % operation per chunk and each chunk is written with one write() call,
+# so memory use does not depend on the size of the array. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+from itertools import islice
+
+from NumberFormat import SHORTEST, shortestFloats
+
+# number of values formatted per write() call
+CHUNK_VALUES = 3 * 16384
+
+
+class ArrayWriter:
+    """
+    Writes flat or row (tuple/list/numpy) arrays as text, one row per line.
+    Format templates are built once per (format, columns, rows) and reused.
+    """
+
+    def __init__(self, chunkValues = CHUNK_VALUES, indent = '\t\t'):
+        self.chunkValues = chunkValues
+        self.indent = indent
+        self.templates = {}
+        self.bytesWritten = 0
+
+    def rowTemplate(self, valueFormat, columns):
+        return self.indent + ' '.join([valueFormat] * columns) + os.linesep
+
+    def chunkTemplate(self, valueFormat, columns, rows):
+        """
+        Only full chunk templates are cached, the last chunk of every array has
+        its own size.
+        """
+        if rows * columns + columns <= self.chunkValues:
+            return self.rowTemplate(valueFormat, columns) * rows
+        key = (valueFormat, columns, rows)
+        template = self.templates.get(key)
+        if template is None:
+            template = self.rowTemplate(valueFormat, columns) * rows
+            self.templates[key] = template
+        return template
+
+    def formatChunk(self, chunk, valueFormat, columns):
+        """
+        Format a flat list of values. A trailing partial row goes on its own line.
+        Integers are written one chunk per line: str.join is about twice as fast
+        as % formatting and pbrt does not care about line breaks.
+        """
+
+        if valueFormat in ('%i', '%d'):
+            return self.indent + ' '.join(map(str, chunk)) + os.linesep
+
+        if valueFormat == SHORTEST:
+            # NumberFormat shortest mode: texts of different lengths, no template
+            texts = shortestFloats(chunk)
+            lines = [self.indent + ' '.join(texts[start:start+columns]) for start in xrange(0, len(texts), columns)]
+            return os.linesep.join(lines) + os.linesep
+
+        rows, rest = divmod(len(chunk), columns)
+        if not rest:
+            return self.chunkTemplate(valueFormat, columns, rows) % tuple(chunk)
+        out = self.chunkTemplate(valueFormat, columns, rows) % tuple(chunk[:rows*columns])
+        out += self.rowTemplate(valueFormat, rest) % tuple(chunk[rows*columns:])
+        return out
+
+    def iterChunks(self, values, columns):
+        """
+        Yield flat lists of at most chunkValues values (whole rows) from numpy
+        arrays, flat sequences or sequences of rows.
+        """
+
+        rowsPerChunk = max(1, self.chunkValues // columns)
+
+        if hasattr(values, 'reshape'):
+            # numpy: slice the flat view, only one chunk is converted at a time
+            flat = values.reshape(-1)
+            step = rowsPerChunk * columns
+            for start in xrange(0, len(flat), step):
+                yield flat[start:start+step].tolist()
+            return
+
+        if len(values) == 0:
+            return
+
+        if hasattr(values[0], '__len__'):
+            it = iter(values)
+            while True:
+                rows = list(islice(it, rowsPerChunk))
+                if not rows:
+                    break
+                yield [x for row in rows for x in row]
+        else:
+            step = rowsPerChunk * columns
+            for start in xrange(0, len(values), step):
+                yield values[start:start+step]
+
+    def write(self, fileHandle, values, columns, valueFormat = '%f'):
+        """
+        Write values to fileHandle, columns values per line.
+        Returns the number of bytes written.
+        """
+
+        written = 0
+        for chunk in self.iterChunks(values, columns):
+            out = self.formatChunk(chunk, valueFormat, columns)
+            fileHandle.write(out)
+            written += len(out)
+        self.bytesWritten += written
+        return written
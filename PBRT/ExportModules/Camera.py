@@ -25,6 +25,7 @@ from maya import cmds
 # import ExportModule
 # reload(ExportModule)
 from ExportModule import ExportModule
+from NumberFormat import formatFloats
 
 class Camera(ExportModule):
     """
@@ -102,9 +103,9 @@ class Camera(ExportModule):
         up  = self.pointCheckUpAxis(up)
          
          
-        self.addToOutput ( 'LookAt %f %f %f' % (eye.x, eye.y, eye.z) )
-        self.addToOutput ( '\t%f %f %f' % (at.x, at.y, at.z) )
-        self.addToOutput ( '\t%f %f %f' % (up.x, up.y, up.z) )
+        self.addToOutput ( formatFloats( 'LookAt %f %f %f', (eye.x, eye.y, eye.z) ) )
+        self.addToOutput ( formatFloats( '\t%f %f %f', (at.x, at.y, at.z) ) )
+        self.addToOutput ( formatFloats( '\t%f %f %f', (up.x, up.y, up.z) ) )
         self.addToOutput ( '' )
 
     
@@ -115,7 +116,7 @@ class Camera(ExportModule):
         """
         
         # should really use focusDistance but that's not auto set to the camera's aim point ??!
-        self.addToOutput ( '\t"float focaldistance" [%f]' % (self.camera.centerOfInterest()*self.sceneScale) )
+        self.addToOutput ( formatFloats( '\t"float focaldistance" [%f]', (self.camera.centerOfInterest()*self.sceneScale,) ) )
         
         
         if cmds.getAttr( 'pbrt_settings.camera_infinite_focus' ) == 0:
@@ -124,7 +125,7 @@ class Camera(ExportModule):
         else:
             lens_radius = 0.0 
         
-        self.addToOutput ( '\t"float lensradius" [%f]' % lens_radius )
+        self.addToOutput ( formatFloats( '\t"float lensradius" [%f]', (lens_radius,) ) )
     
         shiftX = self.camera.filmTranslateH() # these are a fraction of the image height/width
         shiftY = self.camera.filmTranslateV()
@@ -146,13 +147,13 @@ class Camera(ExportModule):
                              ( (2 * shiftY) + 1 ) * self.scale
                            ]
         
-        self.addToOutput( '\t"float screenwindow" [%f %f %f %f]' % (screenwindow[0], screenwindow[1], screenwindow[2], screenwindow[3]) )
+        self.addToOutput( formatFloats( '\t"float screenwindow" [%f %f %f %f]', (screenwindow[0], screenwindow[1], screenwindow[2], screenwindow[3]) ) )
         #self.addToOutput( '\t"float frameaspectratio" [%f]' % ratio )
         
-        self.addToOutput( '\t"float shutteropen" [%f]' % 0.0 )
+        self.addToOutput( formatFloats( '\t"float shutteropen" [%f]', (0.0,) ) )
         
         exposure_time = cmds.getAttr( 'pbrt_settings.camera_exposuretime' )
-        self.addToOutput( '\t"float shutterclose" [%f]' % exposure_time )
+        self.addToOutput( formatFloats( '\t"float shutterclose" [%f]', (exposure_time,) ) )
         
 
     def InsertEnvironment(self):
@@ -177,7 +178,7 @@ class Camera(ExportModule):
         else:
             cFOV = math.degrees( self.camera.verticalFieldOfView() )
             
-        self.addToOutput ( '\t"float fov" [%f]' % cFOV )
+        self.addToOutput ( formatFloats( '\t"float fov" [%f]', (cFOV,) ) )
         self.InsertCommon( )
         self.addToOutput ( '' )
         
@@ -190,4 +191,123 @@ class Camera(ExportModule):
         self.addToOutput ( 'Camera "orthographic"' )
         self.InsertCommon( )
         self.addToOutput ( '' )
-    
\ No newline at end of file
+    
+
+def isEnvironmentCamera(dagPath):
+    """
+    Is the camera at dagPath written by InsertEnvironment: a 360 degree
+    image, with neither a view frustum nor a perspective projection.
+    """
+    
+    if OpenMaya.MFnCamera(dagPath).isOrtho():
+        return False
+    return cmds.getAttr( 'pbrt_settings.camera_persptype', asString = True ) == 'Environment'
+
+
+class CameraProjection:
+    """
+    Projected size of objects in the rendered image, for the level of detail
+    of MeshOpt (MeshDecimator.LevelOfDetail). Uses the same field of view as
+    InsertPerspective and the same ortho width as InsertOrtho.
+    """
+    
+    def __init__(self, dagPath, width, height):
+        camera = OpenMaya.MFnCamera(dagPath)
+        self.eye = camera.eyePoint(OpenMaya.MSpace.kWorld)
+        self.isOrtho = camera.isOrtho()
+        
+        # the field of view and the ortho width span the longer image side
+        imagePixels = float(max(width, height))
+        if self.isOrtho:
+            self.pixelsPerUnit = imagePixels / camera.orthoWidth()
+        else:
+            if height < width:
+                fov = camera.horizontalFieldOfView()
+            else:
+                fov = camera.verticalFieldOfView()
+            # pixels per unit at distance 1
+            self.pixelsPerUnit = imagePixels / (2.0 * math.tan(fov / 2.0))
+    
+    def projectedPixels(self, center, radius):
+        """
+        Diameter in pixels of the sphere at center (world space MPoint) with the
+        given radius, seen from its closest point. None if the eye is inside it.
+        """
+        
+        if self.isOrtho:
+            return 2.0 * radius * self.pixelsPerUnit
+        
+        distance = self.eye.distanceTo(center) - radius
+        if distance <= 0:
+            return None
+        return 2.0 * radius * self.pixelsPerUnit / distance
+
+
+class CameraFrustum:
+    """
+    World space view volume of the camera, for frustum culling in the
+    Exporter. The screen window is that of InsertCommon, widened by margin (a
+    fraction of its size) on every side. Film offsets widen it both ways.
+    """
+    
+    def __init__(self, dagPath, width, height, margin = 0.0):
+        camera = OpenMaya.MFnCamera(dagPath)
+        self.eye = camera.eyePoint(OpenMaya.MSpace.kWorld)
+        view = camera.viewDirection(OpenMaya.MSpace.kWorld)
+        up = camera.upDirection(OpenMaya.MSpace.kWorld)
+        right = camera.rightDirection(OpenMaya.MSpace.kWorld)
+        
+        # half size of the screen window, in units of tan(fov/2) or orthoWidth/2
+        ratio = float(width) / float(height)
+        if ratio > 1.0:
+            halfX, halfY = 1.0, 1.0 / ratio
+        else:
+            halfX, halfY = ratio, 1.0
+        halfX = (halfX + 2 * abs(camera.filmTranslateH())) * (1.0 + margin)
+        halfY = (halfY + 2 * abs(camera.filmTranslateV())) * (1.0 + margin)
+        
+        # planes as (normal, offset): inside where normal.(p - eye) + offset >= 0
+        self.planes = []
+        if camera.isOrtho():
+            scale = camera.orthoWidth() / 2
+            for axis, half in ( (right, halfX * scale), (up, halfY * scale) ):
+                self.planes.append( (axis, half) )
+                self.planes.append( (axis * -1.0, half) )
+            self.planes.append( (view, 0.0) )
+        else:
+            if height < width:
+                tanHalf = math.tan( camera.horizontalFieldOfView() / 2 )
+            else:
+                tanHalf = math.tan( camera.verticalFieldOfView() / 2 )
+            for axis, half in ( (right, halfX * tanHalf), (up, halfY * tanHalf) ):
+                self.planes.append( (view * half - axis, 0.0) )
+                self.planes.append( (view * half + axis, 0.0) )
+    
+    def intersects(self, bounds):
+        """
+        Does the world space MBoundingBox reach into the view volume. Tests the
+        corner of the box furthest inside each plane.
+        """
+        
+        low = bounds.min()
+        high = bounds.max()
+        for normal, offset in self.planes:
+            x = high.x if normal.x > 0 else low.x
+            y = high.y if normal.y > 0 else low.y
+            z = high.z if normal.z > 0 else low.z
+            if normal.x * (x - self.eye.x) + normal.y * (y - self.eye.y) + normal.z * (z - self.eye.z) + offset < 0:
+                return False
+        return True
+    
+    def distance(self, bounds):
+        """
+        Distance from the eye to the world space MBoundingBox, 0 inside of it.
+        """
+        
+        low = bounds.min()
+        high = bounds.max()
+        distance = 0.0
+        for e, l, h in ( (self.eye.x, low.x, high.x), (self.eye.y, low.y, high.y), (self.eye.z, low.z, high.z) ):
+            outside = max(l - e, 0.0, e - h)
+            distance += outside * outside
+        return math.sqrt(distance)
@@ -17,9 +17,22 @@
 
 import os
 import math
+import cStringIO
 os.altsep = '/'
 from maya import OpenMaya
 
+from ArrayWriter import ArrayWriter
+from NumberFormat import formatFloats
+
+# ExportProfiler of the current export, set by the Exporter with setProfiler.
+# A module global rather than a class attribute: modules reload ExportModule,
+# and the subclasses of the old and the new class all see this one.
+profiler = None
+
+def setProfiler(newProfiler):
+    global profiler
+    profiler = newProfiler
+
 
 class ExportModule:
     """
@@ -44,6 +57,8 @@ class ExportModule:
     inputFound = False
     fileHandle = 0
     
+    arrayWriter = ArrayWriter()
+    
 
     def loadModule(self):
         """
@@ -51,10 +66,25 @@ class ExportModule:
         if not writing direct to file.
         """
         
-        self.getOutput()
+        if profiler is not None:
+            profiler.run(self, self.getOutput, self.__class__.__name__, self.profileNodeName())
+        else:
+            self.getOutput()
         self.moduleLoaded = True
         return self.outputString
     
+    def profileNodeName(self):
+        """
+        Name of the node this module exports, for the profiler.
+        """
+        
+        if self.dagPath.isValid():
+            return self.dagPath.fullPathName()
+        try:
+            return self.dpNode.name()
+        except:
+            return ''
+    
     def intToBoolString(self, intIn):
         if intIn == 1: return 'true'
         else: return 'false'
@@ -70,10 +100,10 @@ class ExportModule:
         
         matrix = self.checkUpAxis(matrix)
 
-        strOut  = ( '\tConcatTransform [%f %f %f %f'  % (matrix(0,0), matrix(0,1), matrix(0,2), matrix(0,3)) ) + os.linesep
-        strOut += ( '\t                 %f %f %f %f'  % (matrix(1,0), matrix(1,1), matrix(1,2), matrix(1,3)) ) + os.linesep
-        strOut += ( '\t                 %f %f %f %f'  % (matrix(2,0), matrix(2,1), matrix(2,2), matrix(2,3)) ) + os.linesep
-        strOut += ( '\t                 %f %f %f %f]' % (matrix(3,0), matrix(3,1), matrix(3,2), matrix(3,3)) )
+        strOut  = formatFloats( '\tConcatTransform [%f %f %f %f', (matrix(0,0), matrix(0,1), matrix(0,2), matrix(0,3)) ) + os.linesep
+        strOut += formatFloats( '\t                 %f %f %f %f', (matrix(1,0), matrix(1,1), matrix(1,2), matrix(1,3)) ) + os.linesep
+        strOut += formatFloats( '\t                 %f %f %f %f', (matrix(2,0), matrix(2,1), matrix(2,2), matrix(2,3)) ) + os.linesep
+        strOut += formatFloats( '\t                 %f %f %f %f]', (matrix(3,0), matrix(3,1), matrix(3,2), matrix(3,3)) )
         
         return strOut
     
@@ -143,6 +173,37 @@ class ExportModule:
         else:
             self.fileHandle.write( string + os.linesep )
     
+    def addArrayToOutput(self, values, columns, valueFormat = '%f'):
+        """
+        Accumulate a large number array (flat, rows or numpy), columns values
+        per line. The array is formatted and written in fixed size chunks.
+        """
+        
+        if self.fileHandle==0:
+            buf = cStringIO.StringIO()
+            self.arrayWriter.write(buf, values, columns, valueFormat)
+            self.outputString += buf.getvalue()
+        else:
+            self.arrayWriter.write(self.fileHandle, values, columns, valueFormat)
+    
+    def addPartsToOutput(self, parts):
+        """
+        Accumulate a block of text lines and number arrays: parts is a list of
+        strings and (values, columns, valueFormat) tuples. A fileHandle that
+        formats blocks itself (SerializerPool.OrderedOutput) gets the whole
+        block at once.
+        """
+        
+        if self.fileHandle!=0 and hasattr(self.fileHandle, 'writeParts'):
+            self.fileHandle.writeParts(parts)
+            return
+        
+        for part in parts:
+            if isinstance(part, str):
+                self.addToOutput(part)
+            else:
+                self.addArrayToOutput(*part)
+    
     
     def exportStr(self):
         return self.outputString
@@ -151,6 +212,10 @@ class ExportModule:
 
 class ShadedObject(ExportModule):
     "super class for mesh and other objects with attached shaders"
+    
+    # BoundMaterials of the whole export, set up by the Exporter
+    boundMaterials = None
+    
     def findShadingGroup(self, instanceNum = 0, setNumber = 0):
         if self.fShape.type() == OpenMaya.MFn.kMesh:
             try:
@@ -187,7 +252,10 @@ class ShadedObject(ExportModule):
         
         if materials.length() > 0:
             matNode = materials[0].node()
-            return OpenMaya.MFnDependencyNode( matNode )
+            shaderNode = OpenMaya.MFnDependencyNode( matNode )
+            if self.boundMaterials is not None:
+                self.boundMaterials.add( shaderNode )
+            return shaderNode
         
         return None
                 
@@ -199,6 +267,20 @@ class ShadedObject(ExportModule):
         
         return '\tNamedMaterial "' + shaderNode.name() + '"' #theMaterial.name()
     
+    def materialUsesUVs(self, shaderNode):
+        """
+        Can the material exported for shaderNode look up textures. Translated
+        Maya shaders and area lights are constant, pbrtTextNode text is
+        searched for textures. Unknown shaders are assumed to use them.
+        """
+        
+        if shaderNode is None:
+            return True
+        nodeType = shaderNode.typeName()
+        if nodeType == "pbrtTextNode":
+            return shaderNode.findPlug("pbrtText").asString().lower().find("texture") != -1
+        return nodeType not in ("lambert", "blinn", "phong", "phongE", "pbrtAreaLightMaterial")
+    
     def getAreaLight(self, shaderNode):
         """
         Return AreaLightSource syntax with this class' shaderNode's attributes
@@ -213,8 +295,30 @@ class ShadedObject(ExportModule):
         
         outStr = ( '\tAreaLightSource "diffuse"' ) + os.linesep
         outStr += ( '\t\t"integer nsamples" [%i]' % numSamples ) + os.linesep
-        outStr += ('\t\t"color L" [%f %f %f]' % (colorR*gain, colorG*gain, colorB*gain)) + os.linesep
+        outStr += formatFloats( '\t\t"color L" [%f %f %f]', (colorR*gain, colorG*gain, colorB*gain) ) + os.linesep
         
         
         return outStr        
-    
\ No newline at end of file
+    
+
+
+class BoundMaterials:
+    """
+    The surface shaders bound to the exported geometry, each once, in the
+    order findSurfaceShader finds them. The Exporter writes a material for
+    every one of them. recorded, if not None, collects the names added to it,
+    also the ones already known, for ExportSession fragments.
+    """
+    
+    def __init__(self):
+        self.names = set()
+        self.shaders = []
+        self.recorded = None
+    
+    def add(self, shaderNode):
+        name = shaderNode.name()
+        if self.recorded is not None and name not in self.recorded:
+            self.recorded.append(name)
+        if name not in self.names:
+            self.names.add(name)
+            self.shaders.append(shaderNode)
@@ -0,0 +1,118 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Profiling of the export modules. ExportModule.loadModule runs every module
+# through the profiler of the export, if there is one: wall time, calls and
+# bytes written are recorded per module type and per node, and one cProfile
+# profile is collected over all of them. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import time
+import cProfile
+
+# environment variable that switches profiling on, like pbrt_settings.scene_profile
+PROFILE_ENV = 'PBRT_EXPORT_PROFILE'
+
+
+def isEnabledByEnvironment():
+    return os.environ.get(PROFILE_ENV, '0') not in ('', '0')
+
+
+def fileSize(fileHandle, outputString):
+    """
+    Bytes written so far by a module: tell() of its file, or the length of its
+    outputString when it does not write to a file.
+    """
+    if fileHandle != 0 and hasattr(fileHandle, 'tell'):
+        return fileHandle.tell()
+    return len(outputString)
+
+
+class ExportProfiler:
+    """
+    Per type and per node [seconds, calls, bytes]. Bytes are the growth of
+    tell() of the module's file; with serializer workers, formatted blocks
+    count for the module that is running when they are written out.
+    """
+
+    def __init__(self, useCProfile = True):
+        self.types = {}
+        self.nodes = {}
+        self.profile = None
+        if useCProfile:
+            self.profile = cProfile.Profile()
+        self.depth = 0
+
+    def run(self, module, function, typeName, nodeName):
+        """
+        Call function() (the getOutput of module) and record it.
+        """
+
+        bytesBefore = fileSize(module.fileHandle, module.outputString)
+        start = time.time()
+        # modules running other modules are counted once, in the outer one
+        self.depth += 1
+        try:
+            if self.profile is not None and self.depth == 1:
+                self.profile.runcall(function)
+            else:
+                function()
+        finally:
+            self.depth -= 1
+            seconds = time.time() - start
+            written = fileSize(module.fileHandle, module.outputString) - bytesBefore
+            self.record(self.types, typeName, seconds, written)
+            self.record(self.nodes, (typeName, nodeName), seconds, written)
+
+    @staticmethod
+    def record(table, key, seconds, written):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = [0.0, 0, 0]
+        entry[0] += seconds
+        entry[1] += 1
+        entry[2] += written
+
+    def summary(self):
+        """
+        One line per module type, slowest first.
+        """
+        lines = []
+        for typeName, (seconds, calls, written) in sorted(self.types.items(), key = lambda item: -item[1][0]):
+            lines.append( 'Profile %s: %.3f s, %i calls, %.1f MB' % (typeName, seconds, calls, written / 1048576.0) )
+        return lines
+
+    def writeReport(self, fileName, nodeCount = 50):
+        """
+        Text report: all types, then the nodeCount slowest nodes.
+        """
+
+        report = open(fileName, 'w')
+        report.write( '%-40s %10s %8s %12s%s' % ('type', 'seconds', 'calls', 'bytes', os.linesep) )
+        for typeName, (seconds, calls, written) in sorted(self.types.items(), key = lambda item: -item[1][0]):
+            report.write( '%-40s %10.3f %8i %12i%s' % (typeName, seconds, calls, written, os.linesep) )
+        report.write( os.linesep )
+
+        report.write( '%-20s %-50s %10s %8s %12s%s' % ('type', 'node', 'seconds', 'calls', 'bytes', os.linesep) )
+        nodes = sorted(self.nodes.items(), key = lambda item: -item[1][0])
+        for (typeName, nodeName), (seconds, calls, written) in nodes[:nodeCount]:
+            report.write( '%-20s %-50s %10.3f %8i %12i%s' % (typeName, nodeName, seconds, calls, written, os.linesep) )
+        report.close()
+
+    def dumpStats(self, fileName):
+        """
+        The cProfile profile of all modules, for pstats or any profile viewer.
+        """
+        if self.profile is None:
+            return False
+        self.profile.dump_stats(fileName)
+        return True
@@ -0,0 +1,219 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Machine readable report of an export, written as JSON next to the scene file
+# when pbrt_settings.scene_report is on: wall time per phase of the Exporter,
+# time per exported node, triangles and vertices written and rendered, and
+# the size of every output file, before and after compression for gzipped
+# ones. pbrtbatch merges the reports of the frames
+# of a batch with aggregate(), to compare export times across frames and
+# shots. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import time
+import json
+
+# bump when the layout of the report changes
+REPORT_VERSION = 2
+
+
+class GeometryStats:
+    """
+    Triangles and vertices of the exported meshes. written: what MeshOpt
+    compiled and wrote to the geometry files; rendered: what the render sees,
+    each object once per ObjectInstance of it (Maya instances, deduplicated
+    copies, instancer particles). Sets copied from the geometry cache are not
+    compiled, they are only counted in cachedSets.
+    """
+
+    def __init__(self):
+        self.writtenTriangles = 0
+        self.writtenVertices = 0
+        self.renderedTriangles = 0
+        self.renderedVertices = 0
+        self.cachedSets = 0
+        # object name -> (triangles, vertices)
+        self.objects = {}
+        # counts of the shape or object being written, see beginShape
+        self.pending = None
+
+    def beginShape(self):
+        self.pending = [0, 0]
+
+    def addWritten(self, triangles, vertices):
+        self.writtenTriangles += triangles
+        self.writtenVertices += vertices
+        if self.pending is not None:
+            self.pending[0] += triangles
+            self.pending[1] += vertices
+
+    def addCached(self):
+        self.cachedSets += 1
+
+    def endShape(self, objectName = None):
+        """
+        End what beginShape started: a shape that is rendered where it is
+        written, or the object objectName, rendered by its references.
+        """
+
+        triangles, vertices = self.pending
+        self.pending = None
+        if objectName is None:
+            self.renderedTriangles += triangles
+            self.renderedVertices += vertices
+        else:
+            self.objects[objectName] = (triangles, vertices)
+
+    def addReference(self, objectName, count = 1):
+        triangles, vertices = self.objects.get(objectName, (0, 0))
+        self.renderedTriangles += triangles * count
+        self.renderedVertices += vertices * count
+
+    def document(self):
+        return { 'writtenTriangles': self.writtenTriangles,
+                 'writtenVertices': self.writtenVertices,
+                 'renderedTriangles': self.renderedTriangles,
+                 'renderedVertices': self.renderedVertices,
+                 'objects': len(self.objects),
+                 'cachedSets': self.cachedSets }
+
+
+class ExportReport:
+    """
+    Report of one Exporter.doIt. Phases follow each other: startPhase ends
+    the current one.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.seconds = 0.0
+        # [name, seconds] in export order
+        self.phases = []
+        self.phaseName = None
+        self.phaseStart = 0.0
+        # (type, node name, seconds) per module run
+        self.nodes = []
+        # file name -> bytes on disk
+        self.files = {}
+        # file name -> bytesIn and bytesOut of the compressed files
+        self.compressed = {}
+        self.geometry = GeometryStats()
+        self.info = {}
+
+    def startPhase(self, name):
+        self.endPhase()
+        self.phaseName = name
+        self.phaseStart = time.time()
+
+    def endPhase(self):
+        if self.phaseName is not None:
+            self.phases.append( [self.phaseName, time.time() - self.phaseStart] )
+            self.phaseName = None
+
+    def addNode(self, typeName, nodeName, seconds):
+        self.nodes.append( (typeName, nodeName, seconds) )
+
+    def addFile(self, fileName):
+        """
+        Record the size of an output file, once it is closed. Files that were
+        not written are left out.
+        """
+
+        try:
+            self.files[fileName] = os.path.getsize(fileName)
+        except OSError:
+            pass
+
+    def addCompressedFile(self, fileName, bytesIn, bytesOut):
+        """
+        Record the bytes written to a GzipWriter and the bytes it compressed
+        them to, once it is closed.
+        """
+
+        self.compressed[fileName] = { 'bytesIn': bytesIn, 'bytesOut': bytesOut }
+
+    def uncompressedBytes(self):
+        total = 0
+        for fileName, size in self.files.items():
+            if fileName in self.compressed:
+                size = self.compressed[fileName]['bytesIn']
+            total += size
+        return total
+
+    def finish(self):
+        self.endPhase()
+        self.seconds = time.time() - self.start
+
+    def document(self):
+        nodes = sorted(self.nodes, key = lambda node: -node[2])
+        document = { 'version': REPORT_VERSION,
+                     'seconds': self.seconds,
+                     'phases': [ { 'name': name, 'seconds': seconds } for name, seconds in self.phases ],
+                     'nodes': [ { 'type': typeName, 'node': nodeName, 'seconds': seconds } for typeName, nodeName, seconds in nodes ],
+                     'geometry': self.geometry.document(),
+                     'files': self.files,
+                     'compressed': self.compressed,
+                     'bytes': sum(self.files.values()),
+                     'uncompressedBytes': self.uncompressedBytes() }
+        document.update(self.info)
+        return document
+
+    def write(self, fileName):
+        writeJson(fileName, self.document())
+
+
+def writeJson(fileName, document):
+    reportFile = open(fileName, 'w')
+    json.dump(document, reportFile, indent = 2, sort_keys = True)
+    reportFile.close()
+
+
+def aggregate(frameDocuments, nodeCount = 20):
+    """
+    Batch report from the (frame, document) reports of its frames: per frame
+    the totals, and over all frames the time per phase and the nodes with the
+    most time.
+    """
+
+    frames = []
+    phaseSeconds = {}
+    nodeSeconds = {}
+    for frame, document in frameDocuments:
+        phases = {}
+        for phase in document['phases']:
+            phases[phase['name']] = phase['seconds']
+            phaseSeconds[phase['name']] = phaseSeconds.get(phase['name'], 0.0) + phase['seconds']
+        for node in document['nodes']:
+            key = (node['type'], node['node'])
+            nodeSeconds[key] = nodeSeconds.get(key, 0.0) + node['seconds']
+        frames.append( { 'frame': frame,
+                         'scene': document.get('scene', ''),
+                         'seconds': document['seconds'],
+                         'phases': phases,
+                         'bytes': document['bytes'],
+                         'uncompressedBytes': document.get('uncompressedBytes', document['bytes']),
+                         'geometry': document['geometry'] } )
+
+    seconds = [entry['seconds'] for entry in frames]
+    slowestNodes = sorted(nodeSeconds.items(), key = lambda item: -item[1])[:nodeCount]
+    batch = { 'version': REPORT_VERSION,
+              'frames': frames,
+              'seconds': sum(seconds),
+              'phases': phaseSeconds,
+              'nodes': [ { 'type': typeName, 'node': nodeName, 'seconds': total } for (typeName, nodeName), total in slowestNodes ],
+              'bytes': sum([entry['bytes'] for entry in frames]),
+              'uncompressedBytes': sum([entry['uncompressedBytes'] for entry in frames]) }
+    if seconds:
+        batch['minSeconds'] = min(seconds)
+        batch['maxSeconds'] = max(seconds)
+        batch['meanSeconds'] = sum(seconds) / len(seconds)
+    return batch
@@ -0,0 +1,288 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Persistent, content-addressed cache of serialized geometry blocks. MeshOpt
+# hashes everything a block depends on (topology, points, normals, uvs, material
+# binding), and copies the cached block into the geometry file on a hit instead
+# of compiling and formatting the mesh again. The cache lives in a directory
+# shared by all exports, its size is capped and the least recently used blocks
+# are evicted first (a hit touches the block's mtime). Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import array
+import shutil
+import hashlib
+
+from ArrayWriter import ArrayWriter
+
+# bump when the syntax of the cached blocks changes, old blocks then never hit
+CACHE_VERSION = 1
+
+BLOCK_EXTENSION = '.pbrt'
+
+
+class CacheWriter:
+    """
+    File-like object that writes to the geometry file and to a temporary cache
+    block at the same time. commit() publishes the block under its key.
+
+    Blocks given to writeParts go to the writeParts of the geometry file
+    (SerializerPool.OrderedOutput) and are formatted by its workers; the block
+    file takes the same text once it is ready, so commit() may leave the block
+    pending until GeometryCache.finish().
+    """
+
+    def __init__(self, cache, key, fileHandle):
+        self.cache = cache
+        self.key = key
+        self.fileHandle = fileHandle
+        self.name = getattr(fileHandle, 'name', '')
+
+        blockPath = cache.blockPath(key)
+        blockDir = os.path.dirname(blockPath)
+        if not os.path.isdir(blockDir):
+            os.makedirs(blockDir)
+        # unique per process and writer, several exports may share the cache
+        # directory and pending blocks of one export may share a key
+        self.tempPath = '%s.%i.%i.tmp' % (blockPath, os.getpid(), id(self))
+        self.blockHandle = open(self.tempPath, 'wb')
+        # text strings and AsyncResults of the block, in order, see writeParts
+        self.queue = []
+
+    def write(self, string):
+        self.fileHandle.write(string)
+        if self.queue:
+            self.queue.append(string)
+        else:
+            self.blockHandle.write(string)
+
+    def writeParts(self, parts):
+        """
+        ExportModule.addPartsToOutput block. Returns what the geometry file
+        returned for it: the AsyncResult or text of the block, None if it was
+        written here.
+        """
+
+        if not hasattr(self.fileHandle, 'writeParts'):
+            writer = ArrayWriter()
+            for part in parts:
+                if isinstance(part, str):
+                    self.write(part + os.linesep)
+                else:
+                    writer.write(self, *part)
+            return None
+
+        block = self.fileHandle.writeParts(parts)
+        if block is None:
+            # the geometry file wrote it without telling the text: format it here
+            from SerializerPool import formatParts
+            block = formatParts(parts)
+        if self.queue or not isinstance(block, str):
+            self.queue.append(block)
+        else:
+            self.blockHandle.write(block)
+        return block
+
+    def drain(self, wait = False):
+        """
+        Write the formatted blocks to the block file, up to the first one that
+        is not ready unless wait is set. True when nothing is pending.
+        """
+
+        while self.queue:
+            item = self.queue[0]
+            if not isinstance(item, str):
+                if not wait and not item.ready():
+                    return False
+                item = item.get()
+            self.blockHandle.write(item)
+            self.queue.pop(0)
+        return True
+
+    def flush(self):
+        self.fileHandle.flush()
+
+    def tell(self):
+        return self.fileHandle.tell()
+
+    def commit(self):
+        if not self.drain():
+            self.cache.pending.append(self)
+            return
+        self.publish()
+
+    def publish(self):
+        size = self.blockHandle.tell()
+        self.blockHandle.close()
+        blockPath = self.cache.blockPath(self.key)
+        if os.path.exists(blockPath):
+            # another export stored it in the meantime
+            os.remove(self.tempPath)
+        else:
+            os.rename(self.tempPath, blockPath)
+            self.cache.bytesStored += size
+
+    def abort(self):
+        self.queue = []
+        self.blockHandle.close()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
+
+class GeometryCache:
+    """
+    Geometry blocks stored as <cacheDir>/<key[:2]>/<key>.pbrt
+    """
+
+    def __init__(self, cacheDir, maxBytes):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+
+        self.hits = 0
+        self.misses = 0
+        self.bytesReused = 0
+        self.bytesStored = 0
+        self.evicted = 0
+        # committed CacheWriters waiting for formatted blocks
+        self.pending = []
+
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+    @staticmethod
+    def newKey():
+        """
+        A hash object to feed with addToKey, hexdigest() is the block key.
+        """
+        key = hashlib.sha1()
+        key.update('pbrtMayaPy geometry %i;' % CACHE_VERSION)
+        return key
+
+    @staticmethod
+    def addToKey(key, values, typecode = 'i'):
+        """
+        Add a string, a numpy array or a sequence of numbers (typecode as in the
+        array module) to the key. The length goes in too, so that consecutive
+        arrays can not be confused.
+        """
+
+        if values is None:
+            key.update('None;')
+            return
+        if isinstance(values, str):
+            data = values
+        elif hasattr(values, 'tostring'):
+            data = values.tostring()
+        else:
+            data = array.array(typecode, values).tostring()
+        key.update('%i;' % len(data))
+        key.update(data)
+
+    def blockPath(self, key):
+        return os.path.join(self.cacheDir, key[:2], key + BLOCK_EXTENSION)
+
+    def copyTo(self, key, fileHandle):
+        """
+        Copy the cached block into fileHandle. Returns False on a miss.
+        """
+
+        blockPath = self.blockPath(key)
+        try:
+            blockHandle = open(blockPath, 'rb')
+        except IOError:
+            self.misses += 1
+            return False
+
+        try:
+            shutil.copyfileobj(blockHandle, fileHandle, 1 << 20)
+            self.bytesReused += blockHandle.tell()
+        finally:
+            blockHandle.close()
+
+        # most recently used
+        try:
+            os.utime(blockPath, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return True
+
+    def writer(self, key, fileHandle):
+        """
+        File-like object to write the block of a miss through.
+        """
+        self.finish(False)
+        return CacheWriter(self, key, fileHandle)
+
+    def finish(self, wait = True):
+        """
+        Publish the committed blocks whose text is formatted, all of them if
+        wait is set. Called by the Exporter once the geometry is written.
+        """
+
+        pending = []
+        for writer in self.pending:
+            if writer.drain(wait):
+                writer.publish()
+            else:
+                pending.append(writer)
+        self.pending = pending
+
+    def abortPending(self):
+        """
+        Drop the committed blocks still waiting for their text, after a
+        failed export.
+        """
+
+        for writer in self.pending:
+            writer.abort()
+        self.pending = []
+
+    def evict(self):
+        """
+        Remove the least recently used blocks until the cache fits in maxBytes.
+        Returns the number of blocks removed.
+        """
+
+        blocks = []
+        totalBytes = 0
+        for dirPath, dirNames, fileNames in os.walk(self.cacheDir):
+            for fileName in fileNames:
+                if not fileName.endswith(BLOCK_EXTENSION):
+                    continue
+                blockPath = os.path.join(dirPath, fileName)
+                try:
+                    stat = os.stat(blockPath)
+                except OSError:
+                    continue
+                blocks.append( (stat.st_mtime, stat.st_size, blockPath) )
+                totalBytes += stat.st_size
+
+        removed = 0
+        blocks.sort()
+        for mtime, size, blockPath in blocks:
+            if totalBytes <= self.maxBytes:
+                break
+            try:
+                os.remove(blockPath)
+            except OSError:
+                continue
+            totalBytes -= size
+            removed += 1
+
+        self.evicted += removed
+        return removed
+
+    def summary(self):
+        return 'Geometry cache: %i hits, %i misses, %.1f MB reused, %.1f MB stored, %i evicted' % (
+            self.hits, self.misses, self.bytesReused / 1048576.0, self.bytesStored / 1048576.0, self.evicted)
@@ -0,0 +1,105 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Streaming gzip output file. Writes are gathered into large chunks that a
+# background thread compresses and writes, so compression overlaps with the
+# extraction and formatting on the main thread (zlib and file writes release
+# the GIL). Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import gzip
+import Queue
+import threading
+
+# uncompressed bytes handed to the thread at a time
+CHUNK_BYTES = 1 << 20
+# chunks waiting for the thread before write() blocks
+MAX_QUEUED_CHUNKS = 8
+
+
+class GzipWriter:
+    """
+    File-like object for the Exporter output files. tell() returns the
+    uncompressed size, like the plain file would. flush() does not flush the
+    gzip stream, MeshOpt flushes after every shape and that would hurt the
+    compression ratio.
+    """
+
+    def __init__(self, fileName, compressionLevel = 6):
+        self.name = fileName
+        self.compressionLevel = compressionLevel
+
+        self.gzipFile = gzip.GzipFile(fileName, 'wb', compressionLevel)
+        self.pending = []
+        self.pendingBytes = 0
+        self.bytesIn = 0
+        self.bytesOut = 0
+        self.closed = False
+
+        self.error = None
+        self.queue = Queue.Queue(MAX_QUEUED_CHUNKS)
+        self.thread = threading.Thread(target = self.compressLoop)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def compressLoop(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.gzipFile.write(chunk)
+            except Exception, e:
+                self.error = e
+
+    def checkError(self):
+        if self.error is not None:
+            raise IOError('Writing %s failed: %s' % (self.name, self.error))
+
+    def write(self, string):
+        self.pending.append(string)
+        self.pendingBytes += len(string)
+        self.bytesIn += len(string)
+        if self.pendingBytes >= CHUNK_BYTES:
+            self.sendPending()
+
+    def sendPending(self):
+        self.checkError()
+        if self.pending:
+            self.queue.put(''.join(self.pending))
+            self.pending = []
+            self.pendingBytes = 0
+
+    def flush(self):
+        self.checkError()
+
+    def tell(self):
+        return self.bytesIn
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.sendPending()
+        self.queue.put(None)
+        self.thread.join()
+        self.gzipFile.close()
+        self.bytesOut = os.path.getsize(self.name)
+        self.checkError()
+
+    def summary(self):
+        ratio = 0.0
+        if self.bytesOut:
+            ratio = float(self.bytesIn) / self.bytesOut
+        return '%s: %.1f MB written as %.1f MB (%.1f:1)' % (os.path.basename(self.name), self.bytesIn / 1048576.0, self.bytesOut / 1048576.0, ratio)
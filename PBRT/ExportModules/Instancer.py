@@ -0,0 +1,197 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Particle instancer export module: the instanced meshes are written once as
+# pbrt objects, each particle as an ObjectInstance with its own transform
+#
+# ------------------------------------------------------------------------------
+
+import os
+import cStringIO
+from maya import OpenMaya
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from ExportModule import ExportModule
+from ArrayWriter import ArrayWriter
+import NumberFormat
+import MeshOpt
+
+# instances formatted and written at a time
+INSTANCE_CHUNK = 10000
+
+
+def matrixValues(matrix):
+    """
+    The 16 values of an MMatrix, row by row.
+    """
+    return [matrix(r, c) for r in xrange(4) for c in xrange(4)]
+
+
+class Instancer(ExportModule):
+    """
+    Instancer ExportModule. All particle matrices are read at once with
+    MFnInstancer.allInstances. Every mesh under the instanced hierarchies
+    becomes an object (MeshOpt.getObject), every particle one
+    TransformBegin/ObjectInstance/TransformEnd block per mesh. The transforms
+    are multiplied a chunk of instances at a time, with numpy when it is
+    available, and their rows formatted by an ArrayWriter.
+    """
+
+    # rows of 16 values, ConcatTransform adds the indent
+    rowWriter = ArrayWriter(indent = '')
+
+    @staticmethod
+    def Factory(fileHandles, dagPath):
+        """
+        Instances go to the geometry file, fileHandles as for MeshOpt.GeoFactory.
+        """
+
+        if fileHandles[0] == 0:
+            return False
+        return Instancer(fileHandles, dagPath)
+
+    def __init__(self, fileHandles, dagPath):
+        self.fileHandles = fileHandles
+        self.fileHandle = fileHandles[0]
+        self.dagPath = dagPath
+        self.fInstancer = OpenMaya.MFnInstancer(dagPath)
+
+    def getMeshPath(self, dagPath):
+        """
+        The mesh shape at or directly under dagPath, None if there is none.
+        """
+
+        meshPath = OpenMaya.MDagPath(dagPath)
+        try:
+            meshPath.extendToShape()
+        except:
+            return None
+        if not meshPath.hasFn(OpenMaya.MFn.kMesh):
+            return None
+        return meshPath
+
+    def getSourceObjects(self, paths):
+        """
+        Write the meshes of the instanced paths as objects. Returns the object
+        name of every path, None for paths without a mesh.
+        """
+
+        instancerName = self.dagPath.fullPathName()
+        objectNames = []
+        meshObjects = {}
+        for i in xrange(paths.length()):
+            meshPath = self.getMeshPath(paths[i])
+            if meshPath is None:
+                objectNames.append(None)
+                continue
+
+            meshName = meshPath.fullPathName()
+            if meshName not in meshObjects:
+                objectName = '%s %s' % (instancerName, meshName)
+                meshExporter = MeshOpt.MeshOpt(self.fileHandles, meshPath)
+                meshExporter.fileHandle = self.fileHandle
+                self.addToOutput( '# Instanced Shape %s' % meshName )
+                meshExporter.getObject(objectName)
+                meshObjects[meshName] = objectName
+            objectNames.append(meshObjects[meshName])
+        return objectNames
+
+    def getOutput(self):
+
+        # sharded geometry output starts its shards at shape boundaries
+        if hasattr(self.fileHandle, 'beginShape'):
+            self.fileHandle.beginShape(self.dagPath.fullPathName())
+
+        paths = OpenMaya.MDagPathArray()
+        matrices = OpenMaya.MMatrixArray()
+        particlePathStartIndices = OpenMaya.MIntArray()
+        pathIndices = OpenMaya.MIntArray()
+        self.fInstancer.allInstances(paths, matrices, particlePathStartIndices, pathIndices)
+
+        particleCount = matrices.length()
+        self.addToOutput( '# Instancer %s (%i particles)' % (self.dagPath.fullPathName(), particleCount) )
+        if particleCount == 0:
+            return
+
+        objectNames = self.getSourceObjects(paths)
+        pathMatrices = [paths[i].inclusiveMatrix() for i in xrange(paths.length())]
+        # checkUpAxis multiplies by a fixed matrix, it is built once for all instances
+        conversion = self.checkUpAxis(OpenMaya.MMatrix())
+
+        instanceCount = 0
+        pathInstances = [0] * paths.length()
+        particles = []
+        instancePaths = []
+        for particle in xrange(particleCount):
+            for p in xrange(particlePathStartIndices[particle], particlePathStartIndices[particle + 1]):
+                pathIndex = pathIndices[p]
+                if objectNames[pathIndex] is None:
+                    continue
+                particles.append(particle)
+                instancePaths.append(pathIndex)
+                pathInstances[pathIndex] += 1
+            if len(particles) >= INSTANCE_CHUNK:
+                self.writeInstances(matrices, particles, instancePaths, pathMatrices, conversion, objectNames)
+                instanceCount += len(particles)
+                particles = []
+                instancePaths = []
+
+        if particles:
+            self.writeInstances(matrices, particles, instancePaths, pathMatrices, conversion, objectNames)
+            instanceCount += len(particles)
+        if MeshOpt.MeshOpt.geometryStats is not None:
+            for pathIndex in xrange(paths.length()):
+                MeshOpt.MeshOpt.geometryStats.addReference(objectNames[pathIndex], pathInstances[pathIndex])
+        self.addToOutput( '# %i instances' % instanceCount )
+        self.addToOutput( '' )
+        self.fileHandle.flush()
+
+    def getTransforms(self, matrices, particles, instancePaths, pathMatrices, conversion):
+        """
+        pbrt transform of every instance (particle, instancePath): path
+        matrix * particle matrix * conversion. An (n, 4, 4) numpy array, or a
+        flat list of 16 values per instance without numpy.
+        """
+
+        if numpy is None:
+            values = []
+            for i in xrange(len(particles)):
+                values.extend( matrixValues(pathMatrices[instancePaths[i]] * matrices[particles[i]] * conversion) )
+            return values
+
+        instanceValues = []
+        for particle in particles:
+            instanceValues.extend( matrixValues(matrices[particle]) )
+        instanceArray = numpy.array(instanceValues, dtype = numpy.float64).reshape(-1, 4, 4)
+        pathArray = numpy.array([matrixValues(matrix) for matrix in pathMatrices], dtype = numpy.float64).reshape(-1, 4, 4)
+        transforms = numpy.einsum('nij,njk->nik', pathArray[numpy.array(instancePaths)], instanceArray)
+        return numpy.dot(transforms, numpy.array(matrixValues(conversion), dtype = numpy.float64).reshape(4, 4))
+
+    def writeInstances(self, matrices, particles, instancePaths, pathMatrices, conversion, objectNames):
+        """
+        Write one chunk of instances, see getTransforms.
+        """
+
+        buf = cStringIO.StringIO()
+        self.rowWriter.write( buf, self.getTransforms(matrices, particles, instancePaths, pathMatrices, conversion), 16, NumberFormat.arrayFormat() )
+        rows = buf.getvalue().split(os.linesep)
+
+        head = 'TransformBegin' + os.linesep + '\tConcatTransform ['
+        tails = []
+        for objectName in objectNames:
+            if objectName is None:
+                tails.append(None)
+            else:
+                tails.append( ']' + os.linesep + '\tObjectInstance "%s"' % objectName + os.linesep + 'TransformEnd' + os.linesep )
+        self.fileHandle.write( ''.join([head + rows[i] + tails[instancePaths[i]] for i in xrange(len(instancePaths))]) )
@@ -23,6 +23,7 @@ from maya import OpenMaya
 # import ExportModule
 # reload(ExportModule)
 from ExportModule import ExportModule
+from NumberFormat import formatFloats
 
 
 class Light(ExportModule):
@@ -103,7 +104,7 @@ class DistantLight(Light):
         self.addToOutput( 'TransformBegin' )
         self.addToOutput( self.translationMatrix( self.dagPath ) )
         self.addToOutput( '\tLightSource "distant"' )
-        self.addToOutput( '\t\t"color L" [%f %f %f]' % (colorR, colorG, colorB) )
+        self.addToOutput( formatFloats( '\t\t"color L" [%f %f %f]', (colorR, colorG, colorB) ) )
         self.addToOutput( '\t\t"point from" [0 0 0]')
         self.addToOutput( '\t\t"point to" [0 0 -1]' )
         self.addToOutput( 'TransformEnd' )
@@ -144,11 +145,11 @@ class SpotLight(Light):
         self.addToOutput( 'TransformBegin' )
         self.addToOutput( self.translationMatrix( self.dagPath ) )
         self.addToOutput( '\tLightSource "spot"' )
-        self.addToOutput( '\t\t"color I" [%f %f %f]' % (colorR, colorG, colorB) )
+        self.addToOutput( formatFloats( '\t\t"color I" [%f %f %f]', (colorR, colorG, colorB) ) )
         self.addToOutput( '\t\t"point from" [0 0 0]')
         self.addToOutput( '\t\t"point to" [0 0 -1]' )
-        self.addToOutput( '\t\t"float coneangle" [%f]' % ( self.light.coneAngle()*180/math.pi ) )
-        self.addToOutput( '\t\t"float conedeltaangle" [%f]' % ( self.light.dropOff()*180/math.pi ) )
+        self.addToOutput( formatFloats( '\t\t"float coneangle" [%f]', ( self.light.coneAngle()*180/math.pi, ) ) )
+        self.addToOutput( formatFloats( '\t\t"float conedeltaangle" [%f]', ( self.light.dropOff()*180/math.pi, ) ) )
         self.addToOutput( 'TransformEnd' )
         self.addToOutput( '' )
         
@@ -187,6 +188,6 @@ class PointLight(Light):
         self.addToOutput( 'TransformBegin' )
         self.addToOutput( self.translationMatrix( self.dagPath ) )
         self.addToOutput( '\tLightSource "point"' )
-        self.addToOutput( '\t\t"color I" [%f %f %f]' % (colorR, colorG, colorB) )
+        self.addToOutput( formatFloats( '\t\t"color I" [%f %f %f]', (colorR, colorG, colorB) ) )
         self.addToOutput( 'TransformEnd' )
         self.addToOutput( '' )
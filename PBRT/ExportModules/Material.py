@@ -20,6 +20,7 @@ from maya import OpenMaya
 from maya import cmds
 
 from ExportModule import ExportModule
+from NumberFormat import formatFloats
 
 
 class MaterialBase:
@@ -109,7 +110,7 @@ class MaterialLambert(ExportModule, MaterialBase):
         Kd = tuple(cmds.getAttr('%s.color'%self.shaderName)[0])
         self.addToOutput( '# Translated Lambert Material ' + self.shaderName )
         self.addToOutput( 'MakeNamedMaterial "%s" "string type" ["matte"]'%self.shaderName)
-        self.addToOutput( '\t "color Kd" [%f %f %f] '%Kd)
+        self.addToOutput( formatFloats( '\t "color Kd" [%f %f %f] ', Kd ) )
         self.addToOutput('')
         
 
@@ -137,7 +138,7 @@ class MaterialBlinn(ExportModule, MaterialBase):
         
         self.addToOutput( '# Translated Blinn Material ' + self.dpNode.name() )
         self.addToOutput( 'MakeNamedMaterial "%s" "string type" ["plastic"]'%self.shaderName)
-        self.addToOutput( '\t "color Kd" [%f %f %f] '%Kd)
-        self.addToOutput( '\t "color Ks" [%f %f %f] '%Ks)
-        self.addToOutput( '\t "float roughness" [%f] '%roughness)
+        self.addToOutput( formatFloats( '\t "color Kd" [%f %f %f] ', Kd ) )
+        self.addToOutput( formatFloats( '\t "color Ks" [%f %f %f] ', Ks ) )
+        self.addToOutput( formatFloats( '\t "float roughness" [%f] ', (roughness,) ) )
         self.addToOutput('')
@@ -0,0 +1,345 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Bulk trianglemesh compiler used by MeshOpt. Works on flat whole-mesh arrays
+# (triangulation, normal ids, uv ids) with numpy instead of walking every face
+# vertex through MItMeshPolygon. Also holds the face-relative index lookup used
+# by the MItMeshPolygon loop. This module does not import maya, MeshOpt is
+# responsible for fetching the arrays.
+#
+# ------------------------------------------------------------------------------
+
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# size of an int object, for the keys and values of the loop's vertex dict
+INT_BYTES = sys.getsizeof(1 << 20)
+
+
+def isAvailable():
+    """
+    The bulk compiler needs numpy, which is not shipped with every Maya version.
+    """
+    return numpy is not None
+
+
+class CompiledMesh:
+    """
+    Result of the compile stage: trianglemesh buffers ready to be written out.
+    Vertices are in first-seen order, same as the MItMeshPolygon loop in MeshOpt.
+    """
+
+    def __init__(self, indices, points, normals, uvs, pointIds = None, normalIds = None, uvIds = None):
+        self.indices = indices  # int32, 3 per triangle
+        self.points = points    # float, (n,3)
+        self.normals = normals  # float, (n,3)
+        self.uvs = uvs          # float, (n,2) or None
+        # point, normal and uv id each vertex was taken from, for TopologyCache
+        self.pointIds = pointIds
+        self.normalIds = normalIds
+        self.uvIds = uvIds
+
+
+def localIndexMap(faceVertices, count):
+    """
+    To quote the C++ source:
+        // MItMeshPolygon::getTriangle() returns object-relative vertex
+        // indices; BUT MItMeshPolygon::normalIndex() and ::getNormal() need
+        // face-relative vertex indices! This converts vertex indices from
+        // object-relative to face-relative.
+    Built once per face from its vertex list (MIntArray or list), so the lookup
+    of every triangle vertex is a dict access instead of a scan of the face.
+    If a vertex appears twice in a face the first one is used. Does not need numpy.
+    """
+
+    indexMap = {}
+    for i in xrange(count-1, -1, -1):
+        indexMap[ faceVertices[i] ] = i
+    return indexMap
+
+
+def bufferBytes(*buffers):
+    """
+    Memory held by the given compile buffers: numpy arrays, array module
+    arrays, and the (vertex, normal, uv) dict of the MItMeshPolygon loop, whose
+    int keys and values are counted at sys.getsizeof(int) each. None is
+    skipped. Does not need numpy.
+    """
+
+    total = 0
+    for values in buffers:
+        if values is None:
+            continue
+        if hasattr(values, 'nbytes'):
+            total += values.nbytes
+        elif hasattr(values, 'itemsize'):
+            total += values.itemsize * len(values)
+        elif isinstance(values, dict):
+            total += sys.getsizeof(values) + 2 * INT_BYTES * len(values)
+        else:
+            total += sys.getsizeof(values)
+    return total
+
+
+class BufferStats:
+    """
+    Compile buffer memory of an export, one add() per compiled set.
+    """
+
+    def __init__(self):
+        self.peakBytes = 0
+        self.peakVertices = 0
+        self.totalBytes = 0
+        self.totalVertices = 0
+
+    def add(self, bufferBytes, vertexCount):
+        if bufferBytes > self.peakBytes:
+            self.peakBytes = bufferBytes
+            self.peakVertices = vertexCount
+        self.totalBytes += bufferBytes
+        self.totalVertices += vertexCount
+
+    def bytesPerVertex(self):
+        return float(self.peakBytes) / max(1, self.peakVertices)
+
+    def summary(self):
+        return 'Mesh buffers: peak %.1f MB for %i vertices (%.1f bytes per vertex), %.1f bytes per vertex overall' % (
+            self.peakBytes / 1048576.0, self.peakVertices, self.bytesPerVertex(),
+            float(self.totalBytes) / max(1, self.totalVertices))
+
+
+def expandFaceVertexIds(faceVertexCounts, idCounts, ids):
+    """
+    MFnMesh.getAssignedUVs only lists ids for mapped faces. Spread them over all
+    face-vertices, with -1 on faces that have no uvs.
+    """
+
+    faceVertexCounts = numpy.asarray(faceVertexCounts, dtype=numpy.int64)
+    mapped = numpy.asarray(idCounts, dtype=numpy.int64) == faceVertexCounts
+    expanded = numpy.zeros(int(faceVertexCounts.sum()), dtype=numpy.int32) - 1
+    expanded[numpy.repeat(mapped, faceVertexCounts)] = numpy.asarray(ids, dtype=numpy.int32)
+    return expanded
+
+
+def triangleFaceVertices(faceVertexCounts, faceVertices, triangleCounts, triangleVertices):
+    """
+    Whole-mesh equivalent of MeshOpt.GetLocalIndex. MFnMesh.getTriangles returns
+    object-relative vertex indices, but normal and uv ids are stored per
+    face-vertex. For every triangle corner this returns the index of the matching
+    face-vertex in the flat face-vertex arrays, or -1 if the vertex is not part
+    of the triangle's face. Also returns the face index of every corner.
+    """
+
+    faceVertexCounts = numpy.asarray(faceVertexCounts, dtype=numpy.int64)
+    faceVertices = numpy.asarray(faceVertices, dtype=numpy.int64)
+    triangleVertices = numpy.asarray(triangleVertices, dtype=numpy.int64)
+
+    numFaces = len(faceVertexCounts)
+    stride = int(faceVertices.max()) + 1 if len(faceVertices) else 1
+
+    # (face, vertex) keys of every face-vertex, searched by every triangle corner.
+    # A stable sort keeps the first match, like GetLocalIndex does.
+    faceOfFaceVertex = numpy.repeat(numpy.arange(numFaces, dtype=numpy.int64), faceVertexCounts)
+    keys = faceOfFaceVertex * stride + faceVertices
+    order = numpy.argsort(keys, kind='mergesort')
+    sortedKeys = keys[order]
+
+    cornerFaces = numpy.repeat(numpy.arange(numFaces, dtype=numpy.int64), numpy.asarray(triangleCounts, dtype=numpy.int64) * 3)
+    cornerKeys = cornerFaces * stride + triangleVertices
+
+    if len(sortedKeys) == 0:
+        return numpy.zeros(len(cornerKeys), dtype=numpy.int64) - 1, cornerFaces
+
+    pos = numpy.searchsorted(sortedKeys, cornerKeys)
+    numpy.clip(pos, 0, len(sortedKeys)-1, out=pos)
+    cornerFaceVertices = order[pos]
+    cornerFaceVertices[sortedKeys[pos] != cornerKeys] = -1
+
+    return cornerFaceVertices, cornerFaces
+
+
+class MeshData:
+    """
+    Whole-mesh arrays, fetched once per mesh by MeshOpt and shared by all of its
+    shading sets. The triangle corner to face-vertex mapping is also computed
+    once here.
+    """
+
+    def __init__(self, points, normals, uvs,
+                 faceVertexCounts, faceVertices,
+                 triangleCounts, triangleVertices,
+                 normalIds, uvIds = None):
+
+        self.points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+        self.normals = numpy.asarray(normals, dtype=numpy.float32).reshape(-1, 3)
+        self.uvs = None
+        if uvs is not None:
+            self.uvs = numpy.asarray(uvs, dtype=numpy.float32).reshape(-1, 2)
+
+        self.faceVertexCounts = numpy.asarray(faceVertexCounts, dtype=numpy.int32)
+        self.triangleCounts = numpy.asarray(triangleCounts, dtype=numpy.int32)
+        self.triangleVertices = numpy.asarray(triangleVertices, dtype=numpy.int32)
+        self.normalIds = numpy.asarray(normalIds, dtype=numpy.int32)
+        self.uvIds = None
+        if uvIds is not None:
+            self.uvIds = numpy.asarray(uvIds, dtype=numpy.int32)
+
+        self.cornerFaceVertices, self.cornerFaces = triangleFaceVertices(faceVertexCounts, faceVertices, triangleCounts, triangleVertices)
+        self.setCorners = []
+
+    def nbytes(self):
+        """
+        Memory held by the whole-mesh arrays.
+        """
+        total = 0
+        for values in (self.points, self.normals, self.uvs,
+                       self.faceVertexCounts, self.triangleCounts, self.triangleVertices,
+                       self.normalIds, self.uvIds, self.cornerFaceVertices, self.cornerFaces):
+            if values is not None:
+                total += values.nbytes
+        for corners in self.setCorners:
+            total += corners.nbytes
+        return total
+
+    def splitSets(self, setFaces):
+        """
+        Split the triangle corners by shading set in one pass. setFaces holds
+        the face indices of every set, or None for a set covering the whole
+        mesh. Corners keep their triangle order within a set.
+        """
+
+        faceSet = numpy.zeros(len(self.faceVertexCounts), dtype=numpy.int32) - 1
+        for iSet, faces in enumerate(setFaces):
+            if faces is not None and len(faces):
+                faceSet[numpy.asarray(faces, dtype=numpy.int64)] = iSet
+
+        cornerSet = faceSet[self.cornerFaces]
+        order = numpy.argsort(cornerSet, kind='mergesort')
+        bounds = numpy.searchsorted(cornerSet[order], numpy.arange(len(setFaces) + 1))
+
+        allCorners = numpy.arange(len(self.cornerFaces))
+        self.setCorners = []
+        for iSet, faces in enumerate(setFaces):
+            if faces is None:
+                self.setCorners.append(allCorners)
+            else:
+                self.setCorners.append(order[bounds[iSet]:bounds[iSet+1]])
+
+
+def isFlatShaded(meshData, corners = None, tolerance = 1e-3):
+    """
+    Does every triangle corner (of the given corners, all if None) have the
+    normal of its triangle's plane, so that the normals can be left out and
+    the renderer uses the geometric normal. Degenerate triangles pass.
+    """
+
+    triangleVertices = meshData.triangleVertices
+    cornerFaceVertices = meshData.cornerFaceVertices
+    if corners is not None:
+        triangleVertices = triangleVertices[corners]
+        cornerFaceVertices = cornerFaceVertices[corners]
+    if len(cornerFaceVertices) == 0:
+        return True
+    if cornerFaceVertices.min() < 0:
+        return False
+
+    points = meshData.points[triangleVertices].reshape(-1, 3, 3)
+    planeNormals = numpy.cross(points[:,1] - points[:,0], points[:,2] - points[:,0])
+    lengths = numpy.sqrt((planeNormals * planeNormals).sum(1))
+    planeNormals /= numpy.where(lengths > 0, lengths, 1.0)[:,None]
+
+    cornerNormals = meshData.normals[meshData.normalIds[cornerFaceVertices]].reshape(-1, 3, 3)
+    cornerLengths = numpy.sqrt((cornerNormals * cornerNormals).sum(2))
+    cosines = (cornerNormals * planeNormals[:,None,:]).sum(2) / numpy.where(cornerLengths > 0, cornerLengths, 1.0)
+    return bool(((cosines >= 1.0 - tolerance) | (lengths[:,None] == 0)).all())
+
+
+def compileTriangles(meshData, corners = None, withUVs = True, withNormals = True):
+    """
+    Build the trianglemesh buffers from the given triangle corners of meshData
+    (all corners if None). Corners are deduplicated on (vertex, normal, uv)
+    ids, or (vertex, normal) when there are no uvs or some of the faces are not
+    mapped. Without normals the normal ids are left out of the key, the
+    normals buffer then holds the normal of the first corner of each vertex.
+    Returns a CompiledMesh, or None if the triangulation could not be matched
+    to the face-vertices, in which case the caller should fall back to the
+    MItMeshPolygon loop.
+    """
+
+    cornerFaceVertices = meshData.cornerFaceVertices
+    cornerVertices = meshData.triangleVertices
+    if corners is not None:
+        cornerFaceVertices = cornerFaceVertices[corners]
+        cornerVertices = cornerVertices[corners]
+
+    if len(cornerFaceVertices) and cornerFaceVertices.min() < 0:
+        return None
+
+    cornerNormals = meshData.normalIds[cornerFaceVertices]
+
+    # unmapped faces have uv id -1: export the set without uvs, like the loop does
+    cornerUVs = None
+    if withUVs and meshData.uvIds is not None:
+        cornerUVs = meshData.uvIds[cornerFaceVertices]
+        if len(cornerUVs) and cornerUVs.min() < 0:
+            cornerUVs = None
+
+    fields = [('v', numpy.int32)]
+    if withNormals:
+        fields.append(('n', numpy.int32))
+    if cornerUVs is not None:
+        fields.append(('t', numpy.int32))
+    keys = numpy.empty(len(cornerVertices), dtype=fields)
+    keys['v'] = cornerVertices
+    if withNormals:
+        keys['n'] = cornerNormals
+    if cornerUVs is not None:
+        keys['t'] = cornerUVs
+
+    _, first, inverse = numpy.unique(keys, return_index=True, return_inverse=True)
+
+    # np.unique sorts by key; renumber the vertices in first-seen order
+    order = numpy.argsort(first, kind='mergesort')
+    rank = numpy.empty(len(order), dtype=numpy.int32)
+    rank[order] = numpy.arange(len(order), dtype=numpy.int32)
+    indices = rank[inverse]
+    firstCorners = first[order]
+
+    pointIds = cornerVertices[firstCorners]
+    normalIds = cornerNormals[firstCorners]
+    uvIds = None
+    if cornerUVs is not None:
+        uvIds = cornerUVs[firstCorners]
+
+    return gatherVertices(indices, meshData.points, meshData.normals, meshData.uvs, pointIds, normalIds, uvIds)
+
+
+def gatherVertices(indices, points, normals, uvs, pointIds, normalIds, uvIds = None):
+    """
+    CompiledMesh of an index buffer whose vertices take their values from the
+    given point, normal and uv ids: the end of compileTriangles, and all that
+    is left to do on a TopologyCache hit.
+    """
+
+    pointIds = numpy.asarray(pointIds)
+    normalIds = numpy.asarray(normalIds)
+    outPoints = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)[pointIds]
+    outNormals = numpy.asarray(normals, dtype=numpy.float32).reshape(-1, 3)[normalIds]
+    outUVs = None
+    if uvIds is not None:
+        uvIds = numpy.asarray(uvIds)
+        outUVs = numpy.asarray(uvs, dtype=numpy.float32).reshape(-1, 2)[uvIds]
+
+    return CompiledMesh(indices, outPoints, outNormals, outUVs, pointIds, normalIds, uvIds)
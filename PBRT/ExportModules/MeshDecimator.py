@@ -0,0 +1,263 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Screen-space level of detail. LevelOfDetail decides how many triangles of a
+# mesh to keep from its projected size in pixels, decimate() reduces the
+# compiled trianglemesh buffers of MeshOpt to that many triangles with
+# quadric-error vertex clustering: vertices are merged per cell of a uniform
+# grid, and every cell vertex is placed where the summed face quadrics of its
+# vertices are smallest. Needs numpy, does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# no mesh goes below this fraction of its triangles
+MIN_RATIO = 0.01
+# nor below this many triangles
+MIN_TRIANGLES = 12
+# grid resolutions tried when searching the one that gives the wanted triangle count
+SEARCH_STEPS = 12
+
+
+def isAvailable():
+    return numpy is not None
+
+
+def quantizeRatio(ratio):
+    """
+    Round a keep ratio down to a power of sqrt(2), so that a small camera move
+    does not change the decimated geometry (and its geometry cache key).
+    """
+    if ratio >= 1.0:
+        return 1.0
+    return 2.0 ** (-math.ceil(-2.0 * math.log(ratio, 2)) / 2.0)
+
+
+class LevelOfDetail:
+    """
+    Keep ratios and triangle statistics of the whole export. projection is
+    anything with projectedPixels(center, radius), the projected diameter of a
+    bounding sphere in pixels, None if the camera is inside it
+    (Camera.CameraProjection).
+    """
+
+    def __init__(self, projection, thresholdPixels, minRatio = MIN_RATIO):
+        self.projection = projection
+        self.thresholdPixels = float(thresholdPixels)
+        self.minRatio = minRatio
+
+        self.meshes = 0
+        self.meshesDecimated = 0
+        self.trianglesIn = 0
+        self.trianglesOut = 0
+
+    def keepRatio(self, center, radius, override = None):
+        """
+        Fraction of the triangles to keep. override is the per-object ratio,
+        None or negative for automatic, 1 or more to never decimate.
+        """
+
+        if override is not None and override >= 0:
+            return min(1.0, max(self.minRatio, override))
+
+        pixels = self.projection.projectedPixels(center, radius)
+        if pixels is None or pixels >= self.thresholdPixels:
+            return 1.0
+        ratio = (pixels / self.thresholdPixels) ** 2
+        return quantizeRatio(max(self.minRatio, ratio))
+
+    def record(self, trianglesBefore, trianglesAfter):
+        self.meshes += 1
+        if trianglesAfter < trianglesBefore:
+            self.meshesDecimated += 1
+        self.trianglesIn += trianglesBefore
+        self.trianglesOut += trianglesAfter
+
+    def summary(self):
+        saved = 0.0
+        if self.trianglesIn:
+            saved = 100.0 * (self.trianglesIn - self.trianglesOut) / self.trianglesIn
+        return 'Level of detail: %i of %i shapes decimated, %i -> %i triangles (%.1f%% saved)' % \
+               (self.meshesDecimated, self.meshes, self.trianglesIn, self.trianglesOut, saved)
+
+
+def faceQuadrics(points, triangles):
+    """
+    Area weighted plane quadric of every triangle, as the 6 terms of the
+    symmetric matrix A = n n^T and the vector b = d n (plane n.x + d = 0).
+    """
+
+    p0 = points[triangles[:,0]]
+    normals = numpy.cross(points[triangles[:,1]] - p0, points[triangles[:,2]] - p0)
+    # |cross| is twice the area: unit normal times sqrt(area)
+    lengths = numpy.sqrt((normals * normals).sum(1))
+    scale = numpy.where(lengths > 0, numpy.sqrt(0.5 / numpy.maximum(lengths, 1e-300)), 0.0)
+    n = normals * scale[:,None]
+    d = -(n * p0).sum(1)
+    x, y, z = n[:,0], n[:,1], n[:,2]
+    return numpy.column_stack( (x*x, x*y, x*z, y*y, y*z, z*z, d*x, d*y, d*z) )
+
+
+def clusterVertices(points, lower, cellSize):
+    """
+    Cluster index of every vertex, clusters numbered in order of their first vertex.
+    """
+
+    cells = numpy.floor((points - lower) / cellSize).astype(numpy.int64)
+    dims = cells.max(0) + 1
+    cellIds = (cells[:,0] * dims[1] + cells[:,1]) * dims[2] + cells[:,2]
+    first, clusters = numpy.unique(cellIds, return_index = True, return_inverse = True)[1:]
+    # renumber by first vertex, so that the output keeps the vertex order
+    order = numpy.argsort(first)
+    rank = numpy.empty(len(order), numpy.int64)
+    rank[order] = numpy.arange(len(order))
+    return rank[clusters], len(order)
+
+
+def collapseTriangles(triangles, clusters, clusterCount):
+    """
+    Triangles in cluster indices, without the degenerate and duplicated ones.
+    """
+
+    collapsed = clusters[triangles]
+    a, b, c = collapsed[:,0], collapsed[:,1], collapsed[:,2]
+    collapsed = collapsed[(a != b) & (b != c) & (a != c)]
+    if len(collapsed) == 0:
+        return collapsed
+
+    # same three vertices in any order: keep the first one (the key has to fit in 64 bits)
+    if clusterCount >= 1 << 21:
+        return collapsed
+    corners = numpy.sort(collapsed, 1)
+    keys = (corners[:,0] * clusterCount + corners[:,1]) * clusterCount + corners[:,2]
+    first = numpy.unique(keys, return_index = True)[1]
+    return collapsed[numpy.sort(first)]
+
+
+def clusterPositions(points, triangles, clusters, clusterCount, cellSize):
+    """
+    Position of every cluster that minimizes the summed quadrics of the faces
+    around its vertices. Falls back to the mean of its vertices where the
+    quadric is singular (flat or straight regions) or the minimum is outside
+    of the cell.
+    """
+
+    counts = numpy.bincount(clusters, minlength = clusterCount).astype(numpy.float64)
+    mean = numpy.column_stack( [numpy.bincount(clusters, points[:,i], clusterCount) for i in range(3)] ) / counts[:,None]
+
+    faceQ = faceQuadrics(points, triangles)
+    cornerClusters = clusters[triangles].reshape(-1)
+    cornerQ = numpy.repeat(faceQ, 3, 0)
+    q = numpy.column_stack( [numpy.bincount(cornerClusters, cornerQ[:,i], clusterCount) for i in range(9)] )
+    axx, axy, axz, ayy, ayz, azz = q[:,0], q[:,1], q[:,2], q[:,3], q[:,4], q[:,5]
+
+    # solve A (mean + delta) = -b for delta, by cofactors
+    r = -(q[:,6:9] + numpy.column_stack( (axx*mean[:,0] + axy*mean[:,1] + axz*mean[:,2],
+                                          axy*mean[:,0] + ayy*mean[:,1] + ayz*mean[:,2],
+                                          axz*mean[:,0] + ayz*mean[:,1] + azz*mean[:,2]) ))
+    c00 = ayy*azz - ayz*ayz
+    c01 = axz*ayz - axy*azz
+    c02 = axy*ayz - axz*ayy
+    c11 = axx*azz - axz*axz
+    c12 = axy*axz - axx*ayz
+    c22 = axx*ayy - axy*axy
+    det = axx*c00 + axy*c01 + axz*c02
+    trace = axx + ayy + azz
+    solvable = numpy.abs(det) > 1e-6 * trace ** 3
+    det = numpy.where(solvable, det, 1.0)
+    delta = numpy.column_stack( ((c00*r[:,0] + c01*r[:,1] + c02*r[:,2]) / det,
+                                 (c01*r[:,0] + c11*r[:,1] + c12*r[:,2]) / det,
+                                 (c02*r[:,0] + c12*r[:,1] + c22*r[:,2]) / det) )
+    solvable &= (numpy.abs(delta) <= cellSize).all(1)
+    return numpy.where(solvable[:,None], mean + delta, mean)
+
+
+def clusterAverage(values, clusters, clusterCount, width):
+    values = numpy.asarray(values, numpy.float64).reshape(-1, width)
+    sums = numpy.column_stack( [numpy.bincount(clusters, values[:,i], clusterCount) for i in range(width)] )
+    return sums / numpy.bincount(clusters, minlength = clusterCount)[:,None]
+
+
+def decimate(indices, points, normals, uvs, keepRatio, minTriangles = MIN_TRIANGLES):
+    """
+    Reduce flat trianglemesh buffers (MeshOpt.vertIndexList, ...) to about
+    keepRatio of their triangles. Normals and uvs are averaged per cluster.
+    Returns (indices, points, normals, uvs) as flat numpy arrays of the input
+    types, uvs None if there were none, or None if the mesh is left as it is.
+    """
+
+    triangles = numpy.asarray(indices, numpy.int64).reshape(-1, 3)
+    triangleCount = len(triangles)
+    target = max(minTriangles, int(triangleCount * keepRatio))
+    if target >= triangleCount:
+        return None
+
+    pointArray = numpy.asarray(points, numpy.float64).reshape(-1, 3)
+    lower = pointArray.min(0)
+    extent = float((pointArray.max(0) - lower).max())
+    if extent <= 0:
+        return None
+
+    # search the finest grid that gives at most target triangles: resolution
+    # is the number of cells along the longest side
+    low, high = 1.0, max(2.0, 4.0 * math.sqrt(len(pointArray)))
+    best = None
+    for step in range(SEARCH_STEPS):
+        resolution = math.sqrt(low * high)
+        cellSize = extent / resolution * (1.0 + 1e-9)
+        clusters, clusterCount = clusterVertices(pointArray, lower, cellSize)
+        collapsed = collapseTriangles(triangles, clusters, clusterCount)
+        if 0 < len(collapsed) <= target:
+            low = resolution
+            if best is None or len(collapsed) > len(best[1]):
+                best = (clusters, collapsed, clusterCount, cellSize)
+        elif len(collapsed) == 0:
+            low = resolution
+        else:
+            high = resolution
+    if best is None:
+        return None
+    clusters, collapsed, clusterCount, cellSize = best
+
+    positions = clusterPositions(pointArray, triangles, clusters, clusterCount, cellSize)
+    vertexNormals = clusterAverage(normals, clusters, clusterCount, 3)
+    lengths = numpy.sqrt((vertexNormals * vertexNormals).sum(1))
+    vertexNormals /= numpy.where(lengths > 0, lengths, 1.0)[:,None]
+    vertexUVs = None
+    if uvs is not None and len(uvs):
+        vertexUVs = clusterAverage(uvs, clusters, clusterCount, 2)
+
+    # drop the clusters no triangle uses any more, in first-use order
+    used, first = numpy.unique(collapsed.reshape(-1), return_index = True)
+    used = used[numpy.argsort(first)]
+    remap = numpy.empty(clusterCount, numpy.int64)
+    remap[used] = numpy.arange(len(used))
+
+    def flat(values, like):
+        # same type as the input buffer: numpy array or array module array
+        dtype = getattr(like, 'dtype', None)
+        if dtype is None:
+            dtype = numpy.dtype(like.typecode)
+        return numpy.ascontiguousarray(values[used].reshape(-1), dtype)
+
+    newUVs = None
+    if vertexUVs is not None:
+        newUVs = flat(vertexUVs, uvs)
+    return ( numpy.ascontiguousarray(remap[collapsed].reshape(-1), numpy.int32),
+             flat(positions, points),
+             flat(vertexNormals, normals),
+             newUVs )
@@ -0,0 +1,96 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Geometry deduplication: meshes that are copies of each other (not Maya
+# instances) are written once between ObjectBegin/ObjectEnd and placed with
+# ObjectInstance, see MeshOpt.getObjectOrInstance.
+#
+# ------------------------------------------------------------------------------
+
+from maya import OpenMaya
+
+
+class MeshDuplicates:
+    """
+    A pre-pass groups the exported meshes by their vertex, face and
+    face-vertex counts, which is cheap to get, then hashes the content of the
+    sets of the meshes in groups of two or more (the geometry cache key: mesh
+    data, set faces, material, shape settings). Only sets whose key occurs at
+    least twice are instanced, MeshOpt asks objectFor() for their object;
+    every other set is written inline. In pbrt every object gets its own
+    accelerator, an object with a single instance only costs render time.
+    """
+
+    def __init__(self):
+        self.signatureCounts = {}
+        # (shape path, set) -> content key of the sets of candidate meshes
+        self.setKeys = {}
+        # content key -> number of exported sets with it
+        self.keyCounts = {}
+        self.objects = {}
+        self.instanceCount = 0
+
+    @staticmethod
+    def signature(fnMesh):
+        return (fnMesh.numVertices(), fnMesh.numPolygons(), fnMesh.numFaceVertices())
+
+    def collect(self, dagPaths, isExported, setKeys):
+        """
+        Count the signatures of the mesh dagPaths for which isExported(dagPath)
+        is true, then the content keys of the meshes that share theirs:
+        setKeys(dagPath) gives the (set, key) of each set that can be
+        instanced (MeshOpt.duplicateKeys). Maya instances are exported as
+        instances already and are left out.
+        """
+
+        exported = []
+        for dagPath in dagPaths:
+            if not dagPath.isInstanced() and isExported(dagPath):
+                exported.append(dagPath)
+                signature = self.signature(OpenMaya.MFnMesh(dagPath))
+                self.signatureCounts[signature] = self.signatureCounts.get(signature, 0) + 1
+
+        for dagPath in exported:
+            if not self.isCandidate(OpenMaya.MFnMesh(dagPath)):
+                continue
+            pathName = dagPath.fullPathName()
+            for iSet, key in setKeys(dagPath):
+                self.setKeys[(pathName, iSet)] = key
+                self.keyCounts[key] = self.keyCounts.get(key, 0) + 1
+
+    def isCandidate(self, fnMesh):
+        return self.signatureCounts.get(self.signature(fnMesh), 0) > 1
+
+    def sharedKey(self, pathName, iSet):
+        """
+        Content key of the given set of the shape at pathName if another
+        exported set has the same content, None otherwise.
+        """
+
+        key = self.setKeys.get((pathName, iSet))
+        if key is None or self.keyCounts[key] < 2:
+            return None
+        return key
+
+    def objectFor(self, key, objectName):
+        """
+        The object name for the geometry with the given content key and
+        whether it is new, i.e. still has to be written. objectName is used
+        for new objects.
+        """
+
+        self.instanceCount += 1
+        if key in self.objects:
+            return self.objects[key], False
+        self.objects[key] = objectName
+        return objectName, True
+
+    def summary(self):
+        return 'Mesh deduplication: %i objects, %i instances' % (len(self.objects), self.instanceCount)
@@ -16,11 +16,33 @@
 # ------------------------------------------------------------------------------
 
 import time, os
+from array import array
 from maya import OpenMaya
+from maya import cmds
 
 import ExportModule
 reload(ExportModule)
 from ExportModule import ShadedObject
+import MeshCompiler
+import PlyWriter
+import MeshDecimator
+import NumberFormat
+from GeometryCache import GeometryCache
+from TopologyCache import TopologyEntry
+
+
+def mArrayToList(mArray):
+    return [mArray[i] for i in xrange(mArray.length())]
+
+def mVectorArrayToList(mArray):
+    """
+    MPointArray/MFloatVectorArray to a list of (x, y, z) tuples
+    """
+    out = []
+    for i in xrange(mArray.length()):
+        v = mArray[i]
+        out.append( (v.x, v.y, v.z) )
+    return out
 
 
 class MeshOpt(ShadedObject):
@@ -29,7 +51,14 @@ class MeshOpt(ShadedObject):
     """
 
     doBenchmark = False
-    doProfiling = False
+    # doBenchmark appends "vertices,verts/sec,written verts/sec" lines to this file, if set
+    benchmarkFileName = None
+    
+    # compile with MeshCompiler (numpy) when it is available, the
+    # MItMeshPolygon loop is kept as a fallback
+    useBulkCompile = True
+    # also run the loop and compare its output to the bulk compile
+    doValidate = False
 
     fShape = OpenMaya.MFnMesh()
     isInstanced = False
@@ -39,17 +68,60 @@ class MeshOpt(ShadedObject):
     UVSets = []
     currentUVSet = 0
     
-    vertNormUVList = {}
-    vertIndexList = []
-    vertPointList = []
-    vertNormList = []
-    vertUVList = []
+    # whole-mesh data, fetched once by extractMeshData
+    meshPoints = None
+    meshNormals = None
+    meshUArray = None
+    meshVArray = None
+    # whole-mesh data of the bulk compile, built on first use by getMeshData
+    meshData = None
+    hasMeshData = False
+    meshKey = None
+    meshTopologyKey = None
+    
+    # GeometryCache shared by the whole export, set up by the Exporter
+    geometryCache = None
+    # MeshDuplicates of the whole export, set up by the Exporter
+    meshDuplicates = None
+    # (shape name, set) of the instanced shapes whose ObjectBegin is written,
+    # set up per export by the Exporter: the first exported instance defines
+    # the object, instance 0 may be hidden or culled. Instance 0 does without it
+    instancedObjects = None
+    
+    # compiled vertex buffers of the current set, flat typed arrays (array
+    # module or numpy), set up per set by resetLists or compileBulk
+    vertNormUVList = None
+    vertIndexList = None
+    vertPointList = None
+    vertNormList = None
+    vertUVList = None
+    
+    # MeshCompiler.BufferStats of the whole export, set up by the Exporter
+    bufferStats = None
+    # ExportReport.GeometryStats of a reported export, set up by the Exporter
+    geometryStats = None
+    
+    # TopologyCache of a frame range export, set up by the Exporter
+    topologyCache = None
+    
+    # MeshDecimator.LevelOfDetail of the whole export, set up by the Exporter
+    levelOfDetail = None
+    # keep ratio of the current mesh, from getLodRatio
+    lodRatio = None
     
     fileHandle = int()
     
     # used to determine appropriate UV and Normals output
-    mode = 'trianglemesh' # or loopsubdiv
+    mode = 'trianglemesh' # or loopsubdiv, plymesh
     type = 'geom' # or portal
+    
+    # pbrt_settings.scene_mesh_format: trianglemesh blocks, or binary plymesh sidecar files
+    meshFormat = 'trianglemesh'
+    
+    # pbrt_settings.scene_strip_attributes: leave out the uvs and normals the shading does not need
+    stripAttributes = False
+    # set -> (needsUVs, needsNormals) of the current mesh, from getVertexAttributes
+    vertexAttributes = None
 
     def __init__(self, fileHandles, dagPath):
         
@@ -59,6 +131,8 @@ class MeshOpt(ShadedObject):
         
 
         self.type = 'geom'
+        self.meshFormat = cmds.getAttr( 'pbrt_settings.scene_mesh_format', asString = True )
+        self.stripAttributes = cmds.getAttr( 'pbrt_settings.scene_strip_attributes' ) == 1
             
         dagPath.extendToShape()
 
@@ -102,13 +176,18 @@ class MeshOpt(ShadedObject):
 
                         
            
-    def resetLists(self):
-        # reset lists
+    def resetLists(self, triangleCount = 0):
+        """
+        Empty buffers for the MItMeshPolygon loop. The index buffer is
+        preallocated for triangleCount triangles, the vertex buffers grow as
+        vertices are found. Points are doubles like MPoint, normals and uvs
+        floats like MFloatVector and MFloatArray.
+        """
         self.vertNormUVList = {}
-        self.vertIndexList = []
-        self.vertPointList = []
-        self.vertNormList = []
-        self.vertUVList = []
+        self.vertIndexList = array('i', [0]) * (3 * triangleCount)
+        self.vertPointList = array('d')
+        self.vertNormList = array('f')
+        self.vertUVList = array('f')
         
         
     def deleteLists(self):
@@ -121,26 +200,19 @@ class MeshOpt(ShadedObject):
 
     def getOutput(self):
         
-        if self.doProfiling:
-            import hotshot, hotshot.stats
-            prof = hotshot.Profile("meshopt.prof")
-            benchtime = prof.runcall(self.getOutput_real)
-            prof.close()
-            stats = hotshot.stats.load("meshopt.prof")
-            stats.strip_dirs()
-            stats.sort_stats('time','calls')
-            stats.print_stats(20)
-        else:
-            self.getOutput_real()
+        # profiling: see ExportProfiler, it covers every export module
+        self.getOutput_real()
         
 
     def getObjectOrInstance(self, iSet):
         
         if self.isInstanced:
-            if self.instanceNum == 0:
+            if self.isFirstInstance(iSet):
                 self.addToOutput( '# Polygon Shape %s (set %i, instanced)' % (self.dagPath.fullPathName(), iSet ) )
                 self.addToOutput( 'ObjectBegin "%s"' % (self.fShape.name()) )
-                self.getGeometry(iSet)
+                self.beginStats()
+                self.getCachedGeometry(iSet)
+                self.endStats(self.fShape.name())
                 self.addToOutput( 'ObjectEnd' )
                 self.addToOutput( '' )
                 self.fileHandle.flush()
@@ -150,6 +222,30 @@ class MeshOpt(ShadedObject):
             self.addToOutput( self.translationMatrix(self.dagPath) )
             self.addToOutput( '\tObjectInstance "%s"' % (self.fShape.name()) )            
             self.addToOutput( 'AttributeEnd' )
+            if self.geometryStats is not None:
+                self.geometryStats.addReference(self.fShape.name())
+            self.addToOutput( '' )
+            self.fileHandle.flush()
+                
+        elif self.isDuplicateCandidate(iSet):
+            objectName, isNew = self.meshDuplicates.objectFor( self.meshDuplicates.sharedKey(self.dagPath.fullPathName(), iSet),
+                                                               '%s (set %i)' % (self.dagPath.fullPathName(), iSet) )
+            if isNew:
+                self.addToOutput( '# Polygon Shape %s (set %i, deduplicated)' % (self.dagPath.fullPathName(), iSet ) )
+                self.addToOutput( 'ObjectBegin "%s"' % objectName )
+                self.beginStats()
+                self.getCachedGeometry(iSet)
+                self.endStats(objectName)
+                self.addToOutput( 'ObjectEnd' )
+                self.addToOutput( '' )
+                
+            self.addToOutput( '# Polygon Shape %s (set %i, copy of %s)' % (self.dagPath.fullPathName(), iSet, objectName ) )
+            self.addToOutput( 'AttributeBegin' )
+            self.addToOutput( self.translationMatrix(self.dagPath) )
+            self.addToOutput( '\tObjectInstance "%s"' % objectName )
+            self.addToOutput( 'AttributeEnd' )
+            if self.geometryStats is not None:
+                self.geometryStats.addReference(objectName)
             self.addToOutput( '' )
             self.fileHandle.flush()
                 
@@ -158,28 +254,78 @@ class MeshOpt(ShadedObject):
             self.addToOutput( 'AttributeBegin' )
             self.addToOutput( self.translationMatrix(self.dagPath) )
                         
-            self.getGeometry(iSet)
+            self.beginStats()
+            self.getCachedGeometry(iSet)
+            self.endStats()
                 
             self.addToOutput( 'AttributeEnd' )
             self.addToOutput( '' )
             self.fileHandle.flush()
 
+    def isFirstInstance(self, iSet):
+        """
+        Does this instance of the shape write the ObjectBegin of the set.
+        """
+        
+        if self.instancedObjects is None:
+            return self.instanceNum == 0
+        key = (self.fShape.name(), iSet)
+        if key in self.instancedObjects:
+            return False
+        self.instancedObjects.add(key)
+        return True
+
+    def beginStats(self):
+        if self.geometryStats is not None:
+            self.geometryStats.beginShape()
+    
+    def endStats(self, objectName = None):
+        if self.geometryStats is not None:
+            self.geometryStats.endShape(objectName)
+
+    def isDuplicateCandidate(self, iSet):
+        """
+        Should this set go through the MeshDuplicates deduplication: another
+        exported set has the same content. Area lights can not be instanced in
+        pbrt.
+        """
+        
+        if self.meshDuplicates is None or self.type != 'geom':
+            return False
+        if self.findSurfaceShader(self.instanceNum, iSet).typeName() == "pbrtAreaLightMaterial":
+            return False
+        return self.meshDuplicates.sharedKey(self.dagPath.fullPathName(), iSet) is not None
+
+    @staticmethod
+    def duplicateKeys(dagPath):
+        """
+        (set, content key) of the sets of the mesh at dagPath that can be
+        instanced, for the MeshDuplicates pre-pass. The keys are those
+        getObjectOrInstance would compute, so the level of detail of the export
+        has to be set up first.
+        """
+        
+        meshExporter = MeshOpt( (0, 0), OpenMaya.MDagPath(dagPath) )
+        # only looking, the shaders are bound when the mesh is exported
+        meshExporter.boundMaterials = None
+        keys = []
+        for iSet in range(meshExporter.setCount):
+            if meshExporter.findSurfaceShader(meshExporter.instanceNum, iSet).typeName() == "pbrtAreaLightMaterial":
+                continue
+            keys.append( (iSet, meshExporter.getCacheKey(iSet)) )
+        return keys
+
     def getOutput_real(self):
 
+        # sharded geometry output (ShardedOutput) starts its shards at shape boundaries
+        if hasattr(self.fileHandle, 'beginShape'):
+            self.fileHandle.beginShape(self.dagPath.fullPathName())
+
         # each set/shader on this object
         for iSet in range(0, self.setCount):
             
-            if self.setCount > 1:
-                skipThisSet = False
-                try:
-                    fComponent = OpenMaya.MFnComponent( self.fPolygonComponents[iSet] )
-                    skipThisSet = fComponent.isEmpty()
-                except:
-                    skipThisSet = True
-                    
-                if skipThisSet:
-                    OpenMaya.MGlobal.displayWarning( "Skipping empty set %s : %i" % (self.fShape.name(), iSet) )
-                    continue
+            if self.isEmptySet(iSet):
+                continue
             
             # start afresh for this set
             self.resetLists()
@@ -187,26 +333,270 @@ class MeshOpt(ShadedObject):
             self.getObjectOrInstance(iSet) 
                 
             self.deleteLists()
+        
+        self.meshPoints = None
+        self.meshData = None
+        self.hasMeshData = False
+        self.meshKey = None
+        self.meshTopologyKey = None
+        self.lodRatio = None
+        self.vertexAttributes = None
+
+    def isEmptySet(self, iSet):
+        
+        if self.setCount > 1:
+            skipThisSet = False
+            try:
+                fComponent = OpenMaya.MFnComponent( self.fPolygonComponents[iSet] )
+                skipThisSet = fComponent.isEmpty()
+            except:
+                skipThisSet = True
+                
+            if skipThisSet:
+                OpenMaya.MGlobal.displayWarning( "Skipping empty set %s : %i" % (self.fShape.name(), iSet) )
+                return True
+        return False
+
+    def getObject(self, objectName):
+        """
+        Write all sets of this mesh as a single object, in object space, for
+        ObjectInstance (Instancer). Area lights can not be instanced in pbrt,
+        those sets are skipped.
+        """
+        
+        # the object is placed at other distances than this mesh
+        self.lodRatio = 1.0
+        
+        self.addToOutput( 'ObjectBegin "%s"' % objectName )
+        self.beginStats()
+        for iSet in range(0, self.setCount):
             
-    def getGeometry(self, iSet):
+            if self.isEmptySet(iSet):
+                continue
+            if self.findSurfaceShader(self.instanceNum, iSet).typeName() == "pbrtAreaLightMaterial":
+                OpenMaya.MGlobal.displayWarning( "Area light on instanced shape %s is not exported" % self.dagPath.fullPathName() )
+                continue
+            
+            self.resetLists()
+            self.getCachedGeometry(iSet)
+            self.deleteLists()
+        self.endStats(objectName)
+        self.addToOutput( 'ObjectEnd' )
+        self.addToOutput( '' )
+        self.fileHandle.flush()
+        
+        self.meshPoints = None
+        self.meshData = None
+        self.hasMeshData = False
+        self.meshKey = None
+        self.meshTopologyKey = None
+        self.lodRatio = None
+        self.vertexAttributes = None
+
+    def getCachedGeometry(self, iSet):
+        """
+        getGeometry through the geometry cache: copy the block in on a hit,
+        otherwise write it to the file and to the cache at the same time.
+        plymesh blocks only hold a file name and are not cached.
+        """
+
+        if self.geometryCache is None or self.fileHandle == 0 or self.meshFormat == 'plymesh':
+            self.getGeometry(iSet)
+            return
+
+        key = self.getCacheKey(iSet)
+        if self.geometryCache.copyTo(key, self.fileHandle):
+            if self.geometryStats is not None:
+                self.geometryStats.addCached()
+            return
+
+        fileHandle = self.fileHandle
+        self.fileHandle = self.geometryCache.writer(key, fileHandle)
+        try:
+            self.getGeometry(iSet)
+        except:
+            self.fileHandle.abort()
+            self.fileHandle = fileHandle
+            raise
+        self.fileHandle.commit()
+        self.fileHandle = fileHandle
+
+    def getMeshKey(self):
+        """
+        Hash of the whole-mesh data, computed once per mesh.
+        """
+
+        if self.meshKey is not None:
+            return self.meshKey
+
+        self.extractMeshData()
+
+        addToKey = GeometryCache.addToKey
+        key = GeometryCache.newKey()
+        meshData = self.getMeshData()
+        if meshData is not None:
+            # everything the compiled lists are made from
+            for values in ( meshData.points, meshData.normals, meshData.uvs,
+                            meshData.faceVertexCounts, meshData.triangleCounts, meshData.triangleVertices,
+                            meshData.cornerFaceVertices, meshData.normalIds, meshData.uvIds ):
+                addToKey( key, values )
+        else:
+            addToKey( key, [x for p in mVectorArrayToList(self.meshPoints) for x in p], 'd' )
+            addToKey( key, [x for n in mVectorArrayToList(self.meshNormals) for x in n], 'f' )
+            if self.hasUVs:
+                addToKey( key, mArrayToList(self.meshUArray), 'f' )
+                addToKey( key, mArrayToList(self.meshVArray), 'f' )
+            self.addTopologyToKey( key )
+
+        self.meshKey = key.hexdigest()
+        return self.meshKey
+
+    def addTopologyToKey(self, key):
+        """
+        Add the faces, the triangulation, the normal ids and the uv ids of the
+        mesh to a GeometryCache key.
+        """
+
+        addToKey = GeometryCache.addToKey
+        counts = OpenMaya.MIntArray()
+        ids = OpenMaya.MIntArray()
+        for getIds in (self.fShape.getVertices, self.fShape.getTriangles, self.fShape.getNormalIds):
+            getIds( counts, ids )
+            addToKey( key, mArrayToList(counts) )
+            addToKey( key, mArrayToList(ids) )
+
+        if self.hasUVs:
+            self.fShape.getAssignedUVs( counts, ids, self.UVSets[self.currentUVSet] )
+            addToKey( key, self.UVSets[self.currentUVSet] )
+            addToKey( key, mArrayToList(counts) )
+            addToKey( key, mArrayToList(ids) )
+
+    def getTopologyKey(self, iSet, withUVs, withNormals):
+        """
+        TopologyCache key of the given set: the mesh topology (computed once
+        per mesh), the faces of the set and the vertex attributes that split
+        vertices. Point, normal and uv values are not part of it.
+        """
+
+        addToKey = GeometryCache.addToKey
+        if self.meshTopologyKey is None:
+            key = GeometryCache.newKey()
+            addToKey( key, 'topology' )
+            self.addTopologyToKey( key )
+            self.meshTopologyKey = key.hexdigest()
+
+        key = GeometryCache.newKey()
+        addToKey( key, self.meshTopologyKey )
+        addToKey( key, self.getSetFaces(iSet) )
+        addToKey( key, '%i %i' % (withUVs, withNormals) )
+        return key.hexdigest()
+
+    def getCacheKey(self, iSet):
+        """
+        Cache key of the geometry block of the given set: the mesh data, the
+        faces of the set, the material binding and the shape settings.
+        """
+
+        addToKey = GeometryCache.addToKey
+        key = GeometryCache.newKey()
+        addToKey( key, self.getMeshKey() )
+        addToKey( key, self.getSetFaces(iSet) )
+
+        materialNode = self.findSurfaceShader(self.instanceNum, iSet)
+        if materialNode.typeName() == "pbrtAreaLightMaterial":
+            addToKey( key, self.getAreaLight(materialNode) )
+        else:
+            addToKey( key, self.getNamedMaterial(materialNode) )
+
+        useLoopSubdiv = self.fShape.findPlug('useMaxSubdivisions').asBool()
+        nlevels = self.fShape.findPlug('maxSubd').asInt()
+        needsUVs, needsNormals = self.getVertexAttributes(iSet)
+        addToKey( key, '%s %s %i %i %i %r %i %i %s' % (self.type, self.meshFormat, useLoopSubdiv, nlevels, self.hasUVs, self.getLodRatio(), needsUVs, needsNormals, NumberFormat.arrayFormat()) )
+
+        return key.hexdigest()
+
+    def getVertexAttributes(self, iSet):
+        """
+        Which vertex attributes the given set needs, (needsUVs, needsNormals).
+        With stripAttributes, uvs are only kept if the material can look up
+        textures, and normals only on smooth shaded trianglemesh and plymesh
+        shapes: loopsubdiv and portals do not write them, and a flat shaded set
+        renders the same with geometric normals. Leaving them out of the
+        vertex key stops vertices from being split at uv seams and hard edges.
+        """
+        
+        if self.vertexAttributes is None:
+            self.vertexAttributes = {}
+        if iSet in self.vertexAttributes:
+            return self.vertexAttributes[iSet]
+        
+        needsUVs = True
+        needsNormals = True
+        if self.stripAttributes:
+            if self.type != 'geom':
+                needsUVs = False
+                needsNormals = False
+            else:
+                needsUVs = self.materialUsesUVs( self.findSurfaceShader(self.instanceNum, iSet) )
+                if self.fShape.findPlug('useMaxSubdivisions').asBool():
+                    needsNormals = False
+                else:
+                    # flat shading is only detected on the whole-mesh data of the bulk compile
+                    meshData = self.getMeshData()
+                    if meshData is not None and MeshCompiler.isFlatShaded( meshData, meshData.setCorners[iSet] ):
+                        needsNormals = False
+        
+        self.vertexAttributes[iSet] = (needsUVs, needsNormals)
+        return self.vertexAttributes[iSet]
+    
+    def extractMeshData(self):
+        """
+        Fetch the whole-mesh data once per mesh. Every set of this mesh is then
+        compiled from its own slice of it.
+        """
+        
+        if self.meshPoints is not None:
+            return
         
         # get all object verts
-        meshPoints = OpenMaya.MPointArray()
-        self.fShape.getPoints(meshPoints)
+        self.meshPoints = OpenMaya.MPointArray()
+        self.fShape.getPoints(self.meshPoints)
         
         # get all object normals
-        meshNormals = OpenMaya.MFloatVectorArray()
-        self.fShape.getNormals(meshNormals)
+        self.meshNormals = OpenMaya.MFloatVectorArray()
+        self.fShape.getNormals(self.meshNormals)
         
         # get all object UVs, if any
         if self.hasUVs:
             try:
-                meshUArray = OpenMaya.MFloatArray()
-                meshVArray = OpenMaya.MFloatArray()
-                self.fShape.getUVs(meshUArray, meshVArray, self.UVSets[self.currentUVSet])
+                self.meshUArray = OpenMaya.MFloatArray()
+                self.meshVArray = OpenMaya.MFloatArray()
+                self.fShape.getUVs(self.meshUArray, self.meshVArray, self.UVSets[self.currentUVSet])
             except:
                 OpenMaya.MGlobal.displayError("Error with UV mapping on object: %s" % self.fShape.name() )
                 raise
+    
+    def getMeshData(self):
+        """
+        Whole-mesh data for the bulk compile (extractBulkData), built once per
+        mesh on first use. None if numpy is missing or the bulk compile is off.
+        A set found in the TopologyCache does not need it.
+        """
+        
+        if not self.hasMeshData:
+            self.hasMeshData = True
+            self.extractMeshData()
+            if self.useBulkCompile and MeshCompiler.isAvailable():
+                self.meshData = self.extractBulkData()
+        return self.meshData
+        
+    def getGeometry(self, iSet):
+        
+        self.extractMeshData()
+        meshPoints = self.meshPoints
+        meshNormals = self.meshNormals
+        meshUArray = self.meshUArray
+        meshVArray = self.meshVArray
         
         # set up some scripting junk
         numTrianglesPx = OpenMaya.MScriptUtil()
@@ -256,13 +646,30 @@ class MeshOpt(ShadedObject):
                 self.addToOutput( '\t\t"integer nlevels" [%i]' % nlevels )
                 # find displacement, if any
                 #self.addToOutput( self.findDisplacementShader( self.shadingGroup ) )
+            elif self.meshFormat == 'plymesh':
+                self.mode = 'plymesh'
+                self.addToOutput( '\tShape "plymesh"' )
+                self.addToOutput( '\t\t"string filename" ["%s"]' % self.getPlyFileName(iSet) )
             else:
                 self.mode = 'trianglemesh'                
                 self.addToOutput( '\tShape "trianglemesh"' )
         
                     
+        needsUVs, needsNormals = self.getVertexAttributes(iSet)
+        hasUVs = itMeshPolys.hasUVs() and needsUVs
+        
+        uvCount = 0
+        if meshUArray is not None:
+            uvCount = meshUArray.length()
+        normalCount = meshNormals.length()
+        if not needsNormals:
+            # all corners share normal 0 in the vertex keys
+            normalCount = 1
+        
         def compileWithUVs():
             totalVertIndices = 0
+            corner = 0
+            indexCount = len(self.vertIndexList)
             # each face
             while not itMeshPolys.isDone():
                 
@@ -271,6 +678,7 @@ class MeshOpt(ShadedObject):
                 numTriangles = OpenMaya.MScriptUtil(numTrianglesPtr).asInt()
                 
                 itMeshPolys.getVertices( polygonVertices )
+                localIndexMap = MeshCompiler.localIndexMap( polygonVertices, polygonVertices.length() )
 
                 # each triangle in each face
                 for currentTriangle in range(0, numTriangles):
@@ -278,48 +686,61 @@ class MeshOpt(ShadedObject):
                     # get the triangle points and indices
                     itMeshPolys.getTriangle( currentTriangle, vertPoints, vertIndices, OpenMaya.MSpace.kObject )
                     
-                    # get a list of local indices
-                    localIndex = self.GetLocalIndex( polygonVertices, vertIndices )
-                    
                     # each vert in this triangle
-                    for i, vertIndex in enumerate( vertIndices ):
+                    for vertIndex in vertIndices:
+                        
+                        # face-relative index of this vert
+                        localIndex = localIndexMap.get( vertIndex, -1 )
                         
                         # get indices to points/normals/uvs
-                        vertNormalIndex = itMeshPolys.normalIndex( localIndex[i] )
+                        vertNormalIndex = 0
+                        if needsNormals:
+                            vertNormalIndex = itMeshPolys.normalIndex( localIndex )
                         
                         try:
-                            itMeshPolys.getUVIndex( localIndex[i], uvIdxPtr, self.UVSets[self.currentUVSet] )
+                            itMeshPolys.getUVIndex( localIndex, uvIdxPtr, self.UVSets[self.currentUVSet] )
                             vertUVIndex = OpenMaya.MScriptUtil( uvIdxPtr ).asInt()
                         except:
                             OpenMaya.MGlobal.displayWarning( 'Invalid UV data on object %s (UV set "%s"), restarting object export without UVs' % (self.dagPath.fullPathName(), self.UVSets[self.currentUVSet]) )
-                            self.resetLists()
+                            self.resetLists(triangleCount)
                             itMeshPolys.reset()
                             compileWithoutUVs()
                             self.hasUVs = False
                             return
                         
-                        # if we've seen this combo before,
-                        testVal = (vertIndex, vertNormalIndex, vertUVIndex) 
+                        # if we've seen this combo before, (one int key, no tuple per corner)
+                        testVal = (vertIndex * normalCount + vertNormalIndex) * uvCount + vertUVIndex
                         #try:
                         if testVal in self.vertNormUVList:
-                            self.vertIndexList.append( self.vertNormUVList[testVal] )
+                            vertIndexValue = self.vertNormUVList[testVal]
                         #except KeyError:
                         else:
                             # add it to the lists
-                            self.vertPointList.append( meshPoints[vertIndex] )
-                            self.vertNormList.append( meshNormals[vertNormalIndex] )
-                            self.vertUVList.append( ( meshUArray[vertUVIndex], meshVArray[vertUVIndex] ) )
+                            vP = meshPoints[vertIndex]
+                            vN = meshNormals[vertNormalIndex]
+                            self.vertPointList.extend( (vP.x, vP.y, vP.z) )
+                            self.vertNormList.extend( (vN.x, vN.y, vN.z) )
+                            self.vertUVList.extend( ( meshUArray[vertUVIndex], meshVArray[vertUVIndex] ) )
                             
                             # and keep track of what we've seen
                             self.vertNormUVList[testVal] = totalVertIndices
                             # and use the most recent idx value
-                            self.vertIndexList.append( totalVertIndices )
+                            vertIndexValue = totalVertIndices
                             totalVertIndices += 1
                         
+                        if corner < indexCount:
+                            self.vertIndexList[corner] = vertIndexValue
+                        else:
+                            self.vertIndexList.append( vertIndexValue )
+                        corner += 1
+                        
                 itMeshPolys.next()
+            del self.vertIndexList[corner:]
                 
         def compileWithoutUVs():
             totalVertIndices = 0
+            corner = 0
+            indexCount = len(self.vertIndexList)
             # each face
             while not itMeshPolys.isDone():
                 
@@ -328,6 +749,7 @@ class MeshOpt(ShadedObject):
                 numTriangles = OpenMaya.MScriptUtil(numTrianglesPtr).asInt()
                 
                 itMeshPolys.getVertices( polygonVertices )
+                localIndexMap = MeshCompiler.localIndexMap( polygonVertices, polygonVertices.length() )
 
                 # each triangle in each face
                 for currentTriangle in range(0, numTriangles):
@@ -335,111 +757,437 @@ class MeshOpt(ShadedObject):
                     # get the triangle points and indices
                     itMeshPolys.getTriangle( currentTriangle, vertPoints, vertIndices, OpenMaya.MSpace.kObject )
                     
-                    # get a list of local indices
-                    localIndex = self.GetLocalIndex( polygonVertices, vertIndices )
-                    
                     # each vert in this triangle
-                    for i, vertIndex in enumerate( vertIndices ):
+                    for vertIndex in vertIndices:
+                        
+                        # face-relative index of this vert
+                        localIndex = localIndexMap.get( vertIndex, -1 )
                         
                         # get indices to points/normals/uvs
-                        vertNormalIndex = itMeshPolys.normalIndex( localIndex[i] )
+                        vertNormalIndex = 0
+                        if needsNormals:
+                            vertNormalIndex = itMeshPolys.normalIndex( localIndex )
 
                         # if we've seen this combo yet,
-                        testVal = (vertIndex, vertNormalIndex)
+                        testVal = vertIndex * normalCount + vertNormalIndex
                         #try:
                         if testVal in self.vertNormUVList:
-                            self.vertIndexList.append( self.vertNormUVList[testVal] )
+                            vertIndexValue = self.vertNormUVList[testVal]
                         #except KeyError:
                         else:
                             # add it to the lists
-                            self.vertPointList.append( meshPoints[vertIndex] )
-                            self.vertNormList.append( meshNormals[vertNormalIndex] )
+                            vP = meshPoints[vertIndex]
+                            vN = meshNormals[vertNormalIndex]
+                            self.vertPointList.extend( (vP.x, vP.y, vP.z) )
+                            self.vertNormList.extend( (vN.x, vN.y, vN.z) )
 
                             # and keep track of what we've seen
                             self.vertNormUVList[testVal] = totalVertIndices
                             # and use the most recent idx value
-                            self.vertIndexList.append( totalVertIndices )
+                            vertIndexValue = totalVertIndices
                             totalVertIndices += 1
                         
+                        if corner < indexCount:
+                            self.vertIndexList[corner] = vertIndexValue
+                        else:
+                            self.vertIndexList.append( vertIndexValue )
+                        corner += 1
                         
                 itMeshPolys.next()
+            del self.vertIndexList[corner:]
                 
                 
+        def compileLoop():
+            if hasUVs:
+                compileWithUVs()
+            else:
+                compileWithoutUVs()
+        
         startTime = time.clock()
         
-        if itMeshPolys.hasUVs():
-            compileWithUVs()
-        else:
-            compileWithoutUVs()
+        # same topology as an earlier frame: only gather the vertex values
+        topologyKey = None
+        cached = False
+        if self.topologyCache is not None and not self.doValidate:
+            topologyKey = self.getTopologyKey(iSet, self.hasUVs and hasUVs, needsNormals)
+            cached = self.gatherCached(topologyKey)
+        
+        bulkCompiled = False
+        if not cached and self.getMeshData() is not None:
+            bulkCompiled = self.compileBulk(iSet, self.hasUVs and hasUVs, needsNormals, topologyKey)
+            
+        if cached:
+            pass
+        elif not bulkCompiled:
+            triangleCount = self.countSetTriangles(iSet)
+            self.resetLists(triangleCount)
+            compileLoop()
+            if topologyKey is not None:
+                self.storeLoopTopology(topologyKey, normalCount, uvCount, hasUVs)
+        elif self.doValidate:
+            bulkLists = (self.vertIndexList, self.vertPointList, self.vertNormList, self.vertUVList)
+            triangleCount = self.countSetTriangles(iSet)
+            self.resetLists(triangleCount)
+            itMeshPolys.reset()
+            compileLoop()
+            self.compareLists(bulkLists, compareNormals = needsNormals)
             
         procTime = time.clock()
         procDuration = procTime - startTime
         
+        vLen = len(self.vertPointList) / 3
+        if self.bufferStats is not None:
+            bufferBytes = MeshCompiler.bufferBytes( self.vertIndexList, self.vertPointList, self.vertNormList, self.vertUVList, self.vertNormUVList )
+            if bulkCompiled:
+                bufferBytes += self.meshData.nbytes()
+            self.bufferStats.add( bufferBytes, vLen )
         
-        # mesh iteration done, do output.
-
-        self.addToOutput( '\t"integer indices" [' )
-        self.addToOutput( '\t\t' + ' '.join(map(str,self.vertIndexList)) )
-        self.addToOutput( '\t]' )
-        
-        self.fileHandle.flush()
-        
-        self.addToOutput( '\t"point P" [' )
-        for vP in self.vertPointList:
-            self.addToOutput( '\t\t%f %f %f' % (vP.x, vP.y, vP.z) )
-        self.addToOutput( '\t]' )
-        
-        self.fileHandle.flush()
+        if self.levelOfDetail is not None and self.type == 'geom' and self.mode != 'loopsubdiv':
+            self.decimate()
+            vLen = len(self.vertPointList) / 3
         
-        # add UVs for trianglemesh and loopsubdiv, but not for portals and only if the shape has uvs
-        if self.type == 'geom' and itMeshPolys.hasUVs() and len(self.vertUVList)>0:
-            self.addToOutput( '\t"float uv" [' )
-            for uv in self.vertUVList:
-                self.addToOutput( '\t\t%f %f' % uv )
-            self.addToOutput( '\t]' )
         
-        self.fileHandle.flush()
+        # mesh iteration done, do output.
         
-        # Add normals to trianglemesh
-        if self.mode == 'trianglemesh':
-            self.addToOutput( '\t"normal N" [' )
-            for vN in self.vertNormList:
-                self.addToOutput( '\t\t%f %f %f' % (vN.x, vN.y, vN.z) )
-            self.addToOutput( '\t]' )
-            
+        if self.mode == 'plymesh':
+            self.writePlyFile(iSet, hasUVs and len(self.vertUVList)>0, needsNormals)
+        else:
+            self.writeArrays(hasUVs, needsNormals)
+        if self.geometryStats is not None:
+            self.geometryStats.addWritten( len(self.vertIndexList) / 3, vLen )
             
         outTime = time.clock()
         writeDuration = outTime - procTime
         
         if self.doBenchmark:
-            vLen = len(self.vertNormUVList)
             pSpeed = vLen/procDuration
             wSpeed = vLen/writeDuration
             print "%i verts processed in %f seconds: %f verts/sec" % (vLen, procDuration, pSpeed)
             print " -> written in %f seconds: %f verts/sec" % (writeDuration, wSpeed)
             
-            sf = open("e:\meshopt_stats.csv", "a")
-            sf.write ( ( '%i,%f,%f' % (vLen, pSpeed, wSpeed) ) + os.linesep )
-            sf.close()
+            if self.benchmarkFileName:
+                sf = open(self.benchmarkFileName, "a")
+                sf.write ( ( '%i,%f,%f' % (vLen, pSpeed, wSpeed) ) + os.linesep )
+                sf.close()
             
-    def GetLocalIndex(self, getVertices, getTriangle):
+    def writeArrays(self, hasUVs, hasNormals = True):
         """
-        To quote the C++ source:
-            // MItMeshPolygon::getTriangle() returns object-relative vertex
-            // indices; BUT MItMeshPolygon::normalIndex() and ::getNormal() need
-            // face-relative vertex indices! This converts vertex indices from
-            // object-relative to face-relative.
+        Write the compiled lists as trianglemesh/loopsubdiv parameters.
         """
         
-        localIndex = []
+        parts = [ '\t"integer indices" [',
+                  (self.vertIndexList, 3, '%i'),
+                  '\t]',
+                  '\t"point P" [',
+                  (self.vertPointList, 3, NumberFormat.arrayFormat()),
+                  '\t]' ]
+        
+        # add UVs for trianglemesh and loopsubdiv, but not for portals and only if the shape has uvs
+        if self.type == 'geom' and hasUVs and len(self.vertUVList)>0:
+            parts += [ '\t"float uv" [',
+                       (self.vertUVList, 2, NumberFormat.arrayFormat()),
+                       '\t]' ]
+        
+        # Add normals to trianglemesh
+        if self.mode == 'trianglemesh' and hasNormals:
+            parts += [ '\t"normal N" [',
+                       (self.vertNormList, 3, NumberFormat.arrayFormat()),
+                       '\t]' ]
+        
+        self.addPartsToOutput( parts )
+        
+        self.fileHandle.flush()
+    
+    def getLodRatio(self):
+        """
+        Fraction of the triangles of this mesh to keep, from its projected size
+        and its pbrtLodRatio attribute (negative: automatic, 1: never
+        decimate). Computed once per mesh. Maya instances share one object
+        written for all of their placements and are not decimated.
+        """
+        
+        if self.lodRatio is not None:
+            return self.lodRatio
+        
+        self.lodRatio = 1.0
+        if self.levelOfDetail is None or self.isInstanced or not MeshDecimator.isAvailable():
+            return self.lodRatio
+        
+        override = None
+        if self.fShape.hasAttribute('pbrtLodRatio'):
+            override = self.fShape.findPlug('pbrtLodRatio').asFloat()
+        
+        bounds = self.fShape.boundingBox()
+        bounds.transformUsing( self.dagPath.inclusiveMatrix() )
+        radius = bounds.min().distanceTo( bounds.max() ) / 2.0
+        self.lodRatio = self.levelOfDetail.keepRatio( bounds.center(), radius, override )
+        return self.lodRatio
+    
+    def decimate(self):
+        """
+        Replace the compiled buffers of the current set by their decimated
+        version (MeshDecimator) and record the triangle counts.
+        """
+        
+        triangleCount = len(self.vertIndexList) / 3
+        ratio = self.getLodRatio()
+        decimated = None
+        if ratio < 1.0:
+            uvs = None
+            if self.vertUVList is not None and len(self.vertUVList) > 0:
+                uvs = self.vertUVList
+            decimated = MeshDecimator.decimate( self.vertIndexList, self.vertPointList, self.vertNormList, uvs, ratio )
+        
+        if decimated is not None:
+            self.vertIndexList, self.vertPointList, self.vertNormList, uvs = decimated
+            if uvs is not None:
+                self.vertUVList = uvs
+        self.levelOfDetail.record( triangleCount, len(self.vertIndexList) / 3 )
+    
+    def getPlyFileName(self, iSet):
+        """
+        PLY sidecar file for the given set, next to the file this mesh is written to.
+        """
+        
+        baseName = self.fileHandle.name
+        if baseName.endswith('.gz'):
+            baseName = baseName[:-3]
+        baseName = os.path.splitext( baseName )[0]
+        shapeName = self.dagPath.fullPathName().strip('|').replace('|', '_').replace(':', '_')
+        return '%s.%s.%i.ply' % (baseName, shapeName, iSet)
+    
+    def writePlyFile(self, iSet, hasUVs, hasNormals = True):
+        """
+        Write the compiled lists to the binary PLY sidecar of the given set.
+        """
+        
+        plyFileName = self.getPlyFileName(iSet)
+        uvs = None
+        if hasUVs:
+            uvs = self.vertUVList
+        normals = None
+        if hasNormals:
+            normals = self.vertNormList
+        
+        try:
+            PlyWriter.writePLY( plyFileName, self.vertIndexList, self.vertPointList, normals, uvs )
+        except IOError:
+            OpenMaya.MGlobal.displayError( "Failed to open file %s for writing\n" % plyFileName )
+            raise
         
-        for gt in range(0, getTriangle.length()):
-            for gv in range(0, getVertices.length()):
-                if getTriangle[gt] == getVertices[gv]:
-                    localIndex.append( gv )
+        if self.doValidate:
+            error = PlyWriter.checkPLY( plyFileName, len(self.vertPointList)/3, len(self.vertIndexList)/3, hasNormals, hasUVs )
+            if error:
+                OpenMaya.MGlobal.displayWarning( 'PLY file %s does not read back: %s' % (plyFileName, error) )
+    
+    def countSetTriangles(self, iSet):
+        """
+        Number of triangles in the given set, to preallocate the index buffer.
+        """
+        
+        triangleCounts = OpenMaya.MIntArray()
+        triangleVertices = OpenMaya.MIntArray()
+        self.fShape.getTriangles( triangleCounts, triangleVertices )
+        
+        faces = self.getSetFaces(iSet)
+        if faces is None:
+            return triangleVertices.length() / 3
+        return sum([triangleCounts[f] for f in faces])
+    
+    def getSetFaces(self, iSet):
+        """
+        Face indices of the given set, or None if the set covers the whole mesh.
+        """
+        
+        component = self.fPolygonComponents[iSet]
+        if component.isNull():
+            return None
+        
+        try:
+            fComponent = OpenMaya.MFnSingleIndexedComponent( component )
+        except:
+            # not a face component, getOutput_real skips this set
+            return []
+        if fComponent.isComplete():
+            return None
+        
+        faces = OpenMaya.MIntArray()
+        fComponent.getElements( faces )
+        return mArrayToList( faces )
+    
+    def extractBulkData(self):
+        """
+        Whole-mesh triangulation, normal and uv ids for MeshCompiler, split by set.
+        Returns None if the mesh can not be compiled in bulk.
+        """
+        
+        faceVertexCounts = OpenMaya.MIntArray()
+        faceVertices = OpenMaya.MIntArray()
+        self.fShape.getVertices( faceVertexCounts, faceVertices )
+        
+        triangleCounts = OpenMaya.MIntArray()
+        triangleVertices = OpenMaya.MIntArray()
+        self.fShape.getTriangles( triangleCounts, triangleVertices )
+        
+        normalIdCounts = OpenMaya.MIntArray()
+        normalIds = OpenMaya.MIntArray()
+        self.fShape.getNormalIds( normalIdCounts, normalIds )
+        
+        faceVertexCounts = mArrayToList( faceVertexCounts )
+        
+        uvIds = None
+        uvs = None
+        if self.hasUVs:
+            uvCounts = OpenMaya.MIntArray()
+            uvIdArray = OpenMaya.MIntArray()
+            self.fShape.getAssignedUVs( uvCounts, uvIdArray, self.UVSets[self.currentUVSet] )
+            uvIds = MeshCompiler.expandFaceVertexIds( faceVertexCounts, mArrayToList(uvCounts), mArrayToList(uvIdArray) )
+            uvs = zip( mArrayToList(self.meshUArray), mArrayToList(self.meshVArray) )
+        
+        meshData = MeshCompiler.MeshData( mVectorArrayToList(self.meshPoints),
+                                          mVectorArrayToList(self.meshNormals),
+                                          uvs,
+                                          faceVertexCounts,
+                                          mArrayToList(faceVertices),
+                                          mArrayToList(triangleCounts),
+                                          mArrayToList(triangleVertices),
+                                          mArrayToList(normalIds),
+                                          uvIds )
+        
+        meshData.splitSets( [self.getSetFaces(iSet) for iSet in range(self.setCount)] )
+        return meshData
+    
+    def compileBulk(self, iSet, withUVs, withNormals = True, topologyKey = None):
+        """
+        Compile the given set from its slice of the whole-mesh data with
+        MeshCompiler. Fills the same buffers as the MItMeshPolygon loop, as
+        numpy arrays, and stores the result in the TopologyCache under
+        topologyKey, if given. Returns
+        False if the loop has to be used instead.
+        """
+        
+        compiled = MeshCompiler.compileTriangles( self.meshData, self.meshData.setCorners[iSet], withUVs, withNormals )
+        if compiled is None:
+            OpenMaya.MGlobal.displayWarning( 'Bulk compile failed on object %s, using the polygon iterator' % self.dagPath.fullPathName() )
+            return False
+        
+        if withUVs and compiled.uvs is None:
+            OpenMaya.MGlobal.displayWarning( 'Invalid UV data on object %s (UV set "%s"), exporting without UVs' % (self.dagPath.fullPathName(), self.UVSets[self.currentUVSet]) )
+            self.hasUVs = False
+        
+        if topologyKey is not None:
+            self.topologyCache.put( topologyKey, TopologyEntry(compiled.indices, compiled.pointIds, compiled.normalIds, compiled.uvIds) )
+        
+        self.setCompiled( compiled )
+        return True
+    
+    def setCompiled(self, compiled):
+        """
+        Use a MeshCompiler.CompiledMesh as the buffers of the current set.
+        """
+        
+        # flat views of the compiled arrays, no copy
+        self.vertNormUVList = None
+        self.vertIndexList = compiled.indices
+        self.vertPointList = compiled.points.reshape(-1)
+        self.vertNormList = compiled.normals.reshape(-1)
+        if compiled.uvs is not None:
+            self.vertUVList = compiled.uvs.reshape(-1)
+    
+    def storeLoopTopology(self, topologyKey, normalCount, uvCount, withUVs):
+        """
+        Store the set compiled by the MItMeshPolygon loop in the TopologyCache.
+        The ids of every vertex are decoded from the keys of its vertex dict.
+        """
+        
+        vertexCount = len(self.vertNormUVList)
+        pointIds = array('i', [0]) * vertexCount
+        normalIds = array('i', [0]) * vertexCount
+        uvIds = None
+        # the loop falls back to no uvs (and clears self.hasUVs) on invalid uv data
+        if withUVs and self.hasUVs:
+            uvIds = array('i', [0]) * vertexCount
+            for testVal, vertIndex in self.vertNormUVList.iteritems():
+                testVal, uvIds[vertIndex] = divmod(testVal, uvCount)
+                pointIds[vertIndex], normalIds[vertIndex] = divmod(testVal, normalCount)
+        else:
+            for testVal, vertIndex in self.vertNormUVList.iteritems():
+                pointIds[vertIndex], normalIds[vertIndex] = divmod(testVal, normalCount)
+        
+        self.topologyCache.put( topologyKey, TopologyEntry(self.vertIndexList, pointIds, normalIds, uvIds) )
+    
+    def gatherCached(self, topologyKey):
+        """
+        Fill the buffers of the current set from its TopologyCache entry, with
+        the point, normal and uv values of this frame. Returns False if the
+        topology is not in the cache.
+        """
+        
+        entry = self.topologyCache.get(topologyKey)
+        if entry is None:
+            return False
+        
+        self.extractMeshData()
+        if MeshCompiler.isAvailable():
+            meshData = self.meshData
+            if meshData is not None:
+                points, normals, uvs = meshData.points, meshData.normals, meshData.uvs
+            else:
+                points = mVectorArrayToList(self.meshPoints)
+                normals = mVectorArrayToList(self.meshNormals)
+                uvs = None
+                if entry.uvIds is not None:
+                    uvs = zip( mArrayToList(self.meshUArray), mArrayToList(self.meshVArray) )
+            self.setCompiled( MeshCompiler.gatherVertices(entry.indices, points, normals, uvs, entry.pointIds, entry.normalIds, entry.uvIds) )
+            return True
+        
+        self.vertNormUVList = None
+        self.vertIndexList = entry.indices
+        self.vertPointList = array('d')
+        self.vertNormList = array('f')
+        self.vertUVList = array('f')
+        meshPoints = self.meshPoints
+        meshNormals = self.meshNormals
+        for i in entry.pointIds:
+            vP = meshPoints[i]
+            self.vertPointList.extend( (vP.x, vP.y, vP.z) )
+        for i in entry.normalIds:
+            vN = meshNormals[i]
+            self.vertNormList.extend( (vN.x, vN.y, vN.z) )
+        if entry.uvIds is not None:
+            for i in entry.uvIds:
+                self.vertUVList.extend( (self.meshUArray[i], self.meshVArray[i]) )
+        return True
+    
+    def compareLists(self, otherLists, tolerance = 1e-5, compareNormals = True):
+        """
+        Compare the current lists with the ones produced by another compile path
+        (used by doValidate). Returns True if they match. Normals that are not
+        written out differ between the paths and can be left out.
+        """
+        
+        otherIndices, otherPoints, otherNormals, otherUVs = otherLists
+        
+        mismatch = ''
+        if list(otherIndices) != list(self.vertIndexList):
+            mismatch = 'indices'
+        else:
+            for name, mine, other in ( ('P', self.vertPointList, otherPoints),
+                                       ('N', self.vertNormList, otherNormals),
+                                       ('uv', self.vertUVList, otherUVs) ):
+                if name == 'N' and not compareNormals:
+                    continue
+                if len(mine) != len(other):
+                    mismatch = name
                     break
-                    
-            if len(localIndex) == gt:
-                localIndex.append( -1 )
-                
-        return localIndex
+                for a, b in zip(mine, other):
+                    if abs(a-b) > tolerance:
+                        mismatch = name
+                        break
+                if mismatch:
+                    break
+        
+        if mismatch:
+            OpenMaya.MGlobal.displayWarning( 'Mesh %s: bulk and loop compile differ (%s)' % (self.dagPath.fullPathName(), mismatch) )
+            return False
+        return True
@@ -0,0 +1,153 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Formatting of every float written to the scene files. Three modes:
+#   fixed     %.<digits>f, fixed decimals (the default %f output with 6 digits)
+#   general   %.<digits>g, significant digits, no trailing zeros
+#   shortest  shortest text that reads back to the same single precision
+#             float, which is what pbrt parses it into
+# The mode of the export is set by the Exporter. Export modules write their
+# parameters with formatFloats(), number arrays get arrayFormat() as value
+# format, which ArrayWriter understands. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import re
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MODES = ('fixed', 'general', 'shortest')
+
+# value format of number arrays in shortest mode, see ArrayWriter
+SHORTEST = 'shortest'
+
+# format of the current export, see setFormat
+mode = 'fixed'
+digits = 6
+floatFormat = '%.6f'
+
+# template -> (template with the current float format, positions of the %f values)
+templates = {}
+
+CONVERSION = re.compile(r'%[-+ #0-9.]*([a-zA-Z%])')
+
+
+def setFormat(newMode = 'fixed', newDigits = 6):
+    """
+    Select the float format of the export. Unknown modes fall back to fixed.
+    """
+
+    global mode, digits, floatFormat
+    if newMode not in MODES:
+        newMode = 'fixed'
+    mode = newMode
+    digits = max(1, int(newDigits))
+    if mode == 'fixed':
+        floatFormat = '%%.%if' % digits
+    elif mode == 'general':
+        floatFormat = '%%.%ig' % digits
+    else:
+        floatFormat = '%s'
+    templates.clear()
+
+
+def arrayFormat():
+    """
+    Value format of float arrays given to ExportModule.addPartsToOutput.
+    """
+    if mode == 'shortest':
+        return SHORTEST
+    return floatFormat
+
+
+def singleRoundTrips(text, single):
+    return struct.unpack('f', struct.pack('f', float(text)))[0] == single
+
+
+def shortestFloat(value):
+    """
+    Shortest text of value that reads back to the same single precision float.
+    The single float is what is written: 9 significant digits always read
+    back to it, and if a text with 6 digits or less does, '%.6g' is that text.
+    """
+
+    try:
+        single = struct.unpack('f', struct.pack('f', value))[0]
+    except (OverflowError, SystemError):
+        # out of single precision range
+        return repr(value)
+    for precision in (6, 7, 8):
+        text = '%.*g' % (precision, single)
+        if singleRoundTrips(text, single):
+            return text
+    return '%.9g' % single
+
+
+def shortestFloats(values):
+    """
+    shortestFloat of every value of a flat list. With numpy, every precision
+    is formatted with one % operation and read back with one fromstring call,
+    and only the values that did not read back are formatted again.
+    """
+
+    if numpy is None or len(values) == 0:
+        return [shortestFloat(value) for value in values]
+
+    errors = numpy.seterr(over = 'ignore', invalid = 'ignore')
+    try:
+        singles = numpy.asarray(values, dtype = numpy.float64).astype(numpy.float32)
+    finally:
+        numpy.seterr(**errors)
+    singleValues = singles.astype(numpy.float64)
+
+    text = ('%.6g ' * len(singles)) % tuple(singleValues.tolist())
+    texts = numpy.array(text.split(), dtype = object)
+    readBack = numpy.fromstring(text, dtype = numpy.float64, sep = ' ').astype(numpy.float32)
+    pending = numpy.nonzero( (readBack != singles) & (singles == singles) )[0]
+    for precision in (7, 8, 9):
+        if len(pending) == 0:
+            break
+        text = ('%%.%ig ' % precision * len(pending)) % tuple(singleValues[pending].tolist())
+        texts[pending] = text.split()
+        readBack = numpy.fromstring(text, dtype = numpy.float64, sep = ' ').astype(numpy.float32)
+        pending = pending[ readBack != singles[pending] ]
+    return texts.tolist()
+
+
+def formatFloat(value):
+    if mode == 'shortest':
+        return shortestFloat(value)
+    return floatFormat % value
+
+
+def formatFloats(template, values):
+    """
+    template % values, with every %f in template written in the current float
+    format. The other conversions (%s, %i...) are left as they are.
+    """
+
+    entry = templates.get(template)
+    if entry is None:
+        conversions = [match.group(1) for match in CONVERSION.finditer(template) if match.group(1) != '%']
+        floatPositions = [i for i, conversion in enumerate(conversions) if conversion == 'f']
+        entry = ( CONVERSION.sub(lambda match: match.group(1) == 'f' and floatFormat or match.group(0), template), floatPositions )
+        templates[template] = entry
+
+    converted, floatPositions = entry
+    if mode == 'shortest':
+        values = list(values)
+        for i in floatPositions:
+            values[i] = shortestFloat(values[i])
+    return converted % tuple(values)
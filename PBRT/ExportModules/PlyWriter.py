@@ -0,0 +1,227 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Binary little-endian PLY writer/reader for Shape "plymesh". The writer streams
+# the compiled vertex and index buffers (numpy arrays, flat arrays or lists of rows) straight
+# to the file in chunks. The reader only understands what the writer produces,
+# it is used to check the written files. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# vertices/faces packed per write() call
+CHUNK_ROWS = 16384
+
+
+def vertexProperties(hasNormals, hasUVs):
+    properties = ['x', 'y', 'z']
+    if hasNormals:
+        properties += ['nx', 'ny', 'nz']
+    if hasUVs:
+        properties += ['u', 'v']
+    return properties
+
+
+def plyHeader(vertexCount, faceCount, hasNormals, hasUVs):
+    lines = ['ply',
+             'format binary_little_endian 1.0',
+             'comment pbrtMayaPy',
+             'element vertex %i' % vertexCount]
+    for p in vertexProperties(hasNormals, hasUVs):
+        lines.append('property float %s' % p)
+    lines.append('element face %i' % faceCount)
+    lines.append('property list uchar int vertex_indices')
+    lines.append('end_header')
+    # PLY headers always use \n
+    return '\n'.join(lines) + '\n'
+
+
+def isRows(values):
+    if hasattr(values, 'ndim'):
+        return values.ndim > 1
+    return len(values) > 0 and hasattr(values[0], '__len__')
+
+
+def rowCount(values, width):
+    """
+    Number of rows of a numpy array, a sequence of rows, or a flat sequence of
+    width values per row.
+    """
+    if isRows(values):
+        return len(values)
+    return len(values) / width
+
+
+def flatRows(values, start, count, width):
+    """
+    Rows [start, start+count) of a numpy array, a sequence of rows or a flat
+    sequence as a flat list.
+    """
+    if hasattr(values, 'reshape'):
+        return values.reshape(-1)[start*width:(start+count)*width].tolist()
+    if isRows(values):
+        return [x for row in values[start:start+count] for x in row]
+    return list(values[start*width:(start+count)*width])
+
+
+def writeVerticesNumpy(fileHandle, columns, vertexCount):
+    fields = []
+    for array in columns:
+        for i in range(array.shape[1]):
+            fields.append(('f%i' % len(fields), '<f4'))
+    chunk = numpy.empty(min(CHUNK_ROWS, vertexCount), dtype=fields)
+    for start in xrange(0, vertexCount, CHUNK_ROWS):
+        count = min(CHUNK_ROWS, vertexCount - start)
+        field = 0
+        for array in columns:
+            for i in range(array.shape[1]):
+                chunk['f%i' % field][:count] = array[start:start+count, i]
+                field += 1
+        fileHandle.write(chunk[:count].tostring())
+
+
+def writeVerticesStruct(fileHandle, columns, widths, vertexCount):
+    for start in xrange(0, vertexCount, CHUNK_ROWS):
+        count = min(CHUNK_ROWS, vertexCount - start)
+        parts = [flatRows(array, start, count, width) for array, width in zip(columns, widths)]
+        flat = []
+        for r in xrange(count):
+            for p, w in zip(parts, widths):
+                flat.extend(p[r*w:(r+1)*w])
+        fileHandle.write(struct.pack('<%if' % len(flat), *flat))
+
+
+def writeFaces(fileHandle, indices, faceCount):
+    if numpy is not None:
+        indices = numpy.asarray(indices, dtype='<i4').reshape(-1, 3)
+        chunk = numpy.empty(min(CHUNK_ROWS, faceCount), dtype=[('n', 'u1'), ('v', '<i4', (3,))])
+        chunk['n'] = 3
+        for start in xrange(0, faceCount, CHUNK_ROWS):
+            count = min(CHUNK_ROWS, faceCount - start)
+            chunk['v'][:count] = indices[start:start+count]
+            fileHandle.write(chunk[:count].tostring())
+        return
+
+    faceFormat = '<' + 'B3i' * min(CHUNK_ROWS, faceCount)
+    for start in xrange(0, faceCount, CHUNK_ROWS):
+        count = min(CHUNK_ROWS, faceCount - start)
+        flat = []
+        for i in xrange(start * 3, (start + count) * 3, 3):
+            flat.append(3)
+            flat.extend(indices[i:i+3])
+        if count != CHUNK_ROWS:
+            faceFormat = '<' + 'B3i' * count
+        fileHandle.write(struct.pack(faceFormat, *flat))
+
+
+def writePLY(fileName, indices, points, normals = None, uvs = None):
+    """
+    Write a triangle mesh as binary little-endian PLY. indices is a flat list of
+    3 per triangle, points/normals/uvs are per vertex rows or flat buffers
+    (numpy or array module arrays).
+    Returns the number of bytes written.
+    """
+
+    vertexCount = rowCount(points, 3)
+    faceCount = len(indices) / 3
+
+    columns = [points]
+    widths = [3]
+    if normals is not None:
+        columns.append(normals)
+        widths.append(3)
+    if uvs is not None:
+        columns.append(uvs)
+        widths.append(2)
+
+    fileHandle = open(fileName, 'wb')
+    try:
+        fileHandle.write(plyHeader(vertexCount, faceCount, normals is not None, uvs is not None))
+        if vertexCount:
+            if numpy is not None:
+                writeVerticesNumpy(fileHandle, [numpy.asarray(c, dtype=numpy.float32).reshape(-1, w) for c, w in zip(columns, widths)], vertexCount)
+            else:
+                writeVerticesStruct(fileHandle, columns, widths, vertexCount)
+        if faceCount:
+            writeFaces(fileHandle, indices, faceCount)
+        return fileHandle.tell()
+    finally:
+        fileHandle.close()
+
+
+def readPLY(fileName):
+    """
+    Read back a file written by writePLY. Returns a dict with the vertex
+    property names, the vertex rows and the face index triples.
+    """
+
+    fileHandle = open(fileName, 'rb')
+    try:
+        if fileHandle.readline().strip() != 'ply':
+            raise ValueError('%s is not a PLY file' % fileName)
+
+        elements = []
+        while True:
+            line = fileHandle.readline()
+            if not line:
+                raise ValueError('%s: unexpected end of header' % fileName)
+            words = line.split()
+            if not words or words[0] == 'comment':
+                continue
+            if words[0] == 'format' and words[1] != 'binary_little_endian':
+                raise ValueError('%s: unsupported format %s' % (fileName, words[1]))
+            if words[0] == 'element':
+                elements.append( (words[1], int(words[2]), []) )
+            elif words[0] == 'property':
+                elements[-1][2].append(words[-1])
+            elif words[0] == 'end_header':
+                break
+
+        result = {'properties': [], 'vertices': [], 'faces': []}
+        for name, count, properties in elements:
+            if name == 'vertex':
+                result['properties'] = properties
+                rowSize = 4 * len(properties)
+                data = fileHandle.read(rowSize * count)
+                values = struct.unpack('<%if' % (len(properties) * count), data)
+                width = len(properties)
+                result['vertices'] = [values[i:i+width] for i in xrange(0, len(values), width)]
+            elif name == 'face':
+                for i in xrange(count):
+                    n = struct.unpack('<B', fileHandle.read(1))[0]
+                    result['faces'].append(struct.unpack('<%ii' % n, fileHandle.read(4 * n)))
+        return result
+    finally:
+        fileHandle.close()
+
+
+def checkPLY(fileName, vertexCount, faceCount, hasNormals, hasUVs):
+    """
+    Round-trip check of a written file: vertex, normal, uv and face counts.
+    Returns an empty string if the file matches, or what is wrong with it.
+    """
+
+    ply = readPLY(fileName)
+    if len(ply['vertices']) != vertexCount:
+        return 'vertex count %i, expected %i' % (len(ply['vertices']), vertexCount)
+    if len(ply['faces']) != faceCount:
+        return 'face count %i, expected %i' % (len(ply['faces']), faceCount)
+    properties = ply['properties']
+    if ('nx' in properties) != hasNormals:
+        return 'normals %s, expected %s' % ('nx' in properties, hasNormals)
+    if ('u' in properties) != hasUVs:
+        return 'uvs %s, expected %s' % ('u' in properties, hasUVs)
+    return ''
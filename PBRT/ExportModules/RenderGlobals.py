@@ -17,6 +17,7 @@
 # import ExportModule
 # reload(ExportModule)
 from ExportModule import ExportModule
+from NumberFormat import formatFloats
 
 from maya import cmds
 
@@ -39,7 +40,7 @@ class RenderGlobals(ExportModule):
         self.addToOutput( '\t"bool %s" ["%s"]' % (attribute, str(cmds.getAttr( 'pbrt_settings.'+prefix+attribute)).lower() ) )
 
     def outputFloat(self,attribute,prefix=''):
-        self.addToOutput( '\t"float %s" [%f]' % (attribute, cmds.getAttr( 'pbrt_settings.'+ prefix+attribute)  ))
+        self.addToOutput( formatFloats( '\t"float %s" [%f]', (attribute, cmds.getAttr( 'pbrt_settings.'+ prefix+attribute) ) ) )
 
     def outputInt(self,attribute,prefix=''):
         self.addToOutput( '\t"integer %s" [%d]' % (attribute, cmds.getAttr( 'pbrt_settings.'+ prefix+attribute) ) )
@@ -123,18 +124,18 @@ class RenderGlobals(ExportModule):
         pixel_filter_tau    = cmds.getAttr( 'pbrt_settings.pixel_filter_tau' )
         
         self.addToOutput( 'PixelFilter "%s"' % pixel_filter )
-        self.addToOutput( '\t"float xwidth" [%f]' % pixel_filter_xwidth )
-        self.addToOutput( '\t"float ywidth" [%f]' % pixel_filter_ywidth )
+        self.addToOutput( formatFloats( '\t"float xwidth" [%f]', (pixel_filter_xwidth,) ) )
+        self.addToOutput( formatFloats( '\t"float ywidth" [%f]', (pixel_filter_ywidth,) ) )
         
         if pixel_filter == "mitchell":
-            self.addToOutput( '\t"float B" [%f]' % pixel_filter_b )
-            self.addToOutput( '\t"float C" [%f]' % pixel_filter_c )
+            self.addToOutput( formatFloats( '\t"float B" [%f]', (pixel_filter_b,) ) )
+            self.addToOutput( formatFloats( '\t"float C" [%f]', (pixel_filter_c,) ) )
         
         if pixel_filter == "gaussian":
-            self.addToOutput( '\t"float alpha" [%f]' % pixel_filter_alpha )
+            self.addToOutput( formatFloats( '\t"float alpha" [%f]', (pixel_filter_alpha,) ) )
             
         if pixel_filter == "sinc":
-            self.addToOutput( '\t"float tau" [%f]' % pixel_filter_tau )
+            self.addToOutput( formatFloats( '\t"float tau" [%f]', (pixel_filter_tau,) ) )
             
         self.addToOutput( '' )      
         
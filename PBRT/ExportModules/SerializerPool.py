@@ -0,0 +1,156 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Worker processes for the text formatting of geometry blocks. The Maya API
+# calls and the mesh compile stay on the main thread; MeshOpt hands the
+# compiled arrays to OrderedOutput.writeParts, a worker turns them into pbrt
+# text, and OrderedOutput writes the results to the file in submission order,
+# so the output is the same as a serial export. Does not import maya: the
+# workers import this module, ArrayWriter and NumberFormat only.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import sys
+import cStringIO
+import multiprocessing
+
+from ArrayWriter import ArrayWriter
+
+
+def formatParts(parts):
+    """
+    Format a block: parts is a list of text lines and (values, columns,
+    valueFormat) arrays, as given to ExportModule.addPartsToOutput.
+    Runs in the workers.
+    """
+
+    buf = cStringIO.StringIO()
+    writer = ArrayWriter()
+    for part in parts:
+        if isinstance(part, str):
+            buf.write( part + os.linesep )
+        else:
+            writer.write( buf, *part )
+    return buf.getvalue()
+
+
+def mayaPyExecutable():
+    """
+    Inside Maya sys.executable is maya(.exe), workers have to be started with
+    mayapy instead. None if not running in Maya.
+    """
+
+    executableDir, executableName = os.path.split( sys.executable )
+    if not executableName.lower().startswith( 'maya' ) or executableName.lower().startswith( 'mayapy' ):
+        return None
+    mayaPy = os.path.join( executableDir, 'mayapy' )
+    if os.name == 'nt':
+        mayaPy += '.exe'
+    if os.path.exists( mayaPy ):
+        return mayaPy
+    return None
+
+
+class SerializerPool:
+    """
+    A multiprocessing pool of formatting workers, one per export.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        mayaPy = mayaPyExecutable()
+        if mayaPy is not None:
+            multiprocessing.set_executable( mayaPy )
+        self.pool = multiprocessing.Pool( workers )
+
+    def submit(self, parts):
+        return self.pool.apply_async( formatParts, (parts,) )
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class OrderedOutput:
+    """
+    File-like wrapper of an output file. Blocks given to writeParts are
+    formatted by the pool, everything is written to the file in the order it
+    was given. At most maxPending blocks are in flight, writeParts waits for
+    the oldest one beyond that.
+    """
+
+    def __init__(self, fileHandle, pool, maxPending = None):
+        self.fileHandle = fileHandle
+        self.name = getattr( fileHandle, 'name', '' )
+        self.pool = pool
+        self.maxPending = maxPending or 2 * pool.workers
+        # text strings and AsyncResults, in file order
+        self.queue = []
+        self.pending = 0
+
+    def write(self, string):
+        if self.queue:
+            self.queue.append( string )
+        else:
+            self.fileHandle.write( string )
+
+    def writeParts(self, parts):
+        """
+        Queue a block for the workers. Returns its AsyncResult, for writers
+        that keep a copy of the text (GeometryCache.CacheWriter).
+        """
+        result = self.pool.submit(parts)
+        self.queue.append( result )
+        self.pending += 1
+        while self.pending > self.maxPending:
+            self.drain( True )
+        return result
+
+    def drain(self, wait = False):
+        """
+        Write out the head of the queue up to the first unfinished block, or
+        up to and including it if wait is set.
+        """
+
+        while self.queue:
+            item = self.queue[0]
+            if not isinstance( item, str ):
+                if not item.ready() and not wait:
+                    return
+                self.fileHandle.write( item.get() )
+                self.pending -= 1
+                wait = False
+            else:
+                self.fileHandle.write( item )
+            self.queue.pop( 0 )
+
+    def flush(self):
+        self.drain()
+        self.fileHandle.flush()
+
+    def finish(self):
+        """
+        Wait for all the blocks and write them out.
+        """
+        while self.queue:
+            self.drain( True )
+        self.fileHandle.flush()
+
+    def tell(self):
+        return self.fileHandle.tell()
+
+    def close(self):
+        self.finish()
+        self.fileHandle.close()
@@ -0,0 +1,230 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Sharded geometry output. Instead of one .geo.pbrt file, every shape (or every
+# bucket of N shapes) goes to its own file in <name>.geo.shards/ and the
+# .geo.pbrt file becomes an index of Include lines. A manifest keeps the hash,
+# size and mtime of every shard; a shard whose content did not change since the
+# last export is left untouched on disk. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+import os
+import hashlib
+
+MANIFEST_NAME = 'manifest.txt'
+
+
+def shardDirectory(indexFileName):
+    baseName = indexFileName
+    if baseName.endswith('.gz'):
+        baseName = baseName[:-3]
+    return os.path.splitext(baseName)[0] + '.shards'
+
+
+def shapeFileName(shapePath):
+    return shapePath.strip('|').replace('|', '_').replace(':', '_')
+
+
+class ShardFile:
+    """
+    Innermost file of a shard: hashes what is written to the real file.
+    """
+
+    def __init__(self, fileHandle):
+        self.fileHandle = fileHandle
+        self.name = getattr(fileHandle, 'name', '')
+        self.hash = hashlib.md5()
+        self.bytesWritten = 0
+
+    def write(self, string):
+        self.hash.update(string)
+        self.bytesWritten += len(string)
+        self.fileHandle.write(string)
+
+    def flush(self):
+        self.fileHandle.flush()
+
+    def tell(self):
+        return self.fileHandle.tell()
+
+    def close(self):
+        self.fileHandle.close()
+
+
+class ShardedOutput:
+    """
+    File-like object given to MeshOpt in place of the geometry file. MeshOpt
+    calls beginShape() before every shape. openFile(fileName) opens a shard
+    file for writing (plain or GzipWriter), wrapFile(fileHandle) may wrap it
+    (SerializerPool.OrderedOutput).
+    """
+
+    def __init__(self, indexFileName, shapesPerShard, openFile, wrapFile = None, extension = '.pbrt'):
+        self.name = indexFileName
+        self.indexFileName = indexFileName
+        self.shapesPerShard = max(1, shapesPerShard)
+        self.openFile = openFile
+        self.wrapFile = wrapFile
+        self.extension = extension
+
+        self.shardDir = shardDirectory(indexFileName)
+        if not os.path.isdir(self.shardDir):
+            os.makedirs(self.shardDir)
+        self.oldManifest = self.readManifest()
+        self.manifest = {}
+
+        self.shardNames = []
+        self.shapeCount = 0
+        self.shardFile = None
+        self.shardHandle = None
+        # bytes in the closed shards
+        self.closedBytes = 0
+
+        self.shardsWritten = 0
+        self.shardsUnchanged = 0
+
+    def readManifest(self):
+        """
+        shard name -> (md5, size, mtime) of the last export
+        """
+
+        manifest = {}
+        try:
+            manifestFile = open(os.path.join(self.shardDir, MANIFEST_NAME), 'r')
+        except IOError:
+            return manifest
+        for line in manifestFile:
+            words = line.split()
+            if len(words) == 4:
+                manifest[words[0]] = (words[1], int(words[2]), float(words[3]))
+        manifestFile.close()
+        return manifest
+
+    def writeManifest(self):
+        manifestFile = open(os.path.join(self.shardDir, MANIFEST_NAME), 'w')
+        for shardName in self.shardNames:
+            digest, size, mtime = self.manifest[shardName]
+            manifestFile.write('%s %s %i %r\n' % (shardName, digest, size, mtime))
+        manifestFile.close()
+
+    def shardPath(self, shardName):
+        return os.path.join(self.shardDir, shardName)
+
+    def beginShape(self, shapePath):
+        """
+        Start a new shard every shapesPerShard shapes. Shards of single shapes are
+        named after the shape, so that they keep their name when shapes are
+        added or removed.
+        """
+
+        if self.shardHandle is None or self.shapeCount % self.shapesPerShard == 0:
+            if self.shapesPerShard == 1:
+                shardName = shapeFileName(shapePath) + self.extension
+                if shardName in self.shardNames:
+                    shardName = '%s_%i%s' % (shapeFileName(shapePath), len(self.shardNames), self.extension)
+            else:
+                shardName = 'shard_%05i%s' % (len(self.shardNames), self.extension)
+            self.openShard(shardName)
+        self.shapeCount += 1
+
+    def openShard(self, shardName):
+        self.closeShard()
+        self.shardNames.append(shardName)
+        self.shardFile = ShardFile(self.openFile(self.shardPath(shardName) + '.tmp'))
+        self.shardHandle = self.shardFile
+        if self.wrapFile is not None:
+            self.shardHandle = self.wrapFile(self.shardFile)
+
+    def closeShard(self):
+        """
+        Keep the old shard file if its content is the same and nobody touched
+        it since the last export, otherwise replace it.
+        """
+
+        if self.shardHandle is None:
+            return
+
+        self.shardHandle.close()
+        self.closedBytes += self.shardFile.bytesWritten
+        shardName = self.shardNames[-1]
+        shardPath = self.shardPath(shardName)
+        tempPath = shardPath + '.tmp'
+        digest = self.shardFile.hash.hexdigest()
+        self.shardHandle = None
+        self.shardFile = None
+
+        old = self.oldManifest.get(shardName)
+        if old is not None and old[0] == digest and os.path.exists(shardPath):
+            stat = os.stat(shardPath)
+            if stat.st_size == old[1] and repr(stat.st_mtime) == repr(old[2]):
+                os.remove(tempPath)
+                self.manifest[shardName] = old
+                self.shardsUnchanged += 1
+                return
+
+        if os.path.exists(shardPath):
+            os.remove(shardPath)
+        os.rename(tempPath, shardPath)
+        stat = os.stat(shardPath)
+        self.manifest[shardName] = (digest, stat.st_size, stat.st_mtime)
+        self.shardsWritten += 1
+
+    def currentHandle(self):
+        if self.shardHandle is None:
+            # output before the first shape
+            self.openShard('shard_header%s' % self.extension)
+        return self.shardHandle
+
+    def write(self, string):
+        self.currentHandle().write(string)
+
+    def writeParts(self, parts):
+        handle = self.currentHandle()
+        if hasattr(handle, 'writeParts'):
+            return handle.writeParts(parts)
+        from SerializerPool import formatParts
+        text = formatParts(parts)
+        self.write(text)
+        return text
+
+    def flush(self):
+        if self.shardHandle is not None:
+            self.shardHandle.flush()
+
+    def tell(self):
+        if self.shardHandle is None:
+            return self.closedBytes
+        return self.closedBytes + self.shardHandle.tell()
+
+    def close(self):
+        """
+        Close the last shard, remove the shards of the last export that are no
+        longer used, and write the index.
+        """
+
+        self.closeShard()
+
+        for shardName in self.oldManifest:
+            if shardName not in self.manifest and os.path.exists(self.shardPath(shardName)):
+                os.remove(self.shardPath(shardName))
+        self.writeManifest()
+
+        lines = ['# %i shards in %s' % (len(self.shardNames), self.shardDir)]
+        for shardName in self.shardNames:
+            lines.append('Include "%s"' % self.shardPath(shardName).replace(os.sep, '/'))
+        index = os.linesep.join(lines) + os.linesep
+
+        indexHandle = self.openFile(self.indexFileName)
+        indexHandle.write(index)
+        indexHandle.close()
+
+    def summary(self):
+        return 'Geometry shards: %i written, %i unchanged' % (self.shardsWritten, self.shardsUnchanged)
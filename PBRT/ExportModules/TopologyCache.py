@@ -0,0 +1,114 @@
+# ------------------------------------------------------------------------------
+# PBRT exporter - python  plugin for Maya 2013
+#
+# This file is licensed under the GPL (the original exporter uses that license)
+# http://www.gnu.org/licenses/gpl-3.0.txt
+#
+# $Id$
+#
+# ------------------------------------------------------------------------------
+#
+# Triangulation cache of a frame range export. A deforming mesh keeps its
+# faces, triangulation, normal and uv ids from frame to frame, only its points
+# and normals move. MeshOpt compiles a set once, keeps the index buffer and
+# the (point, normal, uv) ids every output vertex was made from, keyed on a
+# hash of that topology, and on the next frames only gathers the new point
+# and normal values through those ids. Does not import maya.
+#
+# ------------------------------------------------------------------------------
+
+# entries are no longer added above this size
+MAX_BYTES = 512 * 1048576
+
+
+def idBytes(values):
+    if values is None:
+        return 0
+    if hasattr(values, 'nbytes'):
+        return values.nbytes
+    return values.itemsize * len(values)
+
+
+class TopologyEntry:
+    """
+    A compiled set without its vertex values: flat index buffer, and per
+    output vertex the point, normal and uv id it takes its values from
+    (numpy or array module int arrays, uvIds None without uvs).
+    """
+
+    def __init__(self, indices, pointIds, normalIds, uvIds = None):
+        self.indices = indices
+        self.pointIds = pointIds
+        self.normalIds = normalIds
+        self.uvIds = uvIds
+
+    def nbytes(self):
+        return idBytes(self.indices) + idBytes(self.pointIds) + idBytes(self.normalIds) + idBytes(self.uvIds)
+
+
+class TopologyCache:
+    """
+    Topology key -> TopologyEntry, kept for a whole frame range. Meshes with
+    the same topology share their entry. beginFrame() is called by the
+    Exporter before every frame; when the cache is full, the entries no mesh
+    of the current frame used are dropped first.
+    """
+
+    def __init__(self, maxBytes = MAX_BYTES):
+        self.maxBytes = maxBytes
+        self.entries = {}
+        # key -> last frame the entry was used in
+        self.lastUsed = {}
+        self.totalBytes = 0
+        self.frame = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.frameHits = 0
+        self.frameMisses = 0
+
+    def beginFrame(self):
+        self.frame += 1
+        self.frameHits = 0
+        self.frameMisses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            self.frameMisses += 1
+            return None
+        self.lastUsed[key] = self.frame
+        self.hits += 1
+        self.frameHits += 1
+        return entry
+
+    def put(self, key, entry):
+        if key in self.entries:
+            return
+        size = entry.nbytes()
+        if self.totalBytes + size > self.maxBytes:
+            self.evict(size)
+        if self.totalBytes + size > self.maxBytes:
+            return
+        self.entries[key] = entry
+        self.lastUsed[key] = self.frame
+        self.totalBytes += size
+
+    def evict(self, size):
+        """
+        Drop the entries of earlier frames, least recently used first, until
+        size more bytes fit.
+        """
+
+        old = [(frame, key) for key, frame in self.lastUsed.iteritems() if frame < self.frame]
+        old.sort()
+        for frame, key in old:
+            if self.totalBytes + size <= self.maxBytes:
+                break
+            self.totalBytes -= self.entries.pop(key).nbytes()
+            del self.lastUsed[key]
+
+    def summary(self):
+        return 'Topology cache: %i hits, %i misses this frame, %i entries (%.1f MB)' % (
+            self.frameHits, self.frameMisses, len(self.entries), self.totalBytes / 1048576.0)